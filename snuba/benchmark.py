@@ -0,0 +1,510 @@
+"""
+Offline benchmarks of the ingestion path of every writable storage.
+
+Synthetic payloads are generated for each storage (from a seeded random
+number generator, so that the same payloads are generated on every run)
+and are decoded, processed and encoded by each of the insert formats exactly
+as the consumer would, except that the encoded rows are discarded by a
+``NullBatchWriter`` rather than sent to ClickHouse. This allows the suite to
+run without Kafka or ClickHouse, and the results can be compared between
+releases to catch regressions.
+"""
+
+import logging
+import random
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+import simplejson as json
+
+from snuba import settings
+from snuba.clickhouse.rowbinary import RowBinaryEncoder, UnsupportedColumnType
+from snuba.consumer import KafkaMessageMetadata
+from snuba.consumers.decoders import get_payload_decoder
+from snuba.datasets.storages.factory import get_writable_storage
+from snuba.datasets.table_storage import build_json_row_encoder
+from snuba.processor import ProcessorAction
+from snuba.util import settings_override
+from snuba.writer import NullBatchWriter, WriterTableRow
+
+logger = logging.getLogger("snuba.benchmark")
+
+T = TypeVar("T")
+
+# Payloads are generated relative to a fixed time (rather than the current
+# time) so that they are the same on every run.
+BASE_TIME = datetime(2020, 1, 1)
+
+PLATFORMS = ["python", "javascript", "java", "cocoa", "node"]
+ENVIRONMENTS = ["production", "staging", "development"]
+MODULES = ["django", "requests", "urllib3", "simplejson", "redis", "celery"]
+
+
+def _hex(rng: random.Random, length: int) -> str:
+    return "%0*x" % (length, rng.getrandbits(length * 4))
+
+
+def _timestamp(rng: random.Random, index: int) -> datetime:
+    return BASE_TIME + timedelta(seconds=index, microseconds=rng.randrange(10 ** 6))
+
+
+def _tags(rng: random.Random, count: int) -> Sequence[Tuple[str, str]]:
+    return [
+        ("environment", rng.choice(ENVIRONMENTS)),
+        ("sentry:release", f"release-{rng.randrange(100)}"),
+        ("sentry:user", f"id:{rng.randrange(10000)}"),
+        *[(f"tag-{i}", f"value-{rng.randrange(1000)}") for i in range(count)],
+    ]
+
+
+def _user(rng: random.Random) -> Mapping[str, Any]:
+    user_id = rng.randrange(10000)
+    return {
+        "id": str(user_id),
+        "username": f"user-{user_id}",
+        "email": f"user-{user_id}@example.com",
+        "ip_address": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+        "geo": {"country_code": "US", "region": "CA", "city": "San Francisco"},
+    }
+
+
+def _frame(rng: random.Random) -> Mapping[str, Any]:
+    module = rng.choice(MODULES)
+    return {
+        "abs_path": f"/usr/lib/python3.7/site-packages/{module}/core.py",
+        "filename": f"{module}/core.py",
+        "module": f"{module}.core",
+        "function": f"function_{rng.randrange(100)}",
+        "in_app": rng.random() < 0.3,
+        "lineno": rng.randrange(1, 1000),
+        "colno": rng.randrange(1, 80),
+    }
+
+
+def _contexts(rng: random.Random) -> Mapping[str, Any]:
+    return {
+        "os": {"name": "Linux", "version": f"4.{rng.randrange(20)}", "type": "os"},
+        "runtime": {"name": "CPython", "version": "3.7.7", "type": "runtime"},
+        "device": {"model": f"device-{rng.randrange(50)}", "type": "device"},
+    }
+
+
+def generate_event(rng: random.Random, index: int) -> Any:
+    """
+    Generates an event as it is produced to the events topic by Sentry, which
+    is consumed by both the events and the errors storages.
+    """
+    event_id = _hex(rng, 32)
+    timestamp = _timestamp(rng, index)
+    platform = rng.choice(PLATFORMS)
+    stacks = [
+        {
+            "type": "ValueError",
+            "value": f"invalid value {rng.randrange(1000)}",
+            "mechanism": {"type": "generic", "handled": rng.random() < 0.5},
+            "stacktrace": {
+                "frames": [_frame(rng) for _ in range(rng.randrange(5, 30))]
+            },
+        }
+        for _ in range(rng.randrange(1, 3))
+    ]
+    return (
+        2,
+        "insert",
+        {
+            "event_id": event_id,
+            "group_id": rng.randrange(1, 10 ** 6),
+            "organization_id": rng.randrange(1, 100),
+            "project_id": rng.randrange(1, 1000),
+            "platform": platform,
+            "message": f"ValueError: invalid value {rng.randrange(1000)}",
+            "datetime": timestamp.strftime(settings.PAYLOAD_DATETIME_FORMAT),
+            "primary_hash": _hex(rng, 32),
+            "retention_days": 90,
+            "data": {
+                "event_id": event_id,
+                "platform": platform,
+                "received": (timestamp - BASE_TIME).total_seconds()
+                + BASE_TIME.timestamp(),
+                "type": "error",
+                "culprit": f"app.views in handler_{rng.randrange(100)}",
+                "title": "ValueError: invalid value",
+                "location": "app/views.py",
+                "version": "7",
+                "tags": _tags(rng, rng.randrange(5, 20)),
+                "contexts": _contexts(rng),
+                "user": _user(rng),
+                "request": {
+                    "url": f"https://example.com/api/{rng.randrange(100)}/",
+                    "method": "GET",
+                    "headers": [["Referer", "https://example.com/"]],
+                },
+                "sdk": {
+                    "name": "sentry.python",
+                    "version": "0.14.0",
+                    "integrations": ["django", "logging", "stdlib"],
+                },
+                "modules": {module: "1.0.0" for module in MODULES},
+                "exception": {"values": stacks},
+            },
+        },
+    )
+
+
+def generate_transaction(rng: random.Random, index: int) -> Any:
+    event_id = _hex(rng, 32)
+    start = _timestamp(rng, index)
+    finish = start + timedelta(milliseconds=rng.randrange(1, 5000))
+    return (
+        2,
+        "insert",
+        {
+            "event_id": event_id,
+            "organization_id": rng.randrange(1, 100),
+            "project_id": rng.randrange(1, 1000),
+            "platform": rng.choice(PLATFORMS),
+            "message": "/api/0/organizations/",
+            "datetime": finish.strftime(settings.PAYLOAD_DATETIME_FORMAT),
+            "group_id": None,
+            "retention_days": 90,
+            "data": {
+                "event_id": event_id,
+                "type": "transaction",
+                "transaction": f"/api/0/organizations/{rng.randrange(100)}/",
+                "start_timestamp": start.timestamp(),
+                "timestamp": finish.timestamp(),
+                "tags": _tags(rng, rng.randrange(5, 20)),
+                "contexts": {
+                    **_contexts(rng),
+                    "trace": {
+                        "trace_id": _hex(rng, 32),
+                        "span_id": _hex(rng, 16),
+                        "op": "http.server",
+                        "status": "ok",
+                    },
+                },
+                "user": _user(rng),
+                "sdk": {"name": "sentry.python", "version": "0.14.0"},
+            },
+        },
+    )
+
+
+def generate_outcome(rng: random.Random, index: int) -> Any:
+    return {
+        "org_id": rng.randrange(1, 100),
+        "project_id": rng.randrange(1, 1000),
+        "key_id": rng.randrange(1, 1000),
+        "timestamp": _timestamp(rng, index).strftime(settings.PAYLOAD_DATETIME_FORMAT),
+        "outcome": rng.randrange(4),
+        "reason": rng.choice([None, "project_id", "rate_limited"]),
+        "event_id": _hex(rng, 32),
+    }
+
+
+def generate_session(rng: random.Random, index: int) -> Any:
+    started = _timestamp(rng, index)
+    return {
+        "session_id": str(uuid.UUID(_hex(rng, 32))),
+        "distinct_id": str(uuid.UUID(_hex(rng, 32))),
+        "seq": rng.randrange(100),
+        "org_id": rng.randrange(1, 100),
+        "project_id": rng.randrange(1, 1000),
+        "retention_days": 90,
+        "duration": rng.random() * 3600,
+        "status": rng.choice(["ok", "exited", "crashed", "abnormal"]),
+        "errors": rng.randrange(3),
+        "started": started.timestamp(),
+        "received": (started + timedelta(seconds=rng.randrange(60))).timestamp(),
+        "release": f"release-{rng.randrange(100)}",
+        "environment": rng.choice(ENVIRONMENTS),
+    }
+
+
+def generate_querylog(rng: random.Random, index: int) -> Any:
+    project = rng.randrange(1, 1000)
+    return {
+        "request": {
+            "id": _hex(rng, 32),
+            "body": {
+                "selected_columns": ["event_id", "timestamp"],
+                "conditions": [["type", "=", "error"]],
+                "project": [project],
+                "limit": 100,
+            },
+            "referrer": rng.choice(["search", "api.discover", "tagstore"]),
+        },
+        "dataset": "events",
+        "timing": {
+            "timestamp": int(_timestamp(rng, index).timestamp()),
+            "duration_ms": rng.randrange(1000),
+        },
+        "status": "success",
+        "query_list": [
+            {
+                "sql": f"SELECT event_id, timestamp FROM errors_local PREWHERE project_id IN ({project}) LIMIT 100",
+                "status": "success",
+                "trace_id": _hex(rng, 32),
+                "stats": {
+                    "final": False,
+                    "cache_hit": rng.random() < 0.5,
+                    "sample": None,
+                    "max_threads": 10,
+                    "num_days": rng.randrange(90),
+                    "clickhouse_table": "errors_local",
+                    "query_id": _hex(rng, 32),
+                    "is_duplicate": False,
+                    "consistent": False,
+                },
+            }
+            for _ in range(rng.randrange(1, 3))
+        ],
+    }
+
+
+def generate_groupedmessage(rng: random.Random, index: int) -> Any:
+    def postgres_timestamp() -> str:
+        return _timestamp(rng, index).strftime("%Y-%m-%d %H:%M:%S+00")
+
+    return {
+        "event": "change",
+        "xid": 2380000 + index,
+        "kind": "insert",
+        "schema": "public",
+        "table": "sentry_groupedmessage",
+        "columnnames": [
+            "id",
+            "logger",
+            "level",
+            "message",
+            "status",
+            "times_seen",
+            "last_seen",
+            "first_seen",
+            "project_id",
+            "active_at",
+            "platform",
+            "first_release_id",
+        ],
+        "columnvalues": [
+            index + 1,
+            "",
+            40,
+            "ValueError invalid value app/views.py",
+            rng.randrange(3),
+            rng.randrange(1, 1000),
+            postgres_timestamp(),
+            postgres_timestamp(),
+            rng.randrange(1, 1000),
+            postgres_timestamp(),
+            rng.choice(PLATFORMS),
+            None,
+        ],
+    }
+
+
+# Maps each writable storage that is benchmarked to the function that
+# generates the payload of a message consumed by that storage.
+PAYLOAD_GENERATORS: Mapping[str, Callable[[random.Random, int], Any]] = {
+    "events": generate_event,
+    "errors": generate_event,
+    "transactions": generate_transaction,
+    "outcomes_raw": generate_outcome,
+    "sessions_raw": generate_session,
+    "querylog": generate_querylog,
+    "groupedmessages": generate_groupedmessage,
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    storage: str
+    # The step of the ingestion path that was measured (decode, process or
+    # write), and the decoder, processor or insert format that was used.
+    phase: str
+    variant: str
+    messages: int
+    rows: int
+    # The best CPU time of all of the repetitions.
+    cpu_time_ms: float
+    # The peak memory allocated during the step, if allocations were traced.
+    peak_memory_bytes: Optional[int]
+    # The size of the encoded rows, only for the write step.
+    bytes: Optional[int] = None
+
+    @property
+    def cpu_time_per_message_us(self) -> float:
+        return self.cpu_time_ms * 1000 / self.messages
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {
+            "storage": self.storage,
+            "phase": self.phase,
+            "variant": self.variant,
+            "messages": self.messages,
+            "rows": self.rows,
+            "cpu_time_ms": self.cpu_time_ms,
+            "cpu_time_per_message_us": self.cpu_time_per_message_us,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "bytes": self.bytes,
+        }
+
+
+def measure(
+    function: Callable[[Any], T],
+    repeat: int,
+    setup: Callable[[], Any] = lambda: None,
+    trace_allocations: bool = False,
+) -> Tuple[T, float, Optional[int]]:
+    """
+    Calls the function (with the result of calling ``setup``, which is not
+    measured) ``repeat`` times, returning the result of the last call, the
+    best CPU time in milliseconds, and the peak memory allocated by a
+    separate (untimed, since tracing allocations slows it down) call.
+    """
+    assert repeat > 0
+
+    best = float("inf")
+    for _ in range(repeat):
+        argument = setup()
+        start = time.process_time()
+        result = function(argument)
+        best = min(best, time.process_time() - start)
+
+    peak_memory = None
+    if trace_allocations:
+        argument = setup()
+        tracemalloc.start()
+        try:
+            function(argument)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result, best * 1000, peak_memory
+
+
+def run_storage_benchmark(
+    storage_name: str,
+    messages: int = 1000,
+    repeat: int = 3,
+    seed: int = 0,
+    trace_allocations: bool = True,
+) -> Sequence[BenchmarkResult]:
+    """
+    Measures decoding, processing and encoding (for each insert format that
+    the storage supports) the generated messages for a storage.
+    """
+    storage = get_writable_storage(storage_name)
+    table_writer = storage.get_table_writer()
+    stream_loader = table_writer.get_stream_loader()
+    processor = stream_loader.get_processor()
+
+    rng = random.Random(seed)
+    generate = PAYLOAD_GENERATORS[storage_name]
+    payloads = [
+        json.dumps(generate(rng, index)).encode("utf-8") for index in range(messages)
+    ]
+
+    results: MutableSequence[BenchmarkResult] = []
+
+    decoder_name = stream_loader.get_payload_decoder()
+    decode = get_payload_decoder(decoder_name)
+
+    def decode_payloads(_: Any) -> Sequence[Any]:
+        return [decode(payload) for payload in payloads]
+
+    values, cpu_time, peak_memory = measure(
+        decode_payloads, repeat, trace_allocations=trace_allocations
+    )
+    results.append(
+        BenchmarkResult(
+            storage_name,
+            "decode",
+            decoder_name,
+            messages,
+            0,
+            cpu_time,
+            peak_memory,
+            bytes=sum(len(payload) for payload in payloads),
+        )
+    )
+
+    def process_values(values: Sequence[Any]) -> Sequence[WriterTableRow]:
+        rows: MutableSequence[WriterTableRow] = []
+        for offset, value in enumerate(values):
+            result = processor.process_message(
+                value, KafkaMessageMetadata(offset=offset, partition=0)
+            )
+            if result is not None and result.action is ProcessorAction.INSERT:
+                rows.extend(result.data)
+        return rows
+
+    # Processors may modify the values they are processing, so every call
+    # processes a newly decoded copy of them.
+    with settings_override({"DISCARD_OLD_EVENTS": False}):
+        rows, cpu_time, peak_memory = measure(
+            process_values,
+            repeat,
+            setup=lambda: decode_payloads(None),
+            trace_allocations=trace_allocations,
+        )
+    results.append(
+        BenchmarkResult(
+            storage_name,
+            "process",
+            type(processor).__name__,
+            messages,
+            len(rows),
+            cpu_time,
+            peak_memory,
+        )
+    )
+
+    encoders: MutableSequence[Tuple[str, Callable[[WriterTableRow], bytes]]] = [
+        ("JSONEachRow", build_json_row_encoder()),
+    ]
+    try:
+        encoders.append(
+            ("RowBinary", RowBinaryEncoder(table_writer.get_schema().get_columns()))
+        )
+    except UnsupportedColumnType as error:
+        logger.info("Skipping RowBinary for %s: %s", storage_name, error)
+
+    for format, encoder in encoders:
+
+        def write_rows(_: Any) -> NullBatchWriter:
+            writer = NullBatchWriter(encoder)
+            writer.write(rows)
+            return writer
+
+        writer, cpu_time, peak_memory = measure(
+            write_rows, repeat, trace_allocations=trace_allocations
+        )
+        results.append(
+            BenchmarkResult(
+                storage_name,
+                "write",
+                format,
+                messages,
+                writer.rows,
+                cpu_time,
+                peak_memory,
+                bytes=writer.bytes,
+            )
+        )
+
+    return results
@@ -0,0 +1,84 @@
+"""\
+Snuba "benchmark" measures the ingestion path of the writable storages
+without Kafka or ClickHouse, using synthetic messages.
+
+snuba benchmark --storage events --messages 1000 --output results.jsonl
+
+Each result is written as a line of JSON to the output, so the results of
+different releases can be compared to track regressions.
+"""
+
+from typing import Optional, Sequence, TextIO
+
+import click
+import simplejson as json
+
+from snuba.environment import setup_logging
+
+
+@click.command()
+@click.option(
+    "--storage",
+    "storage_names",
+    multiple=True,
+    help="The storage to benchmark (defaults to all of the storages.)",
+)
+@click.option(
+    "--messages",
+    type=int,
+    default=1000,
+    help="Number of messages to generate for each storage.",
+)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    help="Number of times each step is repeated (the best time is reported.)",
+)
+@click.option("--seed", type=int, default=0, help="Seed used to generate the messages.")
+@click.option(
+    "--trace-allocations/--no-trace-allocations",
+    default=True,
+    help="Whether or not to measure the peak memory allocated by each step.",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the results to (defaults to stdout.)",
+)
+@click.option("--log-level", help="Logging level to use.")
+def benchmark(
+    *,
+    storage_names: Sequence[str],
+    messages: int,
+    repeat: int,
+    seed: int,
+    trace_allocations: bool,
+    output: TextIO,
+    log_level: Optional[str] = None,
+) -> None:
+    from snuba.benchmark import PAYLOAD_GENERATORS, logger, run_storage_benchmark
+
+    setup_logging(log_level)
+
+    for storage_name in storage_names:
+        if storage_name not in PAYLOAD_GENERATORS:
+            raise click.ClickException(f"Storage {storage_name} cannot be benchmarked")
+
+    for storage_name in storage_names or PAYLOAD_GENERATORS.keys():
+        for result in run_storage_benchmark(
+            storage_name,
+            messages=messages,
+            repeat=repeat,
+            seed=seed,
+            trace_allocations=trace_allocations,
+        ):
+            logger.info(
+                "%s %s (%s): %.2fus/message",
+                result.storage,
+                result.phase,
+                result.variant,
+                result.cpu_time_per_message_us,
+            )
+            output.write(json.dumps(result.to_dict()) + "\n")
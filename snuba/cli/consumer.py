@@ -5,6 +5,7 @@ import click
 
 from snuba import settings
 from snuba.consumers.consumer_builder import ConsumerBuilder
+from snuba.consumers.decoders import PAYLOAD_DECODERS
 from snuba.datasets.factory import DATASET_NAMES, get_dataset
 from snuba.datasets.storages.factory import get_cdc_storage, WRITABLE_STORAGES
 from snuba.environment import setup_logging, setup_sentry
@@ -91,6 +92,28 @@ from snuba.stateful_consumer.consumer_state_machine import ConsumerStateMachine
     type=bool,
     help="Uses rapidjson to serialize messages",
 )
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of subprocesses to process messages in (defaults to processing them in the consumer process.)",
+)
+@click.option(
+    "--processing-chunk-size",
+    default=100,
+    type=int,
+    help="Number of messages sent to a subprocess to be processed at a time.",
+)
+@click.option(
+    "--max-in-flight-batches",
+    default=0,
+    type=int,
+    help="Number of batches that can be written in the background while the next batch is consumed (defaults to writing batches in the consumer loop.)",
+)
+@click.option(
+    "--payload-decoder",
+    type=click.Choice(sorted(PAYLOAD_DECODERS)),
+    help="Decoder used to parse the message payloads (defaults to the decoder configured for the storage.)",
+)
 def consumer(
     *,
     raw_events_topic: Optional[str],
@@ -109,6 +132,10 @@ def consumer(
     stateful_consumer: bool,
     rapidjson_deserialize: bool,
     rapidjson_serialize: bool,
+    processes: Optional[int],
+    processing_chunk_size: int,
+    max_in_flight_batches: int,
+    payload_decoder: Optional[str],
     log_level: Optional[str] = None,
 ) -> None:
 
@@ -147,6 +174,10 @@ def consumer(
         queued_min_messages=queued_min_messages,
         rapidjson_deserialize=rapidjson_deserialize,
         rapidjson_serialize=rapidjson_serialize,
+        processes=processes,
+        processing_chunk_size=processing_chunk_size,
+        max_in_flight_batches=max_in_flight_batches,
+        payload_decoder=payload_decoder,
     )
 
     if stateful_consumer:
@@ -45,6 +45,16 @@ from snuba.util import local_dataset_mode
     type=click.Choice(DATASET_NAMES),
     help="The dataset to consume/run replacements for (currently only events supported)",
 )
+@click.option(
+    "--compare-insert-formats/--no-compare-insert-formats",
+    default=False,
+    help="Compare the cost of encoding the processed events in each insert format instead of writing them.",
+)
+@click.option(
+    "--compare-payload-decoders/--no-compare-payload-decoders",
+    default=False,
+    help="Compare the cost of decoding the events with each payload decoder instead of writing them.",
+)
 @click.option("--log-level", help="Logging level to use.")
 def perf(
     *,
@@ -53,9 +63,16 @@ def perf(
     profile_process: bool,
     profile_write: bool,
     dataset_name: str,
+    compare_insert_formats: bool,
+    compare_payload_decoders: bool,
     log_level: Optional[str] = None,
 ) -> None:
-    from snuba.perf import run, logger
+    from snuba.perf import (
+        compare_insert_formats as compare,
+        compare_payload_decoders as compare_decoders,
+        run,
+        logger,
+    )
 
     setup_logging(log_level)
 
@@ -64,6 +81,14 @@ def perf(
         logger.error("The perf tool is only intended for local dataset environment.")
         sys.exit(1)
 
+    if compare_insert_formats:
+        compare(events_file, dataset, repeat=repeat)
+        return
+
+    if compare_payload_decoders:
+        compare_decoders(events_file, repeat=repeat)
+        return
+
     run(
         events_file,
         dataset,
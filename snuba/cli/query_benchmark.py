@@ -0,0 +1,86 @@
+"""\
+Snuba "query_benchmark" measures the query pipeline of the API without
+ClickHouse, by replaying recorded queries.
+
+snuba query_benchmark --repeat 10 --output results.jsonl
+
+The queries are read from the list of recent queries kept in Redis, or from
+a file of querylog records (one JSON object per line.) Each result is written
+as a line of JSON to the output, with the time spent in each stage of the
+pipeline.
+"""
+
+from typing import Any, Mapping, MutableMapping, Optional, Sequence, TextIO
+
+import click
+import simplejson as json
+
+from snuba.environment import setup_logging
+
+
+@click.command()
+@click.option(
+    "--queries",
+    "queries_file",
+    type=click.File("r"),
+    help="File of querylog records to replay (defaults to the recent queries.)",
+)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    help="Number of times each query is repeated (the best time is reported.)",
+)
+@click.option(
+    "--trace-allocations/--no-trace-allocations",
+    default=True,
+    help="Whether or not to measure the peak memory allocated by each query.",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the results to (defaults to stdout.)",
+)
+@click.option("--log-level", help="Logging level to use.")
+def query_benchmark(
+    *,
+    queries_file: Optional[TextIO],
+    repeat: int,
+    trace_allocations: bool,
+    output: TextIO,
+    log_level: Optional[str] = None,
+) -> None:
+    from snuba import state
+    from snuba.web.benchmark import RecordedQuery, logger, run_query_benchmark
+
+    setup_logging(log_level)
+
+    records: Sequence[Mapping[str, Any]]
+    if queries_file is not None:
+        records = [json.loads(line) for line in queries_file if line.strip()]
+    else:
+        records = state.get_queries()
+
+    if not records:
+        raise click.ClickException("There are no queries to replay")
+
+    stages: MutableMapping[str, float] = {}
+    for result in run_query_benchmark(
+        [RecordedQuery.from_querylog(record) for record in records],
+        repeat=repeat,
+        trace_allocations=trace_allocations,
+    ):
+        if result.error is not None:
+            logger.warning(
+                "%s query (%s) failed: %s",
+                result.dataset,
+                result.referrer,
+                result.error,
+            )
+        for stage, duration in result.stages_ms.items():
+            stages[stage] = stages.get(stage, 0.0) + duration
+        output.write(json.dumps(result.to_dict()) + "\n")
+
+    for stage, duration in sorted(stages.items(), key=lambda item: -item[1]):
+        logger.info("%s: %.2fms", stage, duration)
@@ -4,6 +4,7 @@ from typing import Optional, Sequence
 import click
 
 from snuba import environment, settings
+from snuba.consumers.decoders import PAYLOAD_DECODERS
 from snuba.datasets.factory import get_dataset
 from snuba.datasets.storages.factory import get_writable_storage
 from snuba.environment import setup_logging, setup_sentry
@@ -68,6 +69,11 @@ from snuba.utils.metrics.backends.wrapper import MetricsWrapper
     type=int,
     help="Minimum number of messages per topic+partition librdkafka tries to maintain in the local consumer queue.",
 )
+@click.option(
+    "--payload-decoder",
+    type=click.Choice(sorted(PAYLOAD_DECODERS)),
+    help="Decoder used to parse the message payloads (defaults to the decoder configured for the storage.)",
+)
 @click.option("--log-level", help="Logging level to use.")
 def replacer(
     *,
@@ -81,6 +87,7 @@ def replacer(
     auto_offset_reset: str,
     queued_max_messages_kbytes: int,
     queued_min_messages: int,
+    payload_decoder: Optional[str],
     log_level: Optional[str] = None,
 ) -> None:
 
@@ -154,7 +161,9 @@ def replacer(
             codec=codec,
         ),
         Topic(replacements_topic),
-        worker=ReplacerWorker(clickhouse, storage, metrics=metrics),
+        worker=ReplacerWorker(
+            clickhouse, storage, metrics=metrics, payload_decoder=payload_decoder
+        ),
         max_batch_size=max_batch_size,
         max_batch_time=max_batch_time_ms,
         metrics=metrics,
@@ -1,7 +1,7 @@
-from typing import Optional
+from typing import Optional, Sequence
 
 from snuba import settings
-from snuba.clickhouse.query import ClickhouseQuery
+from snuba.clickhouse.query import ClickhouseQuery, ExternalTable
 from snuba.clickhouse.formatter import ClickhouseExpressionFormatter
 from snuba.query.parsing import ParsingContext
 from snuba.query.query import Query
@@ -35,6 +35,7 @@ class AstClickhouseQuery(ClickhouseQuery):
         self.__limit = query.get_limit()
         self.__limitby = query.get_limitby()
         self.__offset = query.get_offset()
+        self.__external_tables = query.get_external_tables()
 
         if self.__having:
             assert self.__groupby, "found HAVING clause with no GROUP BY"
@@ -52,11 +53,14 @@ class AstClickhouseQuery(ClickhouseQuery):
         self.__settings = settings
         self.__formatted_query: Optional[str] = None
 
+    def get_external_tables(self) -> Sequence[ExternalTable]:
+        return self.__external_tables
+
     def _format_query_impl(self) -> str:
         if self.__formatted_query:
             return self.__formatted_query
 
-        parsing_context = ParsingContext()
+        parsing_context = ParsingContext(self.__settings.get_config())
         formatter = ClickhouseExpressionFormatter(parsing_context)
 
         selected_cols = [e.accept(formatter) for e in self.__selected_columns]
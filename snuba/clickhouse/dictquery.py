@@ -1,6 +1,8 @@
+from typing import Sequence
+
 from snuba import settings as snuba_settings
 from snuba import util
-from snuba.clickhouse.query import ClickhouseQuery
+from snuba.clickhouse.query import ClickhouseQuery, ExternalTable
 from snuba.datasets.dataset import Dataset
 from snuba.query.columns import column_expr, conditions_expr
 from snuba.query.parsing import ParsingContext
@@ -20,7 +22,7 @@ class DictClickhouseQuery(ClickhouseQuery):
     def __init__(
         self, dataset: Dataset, query: Query, settings: RequestSettings,
     ) -> None:
-        parsing_context = ParsingContext()
+        parsing_context = ParsingContext(settings.get_config())
 
         aggregate_exprs = [
             column_expr(dataset, col, query, parsing_context, alias, agg)
@@ -111,6 +113,8 @@ class DictClickhouseQuery(ClickhouseQuery):
         if query.get_limit() is not None:
             limit_clause = "LIMIT {}, {}".format(query.get_offset(), query.get_limit())
 
+        self.__external_tables = query.get_external_tables()
+
         self.__formatted_query = " ".join(
             [
                 c
@@ -132,3 +136,6 @@ class DictClickhouseQuery(ClickhouseQuery):
 
     def _format_query_impl(self) -> str:
         return self.__formatted_query
+
+    def get_external_tables(self) -> Sequence[ExternalTable]:
+        return self.__external_tables
@@ -10,6 +10,7 @@ from snuba.query.expressions import (
     Lambda,
     Literal,
     Argument,
+    TableReference,
 )
 from snuba.query.parsing import ParsingContext
 from snuba.clickhouse.escaping import escape_alias, escape_identifier, escape_string
@@ -106,3 +107,7 @@ class ClickhouseExpressionFormatter(ExpressionVisitor[str]):
         parameters = [self.__escape_identifier_enforce(v) for v in exp.parameters]
         ret = f"({', '.join(parameters)} -> {exp.transformation.accept(self)})"
         return self.__alias(ret, exp.alias)
+
+    def visitTableReference(self, exp: TableReference) -> str:
+        ret = self.__escape_identifier_enforce(exp.table_name)
+        return self.__alias(ret, exp.alias)
@@ -1,11 +1,15 @@
 import re
+import zlib
 from urllib.parse import urlencode
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Sequence
+
+from typing_extensions import Protocol
 
 from urllib3.connectionpool import HTTPConnectionPool
 from urllib3.exceptions import HTTPError
 
 from snuba.clickhouse.errors import ClickhouseError
+from snuba.clickhouse.escaping import escape_identifier
 from snuba.datasets.schemas.tables import TableSchema
 from snuba.writer import BatchWriter, WriterTableRow
 
@@ -16,6 +20,34 @@ CLICKHOUSE_ERROR_RE = re.compile(
 )
 
 
+class Compressor(Protocol):
+    """
+    A streaming compressor, such as the objects returned by
+    ``zlib.compressobj``.
+    """
+
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        ...
+
+
+# Maps the supported values of ``Content-Encoding`` to a function returning a
+# compressor for a request body. These are the only encodings ClickHouse
+# (as of 19.11) decodes in the body of a HTTP request.
+COMPRESSORS: Mapping[str, Callable[[], Compressor]] = {
+    "gzip": lambda: zlib.compressobj(wbits=zlib.MAX_WBITS | 16),
+    "deflate": lambda: zlib.compressobj(wbits=zlib.MAX_WBITS),
+}
+
+
+def _escape_column_name(name: str) -> str:
+    escaped = escape_identifier(name)
+    assert escaped is not None, "column names cannot be empty"
+    return escaped
+
+
 class HTTPBatchWriter(BatchWriter):
     def __init__(
         self,
@@ -26,6 +58,10 @@ class HTTPBatchWriter(BatchWriter):
         options=None,
         table_name=None,
         chunk_size: int = 1,
+        format: str = "JSONEachRow",
+        column_names: Optional[Sequence[str]] = None,
+        chunk_bytes: int = 0,
+        compression: Optional[str] = None,
     ):
         """
         Builds a writer to send a batch to Clickhouse.
@@ -40,36 +76,84 @@ class HTTPBatchWriter(BatchWriter):
         :param chunk_size: The chunk size (in rows).
             We send data to the server with Transfer-Encoding: chunked. If 0 we send the entire
             content in one chunk.
+        :param chunk_bytes: The chunk size (in bytes, before compression). A chunk is sent
+            once either limit is reached. If 0 only the chunk size in rows is used.
+        :param format: The format of the rows produced by the encoder.
+        :param column_names: The columns (in the order they are written by the encoder)
+            for formats where the column names are not included in the rows.
+        :param compression: The encoding the request body is compressed with (one of
+            ``COMPRESSORS``), or None to send it uncompressed.
         """
+        if compression is not None and compression not in COMPRESSORS:
+            raise ValueError(f"unsupported compression: {compression!r}")
+
         self.__pool = HTTPConnectionPool(host, port)
         self.__options = options if options is not None else {}
         self.__table_name = table_name or schema.get_table_name()
         self.__chunk_size = chunk_size
+        self.__chunk_bytes = chunk_bytes
+        self.__compression = compression
         self.__encoder = encoder
+        self.__format = format
+        self.__columns = (
+            " ({})".format(", ".join(_escape_column_name(c) for c in column_names))
+            if column_names is not None
+            else ""
+        )
 
     def _prepare_chunks(self, rows: Iterable[WriterTableRow]) -> Iterable[bytes]:
         chunk = []
+        size = 0
         for row in rows:
-            chunk.append(self.__encoder(row))
-            if self.__chunk_size and len(chunk) == self.__chunk_size:
+            value = self.__encoder(row)
+            chunk.append(value)
+            size += len(value)
+            if (self.__chunk_size and len(chunk) == self.__chunk_size) or (
+                self.__chunk_bytes and size >= self.__chunk_bytes
+            ):
                 yield b"".join(chunk)
                 chunk = []
+                size = 0
 
         if chunk:
             yield b"".join(chunk)
 
+    def _compress_chunks(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Compresses the chunks as a single stream. The compressor buffers its
+        input internally, so chunks that do not produce any output are
+        skipped rather than sent as empty chunks (which would terminate the
+        request body.)
+        """
+        assert self.__compression is not None
+        compressor = COMPRESSORS[self.__compression]()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        data = compressor.flush()
+        if data:
+            yield data
+
     def write(self, rows: Iterable[WriterTableRow]):
+        headers = {"Connection": "keep-alive", "Accept-Encoding": "gzip,deflate"}
+        body = self._prepare_chunks(rows)
+        if self.__compression is not None:
+            headers["Content-Encoding"] = self.__compression
+            body = self._compress_chunks(body)
+
         response = self.__pool.urlopen(
             "POST",
             "/?"
             + urlencode(
                 {
                     **self.__options,
-                    "query": f"INSERT INTO {self.__table_name} FORMAT JSONEachRow",
+                    "query": f"INSERT INTO {self.__table_name}{self.__columns} FORMAT {self.__format}",
                 }
             ),
-            headers={"Connection": "keep-alive", "Accept-Encoding": "gzip,deflate"},
-            body=self._prepare_chunks(rows),
+            headers=headers,
+            body=body,
             chunked=True,
         )
 
@@ -3,7 +3,7 @@ import queue
 import re
 import time
 from datetime import date, datetime
-from typing import Iterable, Mapping, Optional
+from typing import Any, Iterable, Mapping, MutableMapping, Optional
 from uuid import UUID
 
 from clickhouse_driver import Client, errors
@@ -217,6 +217,46 @@ class NativeDriverReader(Reader[ClickhouseQuery]):
 
         return result
 
+    def __transform_columnar_result(self, result, with_totals: bool) -> Result:
+        """
+        Transform a columnar native driver response into a columnar result,
+        without building a mapping for each row.
+        """
+        data, meta = result
+
+        # The driver returns an empty sequence (rather than a sequence of
+        # empty columns) if the query did not return any rows.
+        if not data:
+            data = [[] for _ in meta]
+
+        # XXX: Duplicated names are discarded for consistency with row
+        # oriented results (see above.)
+        columns = {c[0]: i for i, c in enumerate(meta)}
+
+        values = [data[i] for i in columns.values()]
+
+        meta = [
+            {"name": m[0], "type": m[1]} for m in [meta[i] for i in columns.values()]
+        ]
+
+        if with_totals:
+            assert len(values[0]) > 0
+            totals = {
+                column["name"]: column_values[-1]
+                for column, column_values in zip(meta, values)
+            }
+            result = {
+                "columns": [column_values[:-1] for column_values in values],
+                "meta": meta,
+                "totals": totals,
+            }
+        else:
+            result = {"columns": values, "meta": meta}
+
+        transform_column_types(result)
+
+        return result
+
     def execute(
         self,
         query: ClickhouseQuery,
@@ -224,22 +264,36 @@ class NativeDriverReader(Reader[ClickhouseQuery]):
         settings: Optional[Mapping[str, str]] = None,
         query_id: Optional[str] = None,
         with_totals: bool = False,
+        columnar: bool = False,
     ) -> Result:
         if settings is None:
             settings = {}
 
-        kwargs = {}
+        kwargs: MutableMapping[str, Any] = {}
         if query_id is not None:
             kwargs["query_id"] = query_id
 
+        external_tables = query.get_external_tables()
+        if external_tables:
+            kwargs["external_tables"] = [
+                {
+                    "name": table.name,
+                    "structure": list(table.structure),
+                    "data": list(table.rows),
+                }
+                for table in external_tables
+            ]
+
         sql = query.format_sql()
-        return self.__transform_result(
-            self.__client.execute(
-                sql, with_column_types=True, settings=settings, **kwargs
-            ),
-            with_totals=with_totals,
+        result = self.__client.execute(
+            sql, with_column_types=True, columnar=columnar, settings=settings, **kwargs
         )
 
+        if columnar:
+            return self.__transform_columnar_result(result, with_totals=with_totals)
+        else:
+            return self.__transform_result(result, with_totals=with_totals)
+
 
 class NativeDriverBatchWriter(BatchWriter):
     def __init__(self, schema, connection):
@@ -1,5 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class ExternalTable:
+    """
+    A temporary table that is sent to Clickhouse together with a query
+    (as external data) and can be referenced by name from the query, such
+    as on the right hand side of an ``IN`` condition. Large sets of values
+    are sent this way so that they do not need to be formatted into the SQL.
+    """
+
+    name: str
+    # The name and the type of each column.
+    structure: Sequence[Tuple[str, str]]
+    rows: Sequence[Tuple[Any, ...]]
 
 
 class ClickhouseQuery(ABC):
@@ -23,3 +39,10 @@ class ClickhouseQuery(ABC):
         if format is not None:
             query = f"{query} FORMAT {format}"
         return query
+
+    def get_external_tables(self) -> Sequence[ExternalTable]:
+        """
+        Returns the external tables referenced by this query, which have to
+        be sent to Clickhouse to execute it.
+        """
+        return []
@@ -3,9 +3,9 @@ import logging
 from typing import Any, Mapping, Optional, Sequence
 
 import simplejson as json
-import rapidjson
 from confluent_kafka import Producer as ConfluentKafkaProducer
 
+from snuba.consumers.decoders import get_payload_decoder
 from snuba.datasets.storage import WritableTableStorage
 from snuba.processor import ProcessedMessage, ProcessorAction
 from snuba.utils.metrics.backends.abstract import MetricsBackend
@@ -33,6 +33,7 @@ class ConsumerWorker(AbstractBatchWorker[KafkaPayload, ProcessedMessage]):
         replacements_topic: Optional[Topic] = None,
         rapidjson_deserialize: bool = False,
         rapidjson_serialize: bool = False,
+        payload_decoder: Optional[str] = None,
     ) -> None:
         self.__storage = storage
         self.producer = producer
@@ -44,8 +45,15 @@ class ConsumerWorker(AbstractBatchWorker[KafkaPayload, ProcessedMessage]):
             rapidjson_serialize=rapidjson_serialize,
         )
 
-        self.__rapidjson_deserialize = rapidjson_deserialize
-        self.__pre_filter = table_writer.get_stream_loader().get_pre_filter()
+        stream_loader = table_writer.get_stream_loader()
+        if payload_decoder is None:
+            payload_decoder = (
+                "rapidjson"
+                if rapidjson_deserialize
+                else stream_loader.get_payload_decoder()
+            )
+        self.__decode = get_payload_decoder(payload_decoder)
+        self.__pre_filter = stream_loader.get_pre_filter()
 
     def process_message(
         self, message: Message[KafkaPayload]
@@ -54,10 +62,7 @@ class ConsumerWorker(AbstractBatchWorker[KafkaPayload, ProcessedMessage]):
         if self.__pre_filter and self.__pre_filter.should_drop(message):
             return None
 
-        if self.__rapidjson_deserialize:
-            value = rapidjson.loads(message.payload.value)
-        else:
-            value = json.loads(message.payload.value)
+        value = self.__decode(message.payload.value)
         metadata = KafkaMessageMetadata(
             offset=message.offset, partition=message.partition.index
         )
@@ -1,3 +1,4 @@
+from functools import partial
 from typing import Optional, Sequence
 
 from confluent_kafka import KafkaError, KafkaException, Producer
@@ -7,12 +8,13 @@ from snuba.consumer import ConsumerWorker
 from snuba.consumers.snapshot_worker import SnapshotAwareWorker
 from snuba.datasets.storage import WritableTableStorage
 from snuba.datasets.storages.factory import get_writable_storage
+from snuba.processor import ProcessedMessage
 from snuba.snapshots import SnapshotId
 from snuba.stateful_consumer.control_protocol import TransactionData
 from snuba.utils.codecs import PassthroughCodec
 from snuba.utils.metrics.backends.wrapper import MetricsWrapper
 from snuba.utils.retries import BasicRetryPolicy, RetryPolicy, constant_delay
-from snuba.utils.streams.batching import BatchingConsumer
+from snuba.utils.streams.batching import BatchingConsumer, ProcessingPool
 from snuba.utils.streams.kafka import (
     KafkaConsumer,
     KafkaConsumerWithCommitLog,
@@ -23,6 +25,21 @@ from snuba.utils.streams.kafka import (
 from snuba.utils.streams.types import Topic
 
 
+def build_processing_worker(
+    storage_name: str, rapidjson_deserialize: bool, payload_decoder: Optional[str]
+) -> ConsumerWorker:
+    """
+    Builds a worker that is only used to process messages (and not to flush
+    them), such as within the subprocesses of a processing pool.
+    """
+    return ConsumerWorker(
+        storage=get_writable_storage(storage_name),
+        metrics=environment.metrics,
+        rapidjson_deserialize=rapidjson_deserialize,
+        payload_decoder=payload_decoder,
+    )
+
+
 class ConsumerBuilder:
     """
     Simplifies the initialization of a batching consumer by merging
@@ -47,7 +64,12 @@ class ConsumerBuilder:
         rapidjson_deserialize: bool,
         rapidjson_serialize: bool,
         commit_retry_policy: Optional[RetryPolicy] = None,
+        processes: Optional[int] = None,
+        processing_chunk_size: int = 100,
+        max_in_flight_batches: int = 0,
+        payload_decoder: Optional[str] = None,
     ) -> None:
+        self.storage_name = storage_name
         self.storage = get_writable_storage(storage_name)
         self.bootstrap_servers = bootstrap_servers
 
@@ -118,9 +140,17 @@ class ConsumerBuilder:
         self.__commit_retry_policy = commit_retry_policy
         self.__rapidjson_deserialize = rapidjson_deserialize
         self.__rapidjson_serialize = rapidjson_serialize
+        self.__processes = processes
+        self.__processing_chunk_size = processing_chunk_size
+        self.__max_in_flight_batches = max_in_flight_batches
+        self.__payload_decoder = payload_decoder
 
     def __build_consumer(
-        self, worker: ConsumerWorker
+        self,
+        worker: ConsumerWorker,
+        processing_pool: Optional[
+            ProcessingPool[KafkaPayload, ProcessedMessage]
+        ] = None,
     ) -> BatchingConsumer[KafkaPayload]:
         configuration = build_kafka_consumer_configuration(
             bootstrap_servers=self.bootstrap_servers,
@@ -154,12 +184,30 @@ class ConsumerBuilder:
             max_batch_time=self.max_batch_time_ms,
             metrics=self.metrics,
             recoverable_errors=[TransportError],
+            processing_pool=processing_pool,
+            max_in_flight_batches=self.__max_in_flight_batches,
         )
 
     def build_base_consumer(self) -> BatchingConsumer[KafkaPayload]:
         """
-        Builds the consumer with a ConsumerWorker.
+        Builds the consumer with a ConsumerWorker. If multiple processes were
+        requested, messages are processed in a pool of that many subprocesses.
         """
+        processing_pool: Optional[ProcessingPool[KafkaPayload, ProcessedMessage]]
+        if self.__processes is not None and self.__processes > 1:
+            processing_pool = ProcessingPool(
+                partial(
+                    build_processing_worker,
+                    self.storage_name,
+                    self.__rapidjson_deserialize,
+                    self.__payload_decoder,
+                ),
+                processes=self.__processes,
+                chunk_size=self.__processing_chunk_size,
+            )
+        else:
+            processing_pool = None
+
         return self.__build_consumer(
             ConsumerWorker(
                 storage=self.storage,
@@ -168,7 +216,9 @@ class ConsumerBuilder:
                 metrics=self.metrics,
                 rapidjson_deserialize=self.__rapidjson_deserialize,
                 rapidjson_serialize=self.__rapidjson_serialize,
-            )
+                payload_decoder=self.__payload_decoder,
+            ),
+            processing_pool,
         )
 
     def build_snapshot_aware_consumer(
@@ -0,0 +1,42 @@
+from typing import Any, Callable, Mapping
+
+import rapidjson
+import simplejson
+
+PayloadDecoder = Callable[[bytes], Any]
+
+
+def build_orjson_decoder() -> PayloadDecoder:
+    # orjson and simdjson are optional dependencies, they only need to be
+    # installed when they are used. Both parse the payload directly from the
+    # bytes returned by the consumer without decoding it to a string first.
+    import orjson
+
+    return orjson.loads
+
+
+def build_simdjson_decoder() -> PayloadDecoder:
+    import simdjson
+
+    return simdjson.loads
+
+
+# Maps the name of each decoder to a function that builds it.
+PAYLOAD_DECODERS: Mapping[str, Callable[[], PayloadDecoder]] = {
+    "simplejson": lambda: simplejson.loads,
+    "rapidjson": lambda: rapidjson.loads,
+    "orjson": build_orjson_decoder,
+    "simdjson": build_simdjson_decoder,
+}
+
+
+def get_payload_decoder(name: str) -> PayloadDecoder:
+    """
+    Returns the function used to decode the value of the Kafka messages
+    consumed for a storage.
+    """
+    try:
+        builder = PAYLOAD_DECODERS[name]
+    except KeyError:
+        raise ValueError(f"unknown payload decoder: {name!r}")
+    return builder()
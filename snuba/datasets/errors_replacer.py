@@ -2,9 +2,20 @@ import logging
 import time
 
 from collections import deque
+from threading import Lock
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Any, Deque, Mapping, Optional, Sequence, Tuple
+from typing import (
+    Any,
+    Deque,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from snuba import settings
 from snuba.clickhouse import DATETIME_FORMAT
@@ -12,12 +23,14 @@ from snuba.clickhouse.columns import Materialized
 from snuba.clickhouse.escaping import escape_identifier, escape_string
 from snuba.datasets.schemas.tables import TableSchema, WritableTableSchema
 from snuba.processor import InvalidMessageType, _hashify
-from snuba.redis import redis_client
+from snuba.redis import RedisClientType, redis_client
 from snuba.replacers.replacer_processor import (
     Replacement,
     ReplacementMessage,
     ReplacerProcessor,
 )
+from snuba.state import ConfigSnapshot
+from snuba.state.subscriber import VersionedValueSubscriber
 
 
 logger = logging.getLogger(__name__)
@@ -78,7 +91,9 @@ def set_project_needs_final(
 
 
 def get_projects_query_flags(
-    project_ids: Sequence[int], state_name: Optional[ReplacerState]
+    project_ids: Sequence[int],
+    state_name: Optional[ReplacerState],
+    config: ConfigSnapshot,
 ) -> Tuple[bool, Sequence[int]]:
     """\
     1. Fetch `needs_final` for each Project
@@ -88,6 +103,15 @@ def get_projects_query_flags(
     Returns (needs_final, group_ids_to_exclude)
     """
 
+    if settings.REPLACER_FLAGS_STREAM_ENABLED and config.get_config(
+        "use_local_replacement_flags", 0
+    ):
+        # Until the local copy has been loaded (in the background) the flags
+        # are still read from Redis.
+        cache = project_flags_subscribers[state_name].get_nowait()
+        if cache is not None:
+            return cache.get_projects_query_flags(project_ids)
+
     s_project_ids = set(project_ids)
     now = time.time()
     p = redis_client.pipeline()
@@ -121,6 +145,310 @@ def get_projects_query_flags(
     return (needs_final, exclude_groups)
 
 
+def get_project_flags_stream_key(state_name: Optional[ReplacerState]) -> str:
+    return f"project_flags_stream{f':{state_name.value}' if state_name else ''}"
+
+
+def publish_project_flags(
+    project_id: int,
+    group_ids: Optional[Sequence[int]],
+    state_name: Optional[ReplacerState],
+) -> None:
+    """Append the flags set for a project (`needs_final` when there are no
+    `group_ids`, otherwise the groups to exclude) to the stream tailed by
+    every `ProjectFlagsCache`, and notify the caches that it changed."""
+
+    fields: Tuple[Any, ...]
+    if group_ids is None:
+        fields = ("project_id", project_id, "needs_final", 1)
+    else:
+        fields = (
+            "project_id",
+            project_id,
+            "exclude_groups",
+            ",".join(str(group_id) for group_id in group_ids),
+        )
+
+    # The stream is trimmed by length (trimming by age requires Redis 6.2),
+    # the flags that expired are dropped by the caches themselves.
+    redis_client.execute_command(
+        "XADD",
+        get_project_flags_stream_key(state_name),
+        "MAXLEN",
+        "~",
+        settings.REPLACER_FLAGS_STREAM_MAX_LENGTH,
+        "*",
+        *fields,
+    )
+    project_flags_subscribers[state_name].notify()
+
+
+class ProjectFlagsCache:
+    """
+    A local copy of the query time flags of every project, built from the
+    stream that the replacer appends every flag it sets to (as well as
+    setting the Redis keys read by `get_projects_query_flags`.) Reading the
+    flags of a query does not require a round trip, and since the flags that
+    expired are dropped locally it never writes to Redis.
+
+    The time each flag was set at is the time of its entry in the stream,
+    which is assigned by Redis.
+    """
+
+    # The number of entries read from the stream at a time.
+    BATCH_SIZE = 1000
+
+    def __init__(
+        self, client: RedisClientType, state_name: Optional[ReplacerState]
+    ) -> None:
+        self.__client = client
+        self.__key = get_project_flags_stream_key(state_name)
+
+        # Held while updating, and while applying entries or reading the
+        # flags respectively, so that reads never wait on Redis.
+        self.__update_lock = Lock()
+        self.__lock = Lock()
+        self.__last_id: Optional[bytes] = None
+        self.__last_trimmed = time.time()
+        # The last time each project needed final, and each group of each
+        # project was excluded.
+        self.__needs_final: MutableMapping[int, float] = {}
+        self.__exclude_groups: MutableMapping[int, MutableMapping[int, float]] = {}
+
+    def update(self) -> "ProjectFlagsCache":
+        """
+        Applies every entry appended to the stream since the last update.
+        """
+        with self.__update_lock:
+            while True:
+                if self.__last_id is None:
+                    start = "-"
+                else:
+                    # The range is inclusive, so it starts from the entry
+                    # following the last one that was applied.
+                    timestamp, sequence = self.__last_id.split(b"-")
+                    start = f"{timestamp.decode()}-{int(sequence) + 1}"
+
+                entries = self.__client.execute_command(
+                    "XRANGE", self.__key, start, "+", "COUNT", self.BATCH_SIZE
+                )
+                with self.__lock:
+                    for entry_id, fields in entries:
+                        self.__apply(entry_id, fields)
+                        self.__last_id = entry_id
+
+                if len(entries) < self.BATCH_SIZE:
+                    break
+
+            now = time.time()
+            if now - self.__last_trimmed >= 60:
+                with self.__lock:
+                    self.__trim(now - settings.REPLACER_KEY_TTL)
+                self.__last_trimmed = now
+
+        return self
+
+    def __apply(self, entry_id: bytes, fields: Sequence[bytes]) -> None:
+        timestamp = int(entry_id.split(b"-")[0]) / 1000
+        values = dict(zip(fields[::2], fields[1::2]))
+        project_id = int(values[b"project_id"])
+        if b"needs_final" in values:
+            self.__needs_final[project_id] = timestamp
+        else:
+            exclude_groups = self.__exclude_groups.setdefault(project_id, {})
+            for group_id in values[b"exclude_groups"].split(b","):
+                exclude_groups[int(group_id)] = timestamp
+
+    def __trim(self, cutoff: float) -> None:
+        for project_id, timestamp in list(self.__needs_final.items()):
+            if timestamp < cutoff:
+                del self.__needs_final[project_id]
+
+        for project_id, exclude_groups in list(self.__exclude_groups.items()):
+            for group_id, timestamp in list(exclude_groups.items()):
+                if timestamp < cutoff:
+                    del exclude_groups[group_id]
+            if not exclude_groups:
+                del self.__exclude_groups[project_id]
+
+    def get_projects_query_flags(
+        self, project_ids: Sequence[int]
+    ) -> Tuple[bool, Sequence[int]]:
+        """
+        Returns (needs_final, group_ids_to_exclude) like
+        `get_projects_query_flags` does.
+        """
+        cutoff = time.time() - settings.REPLACER_KEY_TTL
+        s_project_ids = set(project_ids)
+        with self.__lock:
+            needs_final = any(
+                self.__needs_final.get(project_id, cutoff - 1) >= cutoff
+                for project_id in s_project_ids
+            )
+            exclude_groups = sorted(
+                {
+                    group_id
+                    for project_id in s_project_ids
+                    for group_id, timestamp in self.__exclude_groups.get(
+                        project_id, {}
+                    ).items()
+                    if timestamp >= cutoff
+                }
+            )
+
+        return (needs_final, exclude_groups)
+
+
+def build_project_flags_subscriber(
+    state_name: Optional[ReplacerState],
+) -> VersionedValueSubscriber[ProjectFlagsCache]:
+    key = get_project_flags_stream_key(state_name)
+    return VersionedValueSubscriber(
+        redis_client,
+        f"{key}:channel",
+        f"{key}:version",
+        ProjectFlagsCache(redis_client, state_name).update,
+    )
+
+
+project_flags_subscribers: Mapping[
+    Optional[ReplacerState], VersionedValueSubscriber[ProjectFlagsCache]
+] = {
+    state_name: build_project_flags_subscriber(state_name)
+    for state_name in [None, *ReplacerState]
+}
+
+
+@dataclass(frozen=True)
+class GroupsReplacement(Replacement):
+    """
+    A replacement that deletes the rows of some groups of a project or, if
+    there is a new group, merges them into it. The groups are kept so that
+    consecutive replacements can be coalesced into a single one.
+    """
+
+    project_id: int
+    new_group_id: Optional[int]
+    # The sets of groups that are replaced, with the time up to which the
+    # rows received for them are replaced.
+    groups: Sequence[Tuple[datetime, Sequence[int]]]
+
+    def get_group_ids(self) -> Sequence[int]:
+        return list(
+            dict.fromkeys(
+                group_id for _, group_ids in self.groups for group_id in group_ids
+            )
+        )
+
+
+def can_coalesce(previous: GroupsReplacement, replacement: GroupsReplacement) -> bool:
+    """
+    Returns whether running a replacement right after the previous one has
+    the same result as running a single replacement of the groups of both.
+    """
+    if previous.project_id != replacement.project_id:
+        return False
+
+    if (
+        len(previous.get_group_ids()) + len(replacement.get_group_ids())
+        > settings.REPLACER_MAX_GROUP_IDS_TO_COALESCE
+    ):
+        return False
+
+    # The order in which groups are deleted does not matter, but deletes
+    # cannot be reordered with merges.
+    if previous.new_group_id is None or replacement.new_group_id is None:
+        return previous.new_group_id is None and replacement.new_group_id is None
+
+    if previous.new_group_id == replacement.new_group_id:
+        return True
+
+    # A merge into a group that is then merged into another one can be
+    # resolved to the final group, as long as every row moved by the first
+    # merge is moved again by the second one.
+    latest = max(timestamp for timestamp, _ in previous.groups)
+    return any(
+        previous.new_group_id in group_ids and latest <= timestamp
+        for timestamp, group_ids in replacement.groups
+    )
+
+
+def coalesce(
+    previous: GroupsReplacement, replacement: GroupsReplacement
+) -> GroupsReplacement:
+    """
+    Builds a single replacement of the groups of both replacements, which
+    must be able to be coalesced (see ``can_coalesce``.)
+    """
+    groups_by_timestamp: MutableMapping[datetime, MutableMapping[int, None]] = {}
+    for timestamp, group_ids in [*previous.groups, *replacement.groups]:
+        groups_by_timestamp.setdefault(timestamp, {}).update(dict.fromkeys(group_ids))
+    groups = [
+        (timestamp, list(group_ids))
+        for timestamp, group_ids in groups_by_timestamp.items()
+    ]
+    all_group_ids = list(
+        dict.fromkeys(group_id for _, group_ids in groups for group_id in group_ids)
+    )
+
+    # Every set of groups keeps its own timestamp, so that rows received
+    # after the groups were replaced are still not replaced.
+    where = """\
+        PREWHERE group_id IN (%(group_ids)s)
+        WHERE project_id = %(project_id)s
+        AND (%(received_conditions)s)
+        AND NOT deleted
+    """
+
+    count_query_template = (
+        """\
+        SELECT count()
+        FROM %(dist_read_table_name)s FINAL
+    """
+        + where
+    )
+
+    insert_query_template = (
+        """\
+        INSERT INTO %(dist_write_table_name)s (%(columns)s)
+        SELECT %(select_columns)s
+        FROM %(dist_read_table_name)s FINAL
+    """
+        + where
+    )
+
+    query_args = {
+        # Merges select the new group (of the last merge) rather than the
+        # group_id column, which deletes select as is.
+        "columns": replacement.query_args[
+            "required_columns" if replacement.new_group_id is None else "all_columns"
+        ],
+        "select_columns": replacement.query_args["select_columns"],
+        "project_id": replacement.project_id,
+        "group_ids": ", ".join(str(gid) for gid in all_group_ids),
+        "received_conditions": " OR ".join(
+            "group_id IN (%s) AND received <= CAST('%s' AS DateTime)"
+            % (
+                ", ".join(str(gid) for gid in group_ids),
+                timestamp.strftime(DATETIME_FORMAT),
+            )
+            for timestamp, group_ids in groups
+        ),
+    }
+
+    query_time_flags = (EXCLUDE_GROUPS, replacement.project_id, all_group_ids)
+
+    return GroupsReplacement(
+        count_query_template,
+        insert_query_template,
+        query_args,
+        query_time_flags,
+        replacement.project_id,
+        replacement.new_group_id,
+        groups,
+    )
+
+
 class ErrorsReplacer(ReplacerProcessor):
     def __init__(
         self,
@@ -171,7 +499,39 @@ class ErrorsReplacer(ReplacerProcessor):
 
         return processed
 
-    def pre_replacement(self, replacement: Replacement, matching_records: int) -> None:
+    def get_project_id(self, replacement: Replacement) -> Optional[int]:
+        # query_time_flags == (type, project_id, [...data...])
+        return replacement.query_time_flags[1]
+
+    def coalesce_replacements(
+        self, replacements: Sequence[Replacement]
+    ) -> Sequence[Replacement]:
+        coalesced: MutableSequence[Replacement] = []
+        # Replacements of different projects never replace the same rows, so
+        # a replacement can be coalesced with the last one of its project even
+        # if there are replacements of other projects between them.
+        last_index: MutableMapping[Optional[int], int] = {}
+        for replacement in replacements:
+            project_id = self.get_project_id(replacement)
+            index = last_index.get(project_id)
+            if index is not None:
+                previous = coalesced[index]
+                if (
+                    isinstance(previous, GroupsReplacement)
+                    and isinstance(replacement, GroupsReplacement)
+                    and can_coalesce(previous, replacement)
+                ):
+                    coalesced[index] = coalesce(previous, replacement)
+                    continue
+
+            last_index[project_id] = len(coalesced)
+            coalesced.append(replacement)
+
+        return coalesced
+
+    def pre_replacement(
+        self, replacement: Replacement, matching_records: Optional[int]
+    ) -> None:
         # query_time_flags == (type, project_id, [...data...])
         flag_type, project_id = replacement.query_time_flags[:2]
         if self.__state_name == ReplacerState.EVENTS:
@@ -184,11 +544,15 @@ class ErrorsReplacer(ReplacerProcessor):
             if compatibility_double_write:
                 set_project_needs_final(project_id, None)
             set_project_needs_final(project_id, self.__state_name)
+            if settings.REPLACER_FLAGS_STREAM_ENABLED:
+                publish_project_flags(project_id, None, self.__state_name)
         elif flag_type == EXCLUDE_GROUPS:
             group_ids = replacement.query_time_flags[2]
             if compatibility_double_write:
                 set_project_exclude_groups(project_id, group_ids, None)
             set_project_exclude_groups(project_id, group_ids, self.__state_name)
+            if settings.REPLACER_FLAGS_STREAM_ENABLED:
+                publish_project_flags(project_id, group_ids, self.__state_name)
 
 
 def process_delete_groups(
@@ -236,8 +600,14 @@ def process_delete_groups(
 
     query_time_flags = (EXCLUDE_GROUPS, message["project_id"], group_ids)
 
-    return Replacement(
-        count_query_template, insert_query_template, query_args, query_time_flags
+    return GroupsReplacement(
+        count_query_template,
+        insert_query_template,
+        query_args,
+        query_time_flags,
+        message["project_id"],
+        None,
+        [(timestamp, group_ids)],
     )
 
 
@@ -301,8 +671,14 @@ def process_merge(
 
     query_time_flags = (EXCLUDE_GROUPS, message["project_id"], previous_group_ids)
 
-    return Replacement(
-        count_query_template, insert_query_template, query_args, query_time_flags
+    return GroupsReplacement(
+        count_query_template,
+        insert_query_template,
+        query_args,
+        query_time_flags,
+        message["project_id"],
+        message["new_group_id"],
+        [(timestamp, previous_group_ids)],
     )
 
 
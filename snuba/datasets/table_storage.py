@@ -1,9 +1,10 @@
 from dataclasses import dataclass
 import json
+import logging
 import rapidjson
 
 from datetime import datetime
-from typing import Optional, Sequence
+from typing import Callable, Optional, Sequence
 
 from snuba import settings
 from snuba.clickhouse import DATETIME_FORMAT
@@ -13,7 +14,29 @@ from snuba.processor import MessageProcessor
 from snuba.replacers.replacer_processor import ReplacerProcessor
 from snuba.snapshots.loaders import BulkLoader
 from snuba.utils.streams.kafka import KafkaPayload
-from snuba.writer import BatchWriter
+from snuba.writer import BatchWriter, WriterTableRow
+
+logger = logging.getLogger(__name__)
+
+
+def build_json_row_encoder(
+    rapidjson_serialize: bool = False,
+) -> Callable[[WriterTableRow], bytes]:
+    """
+    Returns the function used to encode rows when they are inserted as
+    ``JSONEachRow``.
+    """
+
+    def default(value):
+        if isinstance(value, datetime):
+            return value.strftime(DATETIME_FORMAT)
+        else:
+            raise TypeError
+
+    if rapidjson_serialize:
+        return lambda row: rapidjson.dumps(row, default=default).encode("utf-8")
+    else:
+        return lambda row: json.dumps(row, default=default).encode("utf-8")
 
 
 @dataclass(frozen=True)
@@ -36,8 +59,10 @@ class KafkaStreamLoader:
         pre_filter: Optional[StreamMessageFilter[KafkaPayload]] = None,
         replacement_topic: Optional[str] = None,
         commit_log_topic: Optional[str] = None,
+        payload_decoder: str = "simplejson",
     ) -> None:
         self.__processor = processor
+        self.__payload_decoder = payload_decoder
         self.__default_topic_spec = KafkaTopicSpec(
             topic_name=default_topic,
             partitions_number=settings.TOPIC_PARTITION_COUNTS.get(default_topic, 1),
@@ -67,6 +92,13 @@ class KafkaStreamLoader:
     def get_processor(self) -> MessageProcessor:
         return self.__processor
 
+    def get_payload_decoder(self) -> str:
+        """
+        Returns the name of the decoder (see ``snuba.consumers.decoders``) used
+        to parse the messages of the Kafka stream.
+        """
+        return self.__payload_decoder
+
     def get_pre_filter(self) -> Optional[StreamMessageFilter[KafkaPayload]]:
         """
         Returns a filter (or none if none is defined) to be applied to the messages
@@ -125,25 +157,42 @@ class TableWriter:
     ) -> BatchWriter:
         from snuba import settings
         from snuba.clickhouse.http import HTTPBatchWriter
-
-        def default(value):
-            if isinstance(value, datetime):
-                return value.strftime(DATETIME_FORMAT)
+        from snuba.clickhouse.rowbinary import RowBinaryEncoder, UnsupportedColumnType
+
+        if settings.CLICKHOUSE_INSERT_FORMAT == "RowBinary":
+            try:
+                encoder = RowBinaryEncoder(self.__table_schema.get_columns())
+            except UnsupportedColumnType as error:
+                logger.warning(
+                    "Cannot insert into %s as RowBinary, falling back to JSON: %s",
+                    self.__table_schema.get_table_name(),
+                    error,
+                )
             else:
-                raise TypeError
+                return HTTPBatchWriter(
+                    self.__table_schema,
+                    settings.CLICKHOUSE_HOST,
+                    settings.CLICKHOUSE_HTTP_PORT,
+                    encoder,
+                    options,
+                    table_name,
+                    chunk_size=settings.CLICKHOUSE_HTTP_CHUNK_SIZE,
+                    format="RowBinary",
+                    column_names=encoder.get_column_names(),
+                    chunk_bytes=settings.CLICKHOUSE_HTTP_CHUNK_BYTES,
+                    compression=settings.CLICKHOUSE_HTTP_COMPRESSION,
+                )
 
         return HTTPBatchWriter(
             self.__table_schema,
             settings.CLICKHOUSE_HOST,
             settings.CLICKHOUSE_HTTP_PORT,
-            lambda row: (
-                rapidjson.dumps(row, default=default)
-                if rapidjson_serialize
-                else json.dumps(row, default=default)
-            ).encode("utf-8"),
+            build_json_row_encoder(rapidjson_serialize),
             options,
             table_name,
             chunk_size=settings.CLICKHOUSE_HTTP_CHUNK_SIZE,
+            chunk_bytes=settings.CLICKHOUSE_HTTP_CHUNK_BYTES,
+            compression=settings.CLICKHOUSE_HTTP_COMPRESSION,
         )
 
     def get_bulk_writer(self, options=None, table_name=None) -> BatchWriter:
@@ -165,6 +214,7 @@ class TableWriter:
             options,
             table_name,
             chunk_size=settings.BULK_CLICKHOUSE_BUFFER,
+            compression=settings.CLICKHOUSE_HTTP_COMPRESSION,
         )
 
     def get_bulk_loader(self, source, dest_table) -> BulkLoader:
@@ -5,7 +5,6 @@ import re
 from typing import Any, List, Mapping, Optional, Set, Union
 
 from dataclasses import dataclass
-from snuba import state
 from snuba.clickhouse.columns import ColumnSet
 from snuba.clickhouse.escaping import escape_identifier
 from snuba.query.expressions import Column, Expression, FunctionCall, Literal
@@ -206,13 +205,15 @@ class TagColumnProcessor:
 
         return []
 
-    def __get_filter_tags(self, query: Query) -> List[str]:
+    def __get_filter_tags(
+        self, query: Query, parsing_context: ParsingContext
+    ) -> List[str]:
         """
         Identifies the tag names we can apply the arrayFilter optimization on.
         Which means: if the tags_key column is in the select clause and there are
         one or more top level conditions on the tags_key column.
         """
-        if not state.get_config("ast_tag_processor_enabled", 0):
+        if not parsing_context.get_config().get_config("ast_tag_processor_enabled", 0):
             return []
 
         select_clause = query.get_selected_columns_from_ast() or []
@@ -263,7 +264,9 @@ class TagColumnProcessor:
         is found in the query in order to reduce the size of the arrayJoin.
         """
         col, k_or_v = parsed_col.col_name.split("_", 1)
-        nested_tags_only = state.get_config("nested_tags_only", 1)
+        nested_tags_only = parsing_context.get_config().get_config(
+            "nested_tags_only", 1
+        )
 
         qualified_col = qualified_column(col, table_alias)
         # Generate parallel lists of keys and values to arrayJoin on
@@ -287,7 +290,9 @@ class TagColumnProcessor:
             [qualified_key, qualified_value]
         )
 
-        filter_tags = ",".join([f"'{tag}'" for tag in self.__get_filter_tags(query)])
+        filter_tags = ",".join(
+            [f"'{tag}'" for tag in self.__get_filter_tags(query, parsing_context)]
+        )
         if len(cols_used) == 2:
             # If we use both tags_key and tags_value in this query, arrayjoin
             # on (key, value) tag tuples.
@@ -5,9 +5,10 @@ import tempfile
 import time
 from datetime import datetime
 from itertools import chain
-from typing import MutableSequence, Sequence
+from typing import Any, Callable, MutableSequence, Sequence, Tuple
 
 from snuba.environment import clickhouse_rw
+from snuba.processor import ProcessorAction
 from snuba.util import settings_override
 from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
 from snuba.utils.streams.kafka import KafkaPayload
@@ -101,3 +102,80 @@ def run(events_file, dataset, repeat=1, profile_process=False, profile_write=Fal
     logger.info("Total write:      %sms" % format_time(time_to_write))
     logger.info("Process event:    %sms/ea" % format_time(time_to_process / num_events))
     logger.info("Write event:      %sms/ea" % format_time(time_to_write / num_events))
+
+
+def measure_encoding(
+    rows: Sequence[Any], encoder: Callable[[Any], bytes]
+) -> Tuple[float, int]:
+    """
+    Returns the CPU time (in milliseconds) and the number of bytes required to
+    encode the rows.
+    """
+    cpu_start = time.process_time()
+    size = sum(len(encoder(row)) for row in rows)
+    return (time.process_time() - cpu_start) * 1000, size
+
+
+def compare_insert_formats(events_file, dataset, repeat=1):
+    """
+    Compares the size and the time required to encode the rows produced by
+    processing the events as JSONEachRow and RowBinary, without writing them.
+    """
+
+    from snuba.clickhouse.rowbinary import RowBinaryEncoder
+    from snuba.consumer import ConsumerWorker
+    from snuba.datasets.table_storage import build_json_row_encoder
+
+    writable_storage = dataset.get_writable_storage()
+    consumer = ConsumerWorker(writable_storage, metrics=DummyMetricsBackend())
+
+    rows = []
+    with settings_override({"DISCARD_OLD_EVENTS": False}):
+        for message in get_messages(events_file) * repeat:
+            result = consumer.process_message(message)
+            if result is not None and result.action is ProcessorAction.INSERT:
+                rows.extend(result.data)
+
+    columns = writable_storage.get_table_writer().get_schema().get_columns()
+    formats = [
+        ("JSONEachRow", build_json_row_encoder()),
+        ("RowBinary", RowBinaryEncoder(columns)),
+    ]
+
+    logger.info("Number of rows:   %s" % str(len(rows)).rjust(10, " "))
+    for name, encoder in formats:
+        cpu_time, size = measure_encoding(rows, encoder)
+        logger.info("%s:" % name)
+        logger.info("  Encode CPU:     %sms" % format_time(cpu_time))
+        logger.info("  Encode row:     %sms/ea" % format_time(cpu_time / len(rows)))
+        logger.info("  Bytes:          %s" % str(size).rjust(10, " "))
+        logger.info("  Bytes/row:      %s" % format_time(size / len(rows)))
+
+
+def compare_payload_decoders(events_file, repeat=1):
+    """
+    Compares the time required to decode the messages with each of the
+    payload decoders that are installed, without processing them.
+    """
+
+    from snuba.consumers.decoders import PAYLOAD_DECODERS
+
+    payloads = [message.payload.value for message in get_messages(events_file)]
+    payloads = payloads * repeat
+
+    logger.info("Number of messages: %s" % str(len(payloads)).rjust(8, " "))
+    for name, build_decoder in PAYLOAD_DECODERS.items():
+        try:
+            decode = build_decoder()
+        except ImportError:
+            logger.info("%s: not installed" % name)
+            continue
+
+        cpu_start = time.process_time()
+        for payload in payloads:
+            decode(payload)
+        cpu_time = (time.process_time() - cpu_start) * 1000
+
+        logger.info("%s:" % name)
+        logger.info("  Decode CPU:     %sms" % format_time(cpu_time))
+        logger.info("  Decode message: %sms/ea" % format_time(cpu_time / len(payloads)))
@@ -110,6 +110,11 @@ def _floatify(s) -> Optional[float]:
 
 
 def _unicodify(s) -> Optional[str]:
+    # Most values are ASCII strings, which are returned as they are (they are
+    # always valid UTF-8) without the cost of the round trip below.
+    if type(s) is str and s.isascii():
+        return s
+
     if s is None:
         return None
 
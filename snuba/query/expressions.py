@@ -4,9 +4,11 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass, replace
 from datetime import date, datetime
 from typing import (
+    Any,
     Callable,
     Generic,
     Iterator,
+    MutableMapping,
     Optional,
     TypeVar,
     Tuple,
@@ -63,6 +65,12 @@ class Expression(ABC):
         """
         raise NotImplementedError
 
+    def __deepcopy__(self, memo: MutableMapping[int, Any]) -> Expression:
+        # Expressions are immutable, so copies of a query (like the ones made
+        # to log the original query, or to run it more than once when it is
+        # split) can share them rather than copying every node of the tree.
+        return self
+
 
 class ExpressionVisitor(ABC, Generic[TVisited]):
     """
@@ -101,6 +109,10 @@ class ExpressionVisitor(ABC, Generic[TVisited]):
     def visitLambda(self, exp: Lambda) -> TVisited:
         raise NotImplementedError
 
+    @abstractmethod
+    def visitTableReference(self, exp: TableReference) -> TVisited:
+        raise NotImplementedError
+
 
 @dataclass(frozen=True)
 class Literal(Expression):
@@ -139,6 +151,26 @@ class Column(Expression):
         return visitor.visitColumn(self)
 
 
+@dataclass(frozen=True)
+class TableReference(Expression):
+    """
+    Refers to a table by name where an expression is expected, like a table
+    sent together with the query as external data on the right hand side of
+    an IN condition.
+    """
+
+    table_name: str
+
+    def transform(self, func: Callable[[Expression], Expression]) -> Expression:
+        return func(self)
+
+    def __iter__(self) -> Iterator[Expression]:
+        yield self
+
+    def accept(self, visitor: ExpressionVisitor[TVisited]) -> TVisited:
+        return visitor.visitTableReference(self)
+
+
 @dataclass(frozen=True)
 class FunctionCall(Expression):
     """
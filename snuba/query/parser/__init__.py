@@ -3,6 +3,7 @@ import logging
 from typing import Any, MutableMapping, Optional
 
 from snuba import state
+from snuba.state import ConfigSnapshot
 from snuba.clickhouse.escaping import NEGATE_RE
 from snuba.datasets.dataset import Dataset
 from snuba.query.expressions import Expression
@@ -14,11 +15,18 @@ from snuba.util import is_function, to_list, tuplify
 logger = logging.getLogger(__name__)
 
 
-def parse_query(body: MutableMapping[str, Any], dataset: Dataset) -> Query:
+def parse_query(
+    body: MutableMapping[str, Any],
+    dataset: Dataset,
+    config: Optional[ConfigSnapshot] = None,
+) -> Query:
     """
     Parses the query body generating the AST. This only takes into
     account the initial query body. Extensions are parsed by extension
     processors and are supposed to update the AST.
+
+    The runtime configuration is read from ``config``, which should be the
+    snapshot of the request the query belongs to.
     """
     try:
         return _parse_query_impl(body, dataset)
@@ -28,7 +36,9 @@ def parse_query(body: MutableMapping[str, Any], dataset: Dataset) -> Query:
         # representation.
         # Once we will be actually using the ast to build the Clickhouse query
         # this try/except block will disappear.
-        enforce_validity = state.get_config("query_parsing_enforce_validity", 0)
+        if config is None:
+            config = state.get_config_snapshot()
+        enforce_validity = config.get_config("query_parsing_enforce_validity", 0)
         if enforce_validity:
             raise e
         else:
@@ -1,18 +1,26 @@
-from typing import List
+from typing import List, Optional
+
+from snuba.state import ConfigSnapshot, get_config_snapshot
 
 
 class ParsingContext:
     """
     This class is passed around during the query parsing process
     to keep any state needed during the process itself (like the
-    alias cache).
+    alias cache and the runtime configuration of the request).
     """
 
-    def __init__(self) -> None:
+    def __init__(self, config: Optional[ConfigSnapshot] = None) -> None:
         self.__alias_cache: List[str] = []
+        self.__config = config
 
     def add_alias(self, alias: str) -> None:
         self.__alias_cache.append(alias)
 
     def is_alias_present(self, alias: str) -> bool:
         return alias in self.__alias_cache
+
+    def get_config(self) -> ConfigSnapshot:
+        if self.__config is None:
+            self.__config = get_config_snapshot()
+        return self.__config
@@ -1,4 +1,3 @@
-from snuba import state
 from snuba.datasets.schemas.tables import TableSource
 from snuba.query.query import Query
 from snuba.query.query_processor import QueryProcessor
@@ -17,7 +16,9 @@ class ReadOnlyTableSelector(QueryProcessor):
         self.__read_only_table = read_only_table
 
     def process_query(self, query: Query, request_settings: RequestSettings) -> None:
-        readonly_enabled = state.get_config("enable_events_readonly_table", False)
+        readonly_enabled = request_settings.get_config().get_config(
+            "enable_events_readonly_table", False
+        )
         if not readonly_enabled:
             return
 
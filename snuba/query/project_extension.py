@@ -1,17 +1,19 @@
 from typing import Optional, Sequence
 
 from snuba import settings, util
+from snuba.clickhouse.query import ExternalTable
 from snuba.query.conditions import (
+    ConditionFunctions,
+    binary_condition,
     in_condition,
     not_in_condition,
 )
-from snuba.query.expressions import Column, FunctionCall, Literal
+from snuba.query.expressions import Column, FunctionCall, Literal, TableReference
 from snuba.query.extensions import QueryExtension
 from snuba.query.query import Query
 from snuba.query.query_processor import ExtensionData, ExtensionQueryProcessor
 from snuba.datasets.errors_replacer import get_projects_query_flags, ReplacerState
 from snuba.request.request_settings import RequestSettings
-from snuba.state import get_config, get_configs
 from snuba.state.rate_limit import RateLimitParameters, PROJECT_RATE_LIMIT_NAME
 
 
@@ -45,29 +47,44 @@ class ProjectExtensionProcessor(ExtensionQueryProcessor):
     def __init__(self, project_column: str) -> None:
         self.__project_column = project_column
 
-    def _get_rate_limit_params(self, project_ids: Sequence[int]) -> RateLimitParameters:
-        project_id = (
-            project_ids[0] if project_ids else 0
-        )  # TODO rate limit on every project in the list?
-
-        prl, pcl = get_configs(
+    def _get_rate_limit_params(
+        self, project_ids: Sequence[int], request_settings: RequestSettings
+    ) -> Sequence[RateLimitParameters]:
+        """
+        Returns a rate limit for every project in the query, so that queries
+        spanning many projects count towards the limits of each of them.
+        """
+        # Queries without any projects share a single bucket.
+        unique_project_ids = list(dict.fromkeys(project_ids)) or [0]
+
+        config = request_settings.get_config()
+        prl, pcl = config.get_configs(
             [("project_per_second_limit", 1000), ("project_concurrent_limit", 1000)]
         )
 
         # Specific projects can have their rate limits overridden
-        (per_second, concurr) = get_configs(
+        limits = config.get_configs(
             [
-                ("project_per_second_limit_{}".format(project_id), prl),
-                ("project_concurrent_limit_{}".format(project_id), pcl),
+                (key.format(project_id), default)
+                for project_id in unique_project_ids
+                for key, default in [
+                    ("project_per_second_limit_{}", prl),
+                    ("project_concurrent_limit_{}", pcl),
+                ]
             ]
         )
 
-        return RateLimitParameters(
-            rate_limit_name=PROJECT_RATE_LIMIT_NAME,
-            bucket=str(project_id),
-            per_second_limit=per_second,
-            concurrent_limit=concurr,
-        )
+        return [
+            RateLimitParameters(
+                rate_limit_name=PROJECT_RATE_LIMIT_NAME,
+                bucket=str(project_id),
+                per_second_limit=per_second,
+                concurrent_limit=concurr,
+            )
+            for project_id, per_second, concurr in zip(
+                unique_project_ids, limits[::2], limits[1::2]
+            )
+        ]
 
     def do_post_processing(
         self,
@@ -95,11 +112,18 @@ class ProjectExtensionProcessor(ExtensionQueryProcessor):
                 )
             )
 
-        request_settings.add_rate_limit(self._get_rate_limit_params(project_ids))
+        for rate_limit_params in self._get_rate_limit_params(
+            project_ids, request_settings
+        ):
+            request_settings.add_rate_limit(rate_limit_params)
 
         self.do_post_processing(project_ids, query, request_settings)
 
 
+# The name of the external table with the groups to exclude from a query.
+EXCLUDE_GROUPS_TABLE_NAME = "_snuba_exclude_groups"
+
+
 class ProjectWithGroupsProcessor(ProjectExtensionProcessor):
     """
     Extension processor that makes changes to the query by
@@ -123,16 +147,52 @@ class ProjectWithGroupsProcessor(ProjectExtensionProcessor):
     ) -> None:
         if not request_settings.get_turbo():
             final, exclude_group_ids = get_projects_query_flags(
-                project_ids, self.__replacer_state_name
+                project_ids, self.__replacer_state_name, request_settings.get_config()
             )
             if not final and exclude_group_ids:
-                # If the number of groups to exclude exceeds our limit, the query
-                # should just use final instead of the exclusion set.
-                max_group_ids_exclude = get_config(
-                    "max_group_ids_exclude", settings.REPLACER_MAX_GROUP_IDS_TO_EXCLUDE
+                # If the number of groups to exclude exceeds our limit, they are
+                # sent as an external table rather than in the SQL and, if there
+                # are even more, the query should just use final instead of the
+                # exclusion set.
+                config = request_settings.get_config()
+                max_group_ids_exclude = int(
+                    config.get_config(
+                        "max_group_ids_exclude",
+                        settings.REPLACER_MAX_GROUP_IDS_TO_EXCLUDE,
+                    )
+                    or 0
                 )
-                if len(exclude_group_ids) > max_group_ids_exclude:
+                max_group_ids_exclude_external = int(
+                    config.get_config(
+                        "max_group_ids_exclude_external",
+                        settings.REPLACER_MAX_GROUP_IDS_TO_EXCLUDE_EXTERNAL,
+                    )
+                    or 0
+                )
+                if len(exclude_group_ids) > max(
+                    max_group_ids_exclude, max_group_ids_exclude_external
+                ):
                     query.set_final(True)
+                elif len(exclude_group_ids) > max_group_ids_exclude:
+                    table = ExternalTable(
+                        EXCLUDE_GROUPS_TABLE_NAME,
+                        [("group_id", "UInt64")],
+                        [(group_id,) for group_id in exclude_group_ids],
+                    )
+                    query.add_external_table(table)
+                    query.add_conditions(
+                        [(["assumeNotNull", ["group_id"]], "NOT IN", table)]
+                    )
+                    query.add_condition_to_ast(
+                        binary_condition(
+                            None,
+                            ConditionFunctions.NOT_IN,
+                            FunctionCall(
+                                None, "assumeNotNull", (Column(None, "group_id", None),)
+                            ),
+                            TableReference(None, table.name),
+                        )
+                    )
                 else:
                     query.add_conditions(
                         [(["assumeNotNull", ["group_id"]], "NOT IN", exclude_group_ids)]
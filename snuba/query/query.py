@@ -19,6 +19,7 @@ from typing import (
 )
 
 from snuba.clickhouse.escaping import SAFE_COL_RE
+from snuba.clickhouse.query import ExternalTable
 from snuba.datasets.schemas import RelationalSource
 from snuba.query.conditions import binary_condition, BooleanFunctions
 from snuba.query.expressions import Expression
@@ -114,6 +115,7 @@ class Query:
         self.__groupby = groupby or []
         self.__having = having
         self.__order_by = order_by or []
+        self.__external_tables: Sequence[ExternalTable] = []
 
     def get_all_expressions(self) -> Iterable[Expression]:
         """
@@ -294,6 +296,16 @@ class Query:
     def has_totals(self) -> bool:
         return self.__body.get("totals", False)
 
+    def get_external_tables(self) -> Sequence[ExternalTable]:
+        return self.__external_tables
+
+    def add_external_table(self, table: ExternalTable) -> None:
+        """
+        Adds a table to be sent to Clickhouse together with the query, so
+        that it can be referenced by its name in the conditions.
+        """
+        self.__external_tables = [*self.__external_tables, table]
+
     def get_final(self) -> bool:
         return self.__final
 
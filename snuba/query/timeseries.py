@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Any, Mapping, Tuple
+from typing import Any, Mapping, Optional, Tuple
 
 from snuba import state
 from snuba.util import parse_datetime
@@ -23,9 +23,16 @@ class TimeSeriesExtensionProcessor(ExtensionQueryProcessor):
 
     @classmethod
     def get_time_limit(
-        cls, timeseries_extension: Mapping[str, Any]
+        cls,
+        timeseries_extension: Mapping[str, Any],
+        request_settings: Optional[RequestSettings] = None,
     ) -> Tuple[datetime, datetime]:
-        max_days, date_align = state.get_configs(
+        config = (
+            request_settings.get_config()
+            if request_settings is not None
+            else state.get_config_snapshot()
+        )
+        max_days, date_align = config.get_configs(
             [("max_days", None), ("date_align_seconds", 1)]
         )
 
@@ -44,7 +51,7 @@ class TimeSeriesExtensionProcessor(ExtensionQueryProcessor):
         extension_data: ExtensionData,
         request_settings: RequestSettings,
     ) -> None:
-        from_date, to_date = self.get_time_limit(extension_data)
+        from_date, to_date = self.get_time_limit(extension_data, request_settings)
         query.set_granularity(extension_data["granularity"])
         query.add_conditions(
             [
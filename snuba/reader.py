@@ -11,11 +11,13 @@ from typing import (
     Iterator,
     Mapping,
     MutableMapping,
+    MutableSequence,
     Optional,
     Pattern,
     Sequence,
     Tuple,
     TypeVar,
+    cast,
 )
 
 if TYPE_CHECKING:
@@ -23,9 +25,18 @@ if TYPE_CHECKING:
 
     Column = TypedDict("Column", {"name": str, "type": str})
     Row = MutableMapping[str, Any]
+    # A result contains either row oriented ``data`` or, when it was
+    # requested in columnar form, a sequence of values for each column in
+    # ``meta`` (in the same order) as ``columns``. Totals are always
+    # represented as a row.
     Result = TypedDict(
         "Result",
-        {"meta": Sequence[Column], "data": Sequence[Row], "totals": Row},
+        {
+            "meta": Sequence[Column],
+            "data": Sequence[Row],
+            "columns": MutableSequence[Sequence[Any]],
+            "totals": Row,
+        },
         total=False,
     )
 else:
@@ -39,6 +50,32 @@ def iterate_rows(result: Result) -> Iterator[Row]:
         return iter(result["data"])
 
 
+def is_columnar(result: Mapping[str, Any]) -> bool:
+    return "columns" in result
+
+
+def get_row_count(result: Result) -> int:
+    if is_columnar(result):
+        columns = result["columns"]
+        return len(columns[0]) if columns else 0
+    else:
+        return len(result["data"])
+
+
+def pivot_result(result: Result) -> Result:
+    """
+    Converts a columnar result into a row oriented result. Results that are
+    already row oriented are returned unchanged.
+    """
+    if not is_columnar(result):
+        return result
+
+    names = [column["name"] for column in result["meta"]]
+    pivoted = cast(Result, {k: v for k, v in result.items() if k != "columns"})
+    pivoted["data"] = [dict(zip(names, values)) for values in zip(*result["columns"])]
+    return pivoted
+
+
 NULLABLE_RE = re.compile(r"^Nullable\((.+)\)$")
 
 
@@ -75,28 +112,43 @@ def build_result_transformer(
     transformation function specified for their data type.
     """
 
-    def transform_result(result: Result) -> None:
-        for column in result["meta"]:
-            is_nullable, type = unwrap_nullable_type(column["type"])
-
-            transformer = next(
-                (
-                    transformer
-                    for pattern, transformer in column_transformations
-                    if pattern.match(type)
-                ),
-                None,
-            )
+    def get_transformer(column: Column) -> Optional[Callable[[Any], Any]]:
+        is_nullable, type = unwrap_nullable_type(column["type"])
+
+        transformer = next(
+            (
+                transformer
+                for pattern, transformer in column_transformations
+                if pattern.match(type)
+            ),
+            None,
+        )
 
+        if transformer is not None and is_nullable:
+            transformer = transform_nullable(transformer)
+
+        return transformer
+
+    def transform_result(result: Result) -> None:
+        columnar = is_columnar(result)
+        for index, column in enumerate(result["meta"]):
+            transformer = get_transformer(column)
             if transformer is None:
                 continue
 
-            if is_nullable:
-                transformer = transform_nullable(transformer)
-
             name = column["name"]
-            for row in iterate_rows(result):
-                row[name] = transformer(row[name])
+            if columnar:
+                # Columnar results are transformed in a single pass over the
+                # values of each column, avoiding per-row key lookups.
+                result["columns"][index] = [
+                    transformer(value) for value in result["columns"][index]
+                ]
+                if "totals" in result:
+                    totals = result["totals"]
+                    totals[name] = transformer(totals[name])
+            else:
+                for row in iterate_rows(result):
+                    row[name] = transformer(row[name])
 
     return transform_result
 
@@ -112,6 +164,10 @@ class Reader(ABC, Generic[TQuery]):
         settings: Optional[Mapping[str, str]] = None,
         query_id: Optional[str] = None,
         with_totals: bool = False,
+        columnar: bool = False,
     ) -> Result:
-        """Execute a query."""
+        """
+        Execute a query. If ``columnar`` is set, the result will contain
+        ``columns`` rather than row oriented ``data``.
+        """
         raise NotImplementedError
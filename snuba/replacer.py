@@ -1,10 +1,12 @@
 import logging
 import time
-import simplejson as json
-
-from typing import Optional, Sequence
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Deque, MutableMapping, MutableSequence, Optional, Sequence
 
+from snuba import settings, state
 from snuba.clickhouse.native import ClickhousePool
+from snuba.consumers.decoders import get_payload_decoder
 from snuba.datasets.storage import WritableTableStorage
 from snuba.processor import InvalidMessageVersion
 from snuba.replacers.replacer_processor import Replacement, ReplacementMessage
@@ -19,18 +21,34 @@ logger = logging.getLogger("snuba.replacer")
 
 class ReplacerWorker(AbstractBatchWorker[KafkaPayload, Replacement]):
     def __init__(
-        self, clickhouse: ClickhousePool, storage: WritableTableStorage, metrics: MetricsBackend
+        self,
+        clickhouse: ClickhousePool,
+        storage: WritableTableStorage,
+        metrics: MetricsBackend,
+        payload_decoder: Optional[str] = None,
+        max_workers: int = settings.REPLACER_MAX_WORKERS,
     ) -> None:
         self.clickhouse = clickhouse
         self.metrics = metrics
-        processor = storage.get_table_writer().get_replacer_processor()
+        self.__max_workers = max_workers
+        # The threads are only started once replacements are run concurrently.
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="replacer"
+        )
+        table_writer = storage.get_table_writer()
+        self.__decode = get_payload_decoder(
+            payload_decoder
+            if payload_decoder is not None
+            else table_writer.get_stream_loader().get_payload_decoder()
+        )
+        processor = table_writer.get_replacer_processor()
         assert (
             processor
         ), f"This storage writer does not support replacements {type(storage)}"
         self.__replacer_processor = processor
 
     def process_message(self, message: Message[KafkaPayload]) -> Optional[Replacement]:
-        seq_message = json.loads(message.payload.value)
+        seq_message = self.__decode(message.payload.value)
         version = seq_message[0]
 
         if version == 2:
@@ -41,27 +59,101 @@ class ReplacerWorker(AbstractBatchWorker[KafkaPayload, Replacement]):
             raise InvalidMessageVersion("Unknown message format: " + str(seq_message))
 
     def flush_batch(self, batch: Sequence[Replacement]) -> None:
-        for replacement in batch:
-            query_args = {
-                **replacement.query_args,
-                "dist_read_table_name": self.__replacer_processor.get_read_schema().get_table_name(),
-                "dist_write_table_name": self.__replacer_processor.get_write_schema().get_table_name(),
-            }
+        replacements = self.__replacer_processor.coalesce_replacements(batch)
+        if len(replacements) < len(batch):
+            # Every replacement that is coalesced saves both of its queries.
+            self.metrics.increment(
+                "replacements.coalesced", len(batch) - len(replacements)
+            )
+
+        # The count query scans every row replaced by the insert a second
+        # time. It is only used to skip replacements that match no rows and
+        # to report how many rows were replaced, so it can be skipped.
+        skip_count = bool(state.get_config("replacer_skip_count_query", 0))
+
+        concurrency = min(
+            int(state.get_config("replacer_concurrency") or 1), self.__max_workers
+        )
+
+        replacements_by_project: MutableMapping[
+            Optional[int], MutableSequence[Replacement]
+        ] = {}
+        for replacement in replacements:
+            replacements_by_project.setdefault(
+                self.__replacer_processor.get_project_id(replacement), []
+            ).append(replacement)
+
+        if (
+            concurrency <= 1
+            or len(replacements_by_project) <= 1
+            or None in replacements_by_project
+        ):
+            self.__run_replacements(replacements, skip_count)
+            return
+
+        # The replacements of each project are run in order, but replacements
+        # of different projects are run concurrently by up to ``concurrency``
+        # workers, each one taking the next project as soon as it is done
+        # with the previous one.
+        pending: Deque[Sequence[Replacement]] = deque(replacements_by_project.values())
+
+        def run_projects() -> None:
+            while True:
+                try:
+                    project_replacements = pending.popleft()
+                except IndexError:
+                    return
+                self.__run_replacements(project_replacements, skip_count)
+
+        futures = [
+            self.__executor.submit(run_projects)
+            for _ in range(min(concurrency, len(pending)))
+        ]
+
+        # The batch (and its offsets) is only committed if every replacement
+        # succeeded, otherwise it is retried once all of the replacements that
+        # are running have completed.
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def close(self) -> None:
+        self.__executor.shutdown()
+
+    def __run_replacements(
+        self, replacements: Sequence[Replacement], skip_count: bool
+    ) -> None:
+        for replacement in replacements:
+            self.__run_replacement(replacement, skip_count)
+
+    def __run_replacement(self, replacement: Replacement, skip_count: bool) -> None:
+        query_args = {
+            **replacement.query_args,
+            "dist_read_table_name": self.__replacer_processor.get_read_schema().get_table_name(),
+            "dist_write_table_name": self.__replacer_processor.get_write_schema().get_table_name(),
+        }
+        count: Optional[int]
+        if skip_count:
+            count = None
+        else:
             count = self.clickhouse.execute_robust(
                 replacement.count_query_template % query_args
             )[0][0]
             if count == 0:
-                continue
+                return
 
-            self.__replacer_processor.pre_replacement(replacement, count)
+        self.__replacer_processor.pre_replacement(replacement, count)
 
-            t = time.time()
-            query = replacement.insert_query_template % query_args
-            logger.debug("Executing replace query: %s" % query)
-            self.clickhouse.execute_robust(query)
-            duration = int((time.time() - t) * 1000)
+        t = time.time()
+        query = replacement.insert_query_template % query_args
+        logger.debug("Executing replace query: %s" % query)
+        self.clickhouse.execute_robust(query)
+        duration = int((time.time() - t) * 1000)
 
-            self.__replacer_processor.post_replacement(replacement, duration, count)
+        self.__replacer_processor.post_replacement(replacement, duration, count)
+        if count is not None:
             logger.info("Replacing %s rows took %sms" % (count, duration))
             self.metrics.timing("replacements.count", count)
-            self.metrics.timing("replacements.duration", duration)
+        else:
+            logger.info("Replacing rows took %sms" % duration)
+        self.metrics.timing("replacements.duration", duration)
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any, Mapping, NamedTuple, Optional
+from typing import Any, Mapping, NamedTuple, Optional, Sequence
 
 from snuba.datasets.schemas.tables import TableSchema, WritableTableSchema
 
@@ -51,15 +51,37 @@ class ReplacerProcessor(ABC):
     def get_read_schema(self) -> TableSchema:
         return self.__read_schema
 
-    def pre_replacement(self, replacement: Replacement, matching_records: int) -> None:
+    def get_project_id(self, replacement: Replacement) -> Optional[int]:
+        """
+        Returns the project whose rows are replaced. Replacements of different
+        projects never replace the same rows, so they can be run concurrently.
+        If any replacement of a batch has no project, the batch is run in
+        order.
+        """
+        return None
+
+    def coalesce_replacements(
+        self, replacements: Sequence[Replacement]
+    ) -> Sequence[Replacement]:
+        """
+        Merges the replacements of a batch that can be run as a single one,
+        returning the replacements to run in order. The result must be the
+        same as running every replacement of the batch in order.
+        """
+        return replacements
+
+    def pre_replacement(
+        self, replacement: Replacement, matching_records: Optional[int]
+    ) -> None:
         """
         Custom actions to run before the replacements when we already know how
-        many rows will be impacted.
+        many rows will be impacted. The number of rows is None when it was not
+        counted, in which case the replacement may not impact any row.
         """
         pass
 
     def post_replacement(
-        self, replacement: Replacement, duration: int, matching_records: int
+        self, replacement: Replacement, duration: int, matching_records: Optional[int]
     ) -> None:
         """
         Custom actions to run after the replacement was executed.
@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
 
-from typing import Sequence
+from typing import Optional, Sequence
 
-from snuba.state.rate_limit import get_global_rate_limit_params, RateLimitParameters
+from snuba.state import ConfigSnapshot, get_config_snapshot
+from snuba.state.rate_limit import (
+    get_global_rate_limit_params,
+    RateLimitParameters,
+    SharedRateLimits,
+)
 
 
 class RequestSettings(ABC):
@@ -14,8 +19,28 @@ class RequestSettings(ABC):
 
     They can indirectly affect the SQL statement that will be formed. For example, `turbo` affects
     the formation of the query for projects, but it doesn't appear in the SQL statement.
+
+    The settings also carry a snapshot of the runtime configuration, which should be
+    used for any configuration lookups while processing the request.
     """
 
+    def __init__(self) -> None:
+        self.__config = get_config_snapshot()
+        self.__shared_rate_limits: Optional[SharedRateLimits] = None
+
+    def get_config(self) -> ConfigSnapshot:
+        return self.__config
+
+    def get_shared_rate_limits(self) -> Optional[SharedRateLimits]:
+        return self.__shared_rate_limits
+
+    def set_shared_rate_limits(self, shared_rate_limits: SharedRateLimits) -> None:
+        """
+        Makes the queries run for this request (and any copies of it) count
+        towards the rate limits only once, see ``SharedRateLimits``.
+        """
+        self.__shared_rate_limits = shared_rate_limits
+
     @abstractmethod
     def get_turbo(self) -> bool:
         pass
@@ -47,10 +72,11 @@ class HTTPRequestSettings(RequestSettings):
     def __init__(
         self, turbo: bool = False, consistent: bool = False, debug: bool = False
     ) -> None:
+        super().__init__()
         self.__turbo = turbo
         self.__consistent = consistent
         self.__debug = debug
-        self.__rate_limit_params = [get_global_rate_limit_params()]
+        self.__rate_limit_params = [get_global_rate_limit_params(self.get_config())]
 
     def get_turbo(self) -> bool:
         return self.__turbo
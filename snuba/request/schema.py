@@ -3,7 +3,7 @@ from __future__ import annotations
 import itertools
 import uuid
 
-from typing import Any, Mapping, Type
+from typing import Any, Mapping, MutableMapping, Tuple, Type
 
 from snuba.datasets.dataset import Dataset
 from snuba.query.extensions import QueryExtension
@@ -15,7 +15,7 @@ from snuba.request.request_settings import (
     RequestSettings,
     SubscriptionRequestSettings,
 )
-from snuba.schemas import Schema, validate_jsonschema
+from snuba.schemas import Schema, build_validator
 
 
 class RequestSchema:
@@ -66,6 +66,7 @@ class RequestSchema:
                 ] = definition_schema
 
         self.__composite_schema["required"] = set(self.__composite_schema["required"])
+        self.__validate = build_validator(self.__composite_schema)
 
     @classmethod
     def build_with_extensions(
@@ -82,7 +83,7 @@ class RequestSchema:
         return cls(generic_schema, settings_schema, extensions_schemas, settings_class)
 
     def validate(self, value, dataset: Dataset, referrer: str) -> Request:
-        value = validate_jsonschema(value, self.__composite_schema)
+        value = self.__validate(value)
 
         query_body = {
             key: value.pop(key)
@@ -103,9 +104,10 @@ class RequestSchema:
                 if key in value
             }
 
-        query = parse_query(query_body, dataset)
+        request_settings = self.__setting_class(**settings)
+        query = parse_query(query_body, dataset, request_settings.get_config())
         request_id = uuid.uuid4().hex
-        return Request(request_id, query, self.__setting_class(**settings), extensions, referrer)
+        return Request(request_id, query, request_settings, extensions, referrer)
 
     def __generate_template_impl(self, schema) -> Any:
         """
@@ -152,3 +154,25 @@ SETTINGS_SCHEMAS: Mapping[Type[RequestSettings], Schema] = {
         "additionalProperties": False,
     },
 }
+
+
+REQUEST_SCHEMAS: MutableMapping[
+    Tuple[Dataset, Type[RequestSettings]], RequestSchema
+] = {}
+
+
+def get_request_schema(
+    dataset: Dataset, settings_class: Type[RequestSettings]
+) -> RequestSchema:
+    """
+    Returns the schema of the requests to a dataset. The schema (and its
+    validator) is only built the first time it is requested, and is then
+    reused for every request with the same settings.
+    """
+    key = (dataset, settings_class)
+    schema = REQUEST_SCHEMAS.get(key)
+    if schema is None:
+        schema = REQUEST_SCHEMAS[key] = RequestSchema.build_with_extensions(
+            dataset.get_extensions(), settings_class
+        )
+    return schema
@@ -1,6 +1,6 @@
 import copy
 from datetime import datetime, timedelta
-from typing import Any, Mapping
+from typing import Any, Callable, Mapping
 
 import jsonschema
 
@@ -36,43 +36,72 @@ def get_time_series_extension_properties(
 Schema = Mapping[str, Any]  # placeholder for JSON schema
 
 
+def _is_array(checker: Any, instance: Any) -> bool:
+    return isinstance(instance, (list, tuple))
+
+
+_validate_properties = jsonschema.Draft6Validator.VALIDATORS["properties"]
+
+
+def _validate_and_default(validator, properties, instance, schema):
+    for property, subschema in properties.items():
+        if "default" in subschema:
+            if callable(subschema["default"]):
+                instance.setdefault(property, subschema["default"]())
+            else:
+                instance.setdefault(property, copy.deepcopy(subschema["default"]))
+
+    for error in _validate_properties(validator, properties, instance, schema):
+        yield error
+
+
+# Extending a validator class is expensive, so the classes are only created
+# once rather than every time a value is validated.
+DefaultingValidator = jsonschema.validators.extend(
+    jsonschema.Draft4Validator,
+    {"properties": _validate_and_default},
+    type_checker=jsonschema.Draft4Validator.TYPE_CHECKER.redefine("array", _is_array),
+)
+
+Validator = jsonschema.validators.extend(
+    jsonschema.Draft6Validator,
+    type_checker=jsonschema.Draft6Validator.TYPE_CHECKER.redefine("array", _is_array),
+)
+
+
+def build_validator(schema: Schema, set_defaults: bool = True) -> Callable[[Any], Any]:
+    """
+    Builds a function that validates a value against the provided schema,
+    returning the validated value if the value conforms to the schema,
+    otherwise raising a ``jsonschema.ValidationError``.
+
+    Building the validator is more expensive than validating most values, so
+    the function should be reused for schemas that are validated repeatedly.
+    The validator can be shared between threads, since the schemas only
+    contain references within the same document, which are resolved the
+    same way regardless of the current resolution scope.
+    """
+    validator = (DefaultingValidator if set_defaults else Validator)(
+        schema, format_checker=jsonschema.FormatChecker(),
+    )
+
+    def validate(value: Any) -> Any:
+        # Using schema defaults during validation will cause the input value
+        # to be mutated, so to be on the safe side we create a deep copy of
+        # that value to avoid unwanted side effects for the calling function.
+        if set_defaults:
+            value = copy.deepcopy(value)
+
+        validator.validate(value)
+        return value
+
+    return validate
+
+
 def validate_jsonschema(value, schema, set_defaults=True):
     """
     Validates a value against the provided schema, returning the validated
     value if the value conforms to the schema, otherwise raising a
     ``jsonschema.ValidationError``.
     """
-    orig = jsonschema.Draft6Validator.VALIDATORS["properties"]
-
-    def validate_and_default(validator, properties, instance, schema):
-        for property, subschema in properties.items():
-            if "default" in subschema:
-                if callable(subschema["default"]):
-                    instance.setdefault(property, subschema["default"]())
-                else:
-                    instance.setdefault(property, copy.deepcopy(subschema["default"]))
-
-        for error in orig(validator, properties, instance, schema):
-            yield error
-
-    # Using schema defaults during validation will cause the input value to be
-    # mutated, so to be on the safe side we create a deep copy of that value to
-    # avoid unwanted side effects for the calling function.
-    if set_defaults:
-        value = copy.deepcopy(value)
-
-    validator_cls = (
-        jsonschema.validators.extend(
-            jsonschema.Draft4Validator, {"properties": validate_and_default}
-        )
-        if set_defaults
-        else jsonschema.Draft6Validator
-    )
-
-    validator_cls(
-        schema,
-        types={"array": (list, tuple)},
-        format_checker=jsonschema.FormatChecker(),
-    ).validate(value, schema)
-
-    return value
+    return build_validator(schema, set_defaults)(value)
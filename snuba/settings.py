@@ -37,6 +37,10 @@ REDIS_PASSWORD = None
 REDIS_DB = 1
 
 USE_RESULT_CACHE = False
+# Maximum size (in values, the number of rows times the number of columns of
+# each result) of the in-process cache that is kept in front of the Redis
+# result cache. Set to 0 to disable it.
+RESULT_CACHE_LOCAL_MAX_SIZE = 1000000
 
 # Query Recording Options
 RECORD_QUERIES = False
@@ -44,6 +48,14 @@ QUERIES_TOPIC = "snuba-queries"
 
 # Runtime Config Options
 CONFIG_MEMOIZE_TIMEOUT = 10
+# Keep a local copy of the runtime configuration that is updated when it is
+# changed (instead of polling it every CONFIG_MEMOIZE_TIMEOUT seconds), and
+# how often that copy is checked against Redis in case a change was missed.
+# This requires a thread and a Redis connection in every process that reads
+# the configuration (started when it is first read), so it should only be
+# enabled for processes that read it often, such as the API.
+CONFIG_SUBSCRIBER_ENABLED = False
+CONFIG_RECONCILIATION_INTERVAL = 60
 
 # Sentry Options
 SENTRY_DSN = None
@@ -65,13 +77,26 @@ DEFAULT_MAX_BATCH_TIME_MS = 2 * 1000
 DEFAULT_QUEUED_MAX_MESSAGE_KBYTES = 10000
 DEFAULT_QUEUED_MIN_MESSAGES = 10000
 DISCARD_OLD_EVENTS = True
-CLICKHOUSE_HTTP_CHUNK_SIZE = 1
+# Rows are sent to ClickHouse in chunks of whichever of these limits (in rows
+# and in bytes) is reached first. Zero disables that limit.
+CLICKHOUSE_HTTP_CHUNK_SIZE = 0
+CLICKHOUSE_HTTP_CHUNK_BYTES = 64 * 1024
+# The Content-Encoding used to compress insert requests ("gzip" or "deflate"),
+# or None to send them uncompressed.
+CLICKHOUSE_HTTP_COMPRESSION = None
+# The format rows are inserted in by the consumers, either "JSONEachRow" or
+# "RowBinary" (for storages where all of the columns can be encoded as such.)
+CLICKHOUSE_INSERT_FORMAT = "JSONEachRow"
 
 DEFAULT_RETENTION_DAYS = 90
 RETENTION_OVERRIDES: Mapping[int, int] = {}
 
 MAX_PREWHERE_CONDITIONS = 1
 
+# Maximum number of concurrent queries per process issued when time splitting
+# queries with the ``split_parallelism`` runtime option enabled.
+SPLIT_MAX_WORKERS = 8
+
 STATS_IN_RESPONSE = False
 
 PAYLOAD_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -83,6 +108,25 @@ REPLACER_MAX_MEMORY_USAGE = 10 * (1024 ** 3)  # 10GB
 # to queries.
 REPLACER_KEY_TTL = 12 * 60 * 60
 REPLACER_MAX_GROUP_IDS_TO_EXCLUDE = 256
+# Queries that exclude more than REPLACER_MAX_GROUP_IDS_TO_EXCLUDE groups
+# send up to this many of them to ClickHouse as an external table (rather
+# than formatting them into the query) before falling back to FINAL. The
+# runtime config ``max_group_ids_exclude_external`` overrides it.
+REPLACER_MAX_GROUP_IDS_TO_EXCLUDE_EXTERNAL = 0
+# Whether the replacer also appends the query time flags it sets to a Redis
+# stream (which requires Redis 5), so that the API can keep a local copy of
+# them instead of reading them from Redis on every query once the runtime
+# config ``use_local_replacement_flags`` is set. The stream has to retain
+# the flags of at least REPLACER_KEY_TTL before the local copy is used.
+REPLACER_FLAGS_STREAM_ENABLED = False
+REPLACER_FLAGS_STREAM_MAX_LENGTH = 1000000
+# Consecutive replacements of the same project are coalesced into a single
+# one as long as it does not replace more than this many groups.
+REPLACER_MAX_GROUP_IDS_TO_COALESCE = 1000
+# The maximum number of projects the replacer can run replacements for
+# concurrently. How many it actually does is set by the runtime config
+# ``replacer_concurrency``, which defaults to one (running them in order.)
+REPLACER_MAX_WORKERS = 8
 
 TURBO_SAMPLE_RATE = 0.1
 
@@ -3,6 +3,9 @@ TESTING = True
 REDIS_DB = 2
 STATS_IN_RESPONSE = True
 CONFIG_MEMOIZE_TIMEOUT = 0
+CONFIG_SUBSCRIBER_ENABLED = False
 
 RECORD_QUERIES = True
 USE_RESULT_CACHE = True
+# The local result cache outlives the Redis flush between tests.
+RESULT_CACHE_LOCAL_MAX_SIZE = 0
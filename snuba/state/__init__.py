@@ -2,6 +2,8 @@ from __future__ import absolute_import
 
 from confluent_kafka import Producer
 from contextlib import contextmanager
+import bisect
+import itertools
 import logging
 import random
 import re
@@ -9,10 +11,20 @@ import simplejson as json
 import time
 import uuid
 from functools import partial
-from typing import Any, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from snuba import settings
 from snuba.redis import redis_client as rds
+from snuba.state.subscriber import VersionedValueSubscriber
 
 
 logger = logging.getLogger("snuba.state")
@@ -25,6 +37,8 @@ config_hash = "snuba-config"
 config_history_hash = "snuba-config-history"
 config_changes_list = "snuba-config-changes"
 config_changes_list_limit = 25
+config_version_key = "snuba-config-version"
+config_changes_channel = "snuba-config-changes-channel"
 queries_list = "snuba-queries"
 
 # Rate Limiting and Deduplication
@@ -96,15 +110,17 @@ class memoize:
 
     def __init__(self, timeout: int = 1) -> None:
         self.timeout = timeout
-        self.saved = None
-        self.at = 0
+        # The saved value and the time it was saved at are replaced together
+        # so that concurrent callers never observe one without the other.
+        self.saved: Optional[Tuple[Any, float]] = None
 
     def __call__(self, func):
         def wrapper():
             now = time.time()
-            if now > self.at + self.timeout or self.saved is None:
-                self.saved, self.at = func(), now
-            return self.saved
+            saved = self.saved
+            if saved is None or now > saved[1] + self.timeout:
+                saved = self.saved = (func(), now)
+            return saved[0]
 
         return wrapper
 
@@ -122,6 +138,40 @@ def numeric(value: Optional[Any]) -> Optional[Any]:
 ABTEST_RE = re.compile("(?:(-?\d+\.?\d*)(?:\:(\d+))?\/?)")
 
 
+class ABTest:
+    """
+    A set of weighted values, one of which is chosen at random (according to
+    its weight) each time the test is drawn.
+    """
+
+    def __init__(self, values: Sequence[Any], weights: Sequence[int]) -> None:
+        self.__values = values
+        self.__cumulative_weights = list(itertools.accumulate(weights))
+
+    def draw(self) -> Any:
+        r = random.randint(1, self.__cumulative_weights[-1])
+        return self.__values[bisect.bisect_left(self.__cumulative_weights, r)]
+
+
+def parse_abtest(value: Optional[Any]) -> Optional[Any]:
+    """
+    Returns an ``ABTest`` if the value is in the format recognized by
+    ``abtest``, otherwise returns the value unchanged.
+    """
+    if isinstance(value, str) and ABTEST_RE.match(value):
+        values = ABTEST_RE.findall(value)
+        return ABTest(
+            [numeric(v) for (v, _) in values],
+            [int(weight or 1) for (_, weight) in values],
+        )
+    else:
+        return value
+
+
+def resolve(value: Optional[Any]) -> Optional[Any]:
+    return value.draw() if isinstance(value, ABTest) else value
+
+
 def abtest(value: Optional[Any]) -> Optional[Any]:
     """
     Recognizes a value that consists of a '/'-separated sequence of
@@ -132,17 +182,50 @@ def abtest(value: Optional[Any]) -> Optional[Any]:
     1000:1/2000:1 => returns 1000 or 2000 with equal weight
     1000:2/2000:1 => returns 1000 twice as often as 2000
     """
-    if isinstance(value, str) and ABTEST_RE.match(value):
-        values = ABTEST_RE.findall(value)
-        total_weight = sum(int(weight or 1) for (_, weight) in values)
-        r = random.randint(1, total_weight)
-        i = 0
-        for (v, weight) in values:
-            i += int(weight or 1)
-            if i >= r:
-                return numeric(v)
-    else:
-        return value
+    return resolve(parse_abtest(value))
+
+
+class ConfigSnapshot:
+    """
+    A view of the runtime configuration at the time it was created, so that a
+    single request can consistently read the configuration without fetching
+    or parsing it more than once. Each A/B test value is drawn only once per
+    snapshot (the first time it is read), so all reads of the same key return
+    the same value.
+
+    Snapshots are immutable (the values drawn are never observably changed),
+    so copying one returns the same snapshot. This keeps copies of a request
+    consistent with each other, and avoids copying the configuration.
+    """
+
+    def __init__(self, parsed_configs: Mapping[str, Optional[Any]]) -> None:
+        self.__parsed_configs = parsed_configs
+        self.__resolved_configs: MutableMapping[str, Optional[Any]] = {}
+
+    def __copy__(self) -> "ConfigSnapshot":
+        return self
+
+    def __deepcopy__(self, memo: MutableMapping[int, Any]) -> "ConfigSnapshot":
+        return self
+
+    def get_config(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        if key not in self.__parsed_configs:
+            return default
+
+        try:
+            return self.__resolved_configs[key]
+        except KeyError:
+            return self.__resolved_configs.setdefault(
+                key, resolve(self.__parsed_configs[key])
+            )
+
+    def get_configs(
+        self, key_defaults: Iterable[Tuple[str, Optional[Any]]]
+    ) -> Sequence[Optional[Any]]:
+        return [self.get_config(k, d) for k, d in key_defaults]
+
+    def get_all_configs(self) -> Mapping[str, Optional[Any]]:
+        return {k: self.get_config(k) for k in self.__parsed_configs}
 
 
 def set_config(key: str, value: Optional[Any], user: Optional[str] = None) -> None:
@@ -163,6 +246,7 @@ def set_config(key: str, value: Optional[Any], user: Optional[str] = None) -> No
             rds.hset(config_history_hash, key, json.dumps(change_record))
         rds.lpush(config_changes_list, json.dumps((key, change_record)))
         rds.ltrim(config_changes_list, 0, config_changes_list_limit)
+        config_subscriber.notify()
     except Exception as ex:
         logger.exception(ex)
 
@@ -186,18 +270,71 @@ def get_configs(
 
 
 def get_all_configs() -> Mapping[str, Optional[Any]]:
-    return {k: abtest(v) for k, v in get_raw_configs().items()}
+    return {k: resolve(v) for k, v in get_parsed_configs().items()}
+
+
+def get_config_snapshot() -> ConfigSnapshot:
+    return ConfigSnapshot(get_parsed_configs())
+
+
+# The raw configuration that was last parsed, and the result of parsing it.
+_parsed_configs: Tuple[Optional[Mapping[str, Optional[Any]]], Mapping[str, Any]] = (
+    None,
+    {},
+)
+
+
+def get_parsed_configs() -> Mapping[str, Optional[Any]]:
+    """
+    Returns the runtime configuration with any A/B test values parsed. The
+    configuration is only parsed again when ``get_raw_configs`` returns a new
+    value.
+    """
+    global _parsed_configs
+    raw_configs = get_raw_configs()
+    source, parsed_configs = _parsed_configs
+    if source is not raw_configs:
+        parsed_configs = {k: parse_abtest(v) for k, v in raw_configs.items()}
+        _parsed_configs = (raw_configs, parsed_configs)
+    return parsed_configs
+
+
+def load_raw_configs() -> Mapping[str, Optional[Any]]:
+    all_configs = rds.hgetall(config_hash)
+    return {
+        k.decode("utf-8"): numeric(v.decode("utf-8"))
+        for k, v in all_configs.items()
+        if v is not None
+    }
+
+
+config_subscriber: VersionedValueSubscriber[
+    Mapping[str, Optional[Any]]
+] = VersionedValueSubscriber(
+    rds,
+    config_changes_channel,
+    config_version_key,
+    load_raw_configs,
+    settings.CONFIG_RECONCILIATION_INTERVAL,
+)
 
 
 @memoize(settings.CONFIG_MEMOIZE_TIMEOUT)
+def poll_raw_configs() -> Mapping[str, Optional[Any]]:
+    return load_raw_configs()
+
+
 def get_raw_configs() -> Mapping[str, Optional[Any]]:
+    """
+    Returns the runtime configuration. When the config subscriber is enabled
+    this is a local copy that is updated as soon as the configuration is
+    changed, otherwise the configuration is polled from Redis.
+    """
     try:
-        all_configs = rds.hgetall(config_hash)
-        return {
-            k.decode("utf-8"): numeric(v.decode("utf-8"))
-            for k, v in all_configs.items()
-            if v is not None
-        }
+        if settings.CONFIG_SUBSCRIBER_ENABLED:
+            return config_subscriber.get()
+        else:
+            return poll_raw_configs()
     except Exception as ex:
         logger.exception(ex)
         return {}
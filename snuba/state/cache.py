@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Generic, Optional, TypeVar
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Generic, Optional, TypeVar
 
 from snuba.redis import RedisClientType
 from snuba.state import get_config
+from snuba.utils.clock import Clock, SystemClock
 from snuba.utils.codecs import Codec
+from snuba.utils.metrics.backends.abstract import MetricsBackend
 
 
 T = TypeVar("T")
@@ -43,3 +48,117 @@ class RedisCache(Cache[T]):
             self.__codec.encode(value),
             ex=get_config("cache_expiry_sec", 1),
         )
+
+
+@dataclass(frozen=True)
+class _MemoryCacheEntry(Generic[T]):
+    value: T
+    size: int
+    expires_at: float
+
+
+class MemoryCache(Cache[T]):
+    """
+    A bounded, thread-safe in-process cache. Entries expire after
+    ``cache_expiry_sec`` seconds (the same runtime setting used by
+    ``RedisCache``), and the least recently used entries are evicted once
+    the combined size of all values, as reported by ``sizer``, exceeds
+    ``max_size``. Values larger than ``max_size`` are never stored.
+
+    Cached values are shared between all callers in the process, so callers
+    must not mutate the values returned by ``get``.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        sizer: Callable[[T], int],
+        metrics: MetricsBackend,
+        clock: Clock = SystemClock(),
+    ) -> None:
+        self.__max_size = max_size
+        self.__sizer = sizer
+        self.__metrics = metrics
+        self.__clock = clock
+
+        self.__lock = Lock()
+        self.__entries: OrderedDict[str, _MemoryCacheEntry[T]] = OrderedDict()
+        self.__size = 0
+
+    def __remove(self, key: str) -> None:
+        entry = self.__entries.pop(key)
+        self.__size -= entry.size
+
+    def get(self, key: str) -> Optional[T]:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry.expires_at <= self.__clock.time():
+                self.__remove(key)
+                self.__metrics.increment("expire")
+                entry = None
+
+            if entry is None:
+                self.__metrics.increment("miss")
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__metrics.increment("hit")
+            return entry.value
+
+    def set(self, key: str, value: T) -> None:
+        size = self.__sizer(value)
+        if size > self.__max_size:
+            self.__metrics.increment("oversize")
+            return
+
+        expires_at = self.__clock.time() + float(get_config("cache_expiry_sec", 1) or 0)
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+            evictions = 0
+            while self.__size + size > self.__max_size:
+                self.__remove(next(iter(self.__entries)))
+                evictions += 1
+
+            self.__entries[key] = _MemoryCacheEntry(value, size, expires_at)
+            self.__size += size
+
+            if evictions:
+                self.__metrics.increment("evict", evictions)
+            self.__metrics.gauge("size", self.__size)
+
+
+class TieredCache(Cache[T]):
+    """
+    Layers a fast (typically in-process) cache in front of a slower, shared
+    cache. Values retrieved from the slower cache are used to populate the
+    faster one so that subsequent requests for the same key can be served
+    without accessing the shared cache.
+
+    The faster cache is populated with a new expiry, regardless of how long
+    the value had already been stored in the slower one. When both caches
+    use the same ``cache_expiry_sec`` setting, a value can be returned for up
+    to twice that long after it was set, so the setting needs to account for
+    it if stale values are a concern.
+    """
+
+    def __init__(self, local: Cache[T], remote: Cache[T]) -> None:
+        self.__local = local
+        self.__remote = remote
+
+    def get(self, key: str) -> Optional[T]:
+        value = self.__local.get(key)
+        if value is not None:
+            return value
+
+        value = self.__remote.get(key)
+        if value is not None:
+            self.__local.set(key, value)
+
+        return value
+
+    def set(self, key: str, value: T) -> None:
+        self.__remote.set(key, value)
+        self.__local.set(key, value)
@@ -0,0 +1,125 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
+
+from snuba.redis import RedisClientType
+from snuba.utils.clock import Clock, SystemClock
+
+
+logger = logging.getLogger("snuba.state.density")
+
+
+@dataclass(frozen=True)
+class _DensityEntry:
+    # The rate is ``None`` if there was no estimate in Redis when it was
+    # fetched (at ``written_at``.)
+    rate: Optional[float]
+    written_at: float
+
+
+class DensityEstimator:
+    """
+    Tracks an estimate of the rate (per second) at which rows occur for a
+    key, such as a set of projects, as an exponentially weighted moving
+    average of the observed row counts over time windows.
+
+    Estimates are kept in a bounded in-process map, and are periodically
+    written to Redis (with an expiry) so that other processes can start from
+    an existing estimate instead of having to learn it from scratch.
+    """
+
+    def __init__(
+        self,
+        client: RedisClientType,
+        prefix: str,
+        max_size: int = 10000,
+        weight: float = 0.5,
+        ttl: int = 24 * 60 * 60,
+        write_interval: int = 60,
+        clock: Clock = SystemClock(),
+    ) -> None:
+        self.__client = client
+        self.__prefix = prefix
+        self.__max_size = max_size
+        self.__weight = weight
+        self.__ttl = ttl
+        self.__write_interval = write_interval
+        self.__clock = clock
+
+        self.__lock = Lock()
+        self.__entries: OrderedDict[str, _DensityEntry] = OrderedDict()
+
+    def __build_key(self, key: str) -> str:
+        return f"{self.__prefix}{key}"
+
+    def __store(self, key: str, entry: _DensityEntry) -> None:
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[float]:
+        """
+        Returns the estimated rate for the key, or ``None`` if there is no
+        estimate available.
+        """
+        now = self.__clock.time()
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+        # Keys without an estimate are remembered as well, so that they are
+        # only fetched again once another process may have written one.
+        if entry is not None and (
+            entry.rate is not None or now - entry.written_at < self.__write_interval
+        ):
+            return entry.rate
+
+        try:
+            value = self.__client.get(self.__build_key(key))
+        except Exception as error:
+            logger.warning("Failed to fetch density estimate: %r", error)
+            return None
+
+        rate = float(value) if value is not None else None
+        self.__store(key, _DensityEntry(rate, now))
+        return rate
+
+    def observe(self, key: str, count: int, seconds: float) -> None:
+        """
+        Record that ``count`` rows were found over a window of ``seconds``.
+        """
+        if seconds <= 0:
+            return
+
+        rate = count / seconds
+        now = self.__clock.time()
+
+        with self.__lock:
+            previous = self.__entries.get(key)
+
+        # A key that is only known to have no estimate starts from scratch.
+        if previous is None or previous.rate is None:
+            previous = None
+            entry = _DensityEntry(rate, now)
+        else:
+            entry = _DensityEntry(
+                self.__weight * rate + (1 - self.__weight) * previous.rate,
+                previous.written_at,
+            )
+
+        write = previous is None or now - previous.written_at >= self.__write_interval
+        if write:
+            entry = _DensityEntry(entry.rate, now)
+
+        self.__store(key, entry)
+
+        if write:
+            try:
+                self.__client.set(
+                    self.__build_key(key), repr(entry.rate), ex=self.__ttl
+                )
+            except Exception as error:
+                logger.warning("Failed to store density estimate: %r", error)
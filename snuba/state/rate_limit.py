@@ -1,21 +1,27 @@
+from __future__ import annotations
+
 from collections import namedtuple, ChainMap
 from contextlib import contextmanager, AbstractContextManager, ExitStack
 from dataclasses import dataclass
 import logging
 import time
+from threading import Lock
 from types import TracebackType
 from typing import (
+    Callable,
     ChainMap as TypingChainMap,
     Iterator,
     Mapping,
     MutableMapping,
+    MutableSequence,
     Optional,
     Sequence,
+    Tuple,
     Type,
 )
 import uuid
 
-from snuba import state
+from snuba import settings, state
 
 logger = logging.getLogger("snuba.state.rate_limit")
 
@@ -53,15 +59,43 @@ class RateLimitStats:
     concurrent: int
 
 
+RateLimitStatsAggregation = Callable[[RateLimitStats, RateLimitStats], RateLimitStats]
+
+
+def max_rate_limit_stats(a: RateLimitStats, b: RateLimitStats) -> RateLimitStats:
+    return RateLimitStats(
+        rate=max(a.rate, b.rate), concurrent=max(a.concurrent, b.concurrent)
+    )
+
+
+def sum_rate_limit_stats(a: RateLimitStats, b: RateLimitStats) -> RateLimitStats:
+    return RateLimitStats(rate=a.rate + b.rate, concurrent=a.concurrent + b.concurrent)
+
+
+RATE_LIMIT_STATS_AGGREGATIONS: Mapping[str, RateLimitStatsAggregation] = {
+    "max": max_rate_limit_stats,
+    "sum": sum_rate_limit_stats,
+}
+
+
 class RateLimitStatsContainer:
     """
     A container to collect stats for all the rate limits that have been run.
+
+    When multiple rate limits with the same name are run (such as one for each
+    project in a query) their stats are combined with the `aggregate` function.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, aggregate: RateLimitStatsAggregation = max_rate_limit_stats
+    ) -> None:
         self.__stats: MutableMapping[str, RateLimitStats] = {}
+        self.__aggregate = aggregate
 
     def add_stats(self, rate_limit_name: str, rate_limit_stats: RateLimitStats) -> None:
+        existing_stats = self.__stats.get(rate_limit_name)
+        if existing_stats is not None:
+            rate_limit_stats = self.__aggregate(existing_stats, rate_limit_stats)
         self.__stats[rate_limit_name] = rate_limit_stats
 
     def get_stats(self, rate_limit_name: str) -> Optional[RateLimitStats]:
@@ -87,10 +121,163 @@ class RateLimitStatsContainer:
         return ChainMap(*grouped_stats)
 
 
+# Evaluates a sequence of rate limits for a query, stopping at the first one
+# that is exceeded.
+#
+# KEYS: the rate limit buckets, in the order they are evaluated.
+# ARGV: the history cutoff (exclusive), the start of the lookback window, the
+#       current time (exclusive, the start of the concurrent window), the
+#       score queries are added with while they are running, the score
+#       decrement used to return admitted queries to their start time, the
+#       lookback duration in seconds, followed by the query member, per-second
+#       limit and concurrent limit for each bucket (limits are empty strings
+#       when they are not set.)
+#
+# Returns the (1-based) index of the bucket whose limit was exceeded (or 0 if
+# none were), followed by the historical and concurrent query counts for each
+# bucket that was evaluated.
+RATE_LIMIT_ENTER_SCRIPT = """
+    local history_cutoff = ARGV[1]
+    local lookback_start = ARGV[2]
+    local concurrent_start = ARGV[3]
+    local running_score = ARGV[4]
+    local decrement = ARGV[5]
+    local lookback = tonumber(ARGV[6])
+
+    local result = {0}
+    for i, bucket in ipairs(KEYS) do
+        local member = ARGV[4 + i * 3]
+        local per_second_limit = tonumber(ARGV[5 + i * 3])
+        local concurrent_limit = tonumber(ARGV[6 + i * 3])
+
+        redis.call('zremrangebyscore', bucket, '-inf', history_cutoff)
+        redis.call('zadd', bucket, running_score, member)
+
+        local historical = 0
+        if per_second_limit then
+            historical = redis.call('zcount', bucket, lookback_start, concurrent_start)
+        end
+
+        local concurrent = 0
+        if concurrent_limit then
+            concurrent = redis.call('zcount', bucket, '(' .. concurrent_start, '+inf')
+        end
+
+        table.insert(result, historical)
+        table.insert(result, concurrent)
+
+        if (concurrent_limit and concurrent > concurrent_limit)
+            or (per_second_limit and historical / lookback > per_second_limit)
+        then
+            -- The rejected query is not counted against this bucket, but
+            -- it is still counted towards the history of the buckets that
+            -- admitted it.
+            redis.call('zrem', bucket, member)
+            for j = 1, i - 1 do
+                redis.call('zincrby', KEYS[j], decrement, ARGV[4 + j * 3])
+            end
+            result[1] = i
+            return result
+        end
+    end
+
+    return result
+"""
+
+# Returns finished queries to their start time so that they are counted
+# towards the historical rate rather than the concurrent queries.
+#
+# KEYS: the rate limit buckets.
+# ARGV: the score decrement, followed by the query member for each bucket.
+RATE_LIMIT_EXIT_SCRIPT = """
+    for i, bucket in ipairs(KEYS) do
+        redis.call('zincrby', bucket, ARGV[1], ARGV[i + 1])
+    end
+"""
+
+rate_limit_enter_script = state.rds.register_script(RATE_LIMIT_ENTER_SCRIPT)
+rate_limit_exit_script = state.rds.register_script(RATE_LIMIT_EXIT_SCRIPT)
+
+
+def _format_limit(limit: Optional[float]) -> str:
+    return "" if limit is None else repr(limit)
+
+
+def _enter_rate_limits(
+    buckets: Sequence[str],
+    members: Sequence[str],
+    rate_limit_params: Sequence[RateLimitParameters],
+    now: float,
+    rate_history_s: float,
+) -> Tuple[Optional[int], Sequence[Tuple[int, int]]]:
+    """
+    Adds the query to each bucket (until a limit is exceeded), returning
+    the index of the bucket whose limit was exceeded (or ``None``) and the
+    historical and concurrent query counts for the evaluated buckets.
+    """
+    args = [
+        "({:f}".format(now - rate_history_s),
+        "{:f}".format(now - state.rate_lookback_s),
+        "{:f}".format(now),
+        "{:f}".format(now + state.max_query_duration_s),
+        -float(state.max_query_duration_s),
+        state.rate_lookback_s,
+    ]
+
+    if settings.USE_REDIS_CLUSTER:
+        # Buckets are not guaranteed to be stored on the same node, so each
+        # one has to be evaluated separately.
+        counts: MutableSequence[Tuple[int, int]] = []
+        for i, (bucket, member, params) in enumerate(
+            zip(buckets, members, rate_limit_params)
+        ):
+            rejected, historical, concurrent = rate_limit_enter_script(
+                keys=[bucket],
+                args=[
+                    *args,
+                    member,
+                    _format_limit(params.per_second_limit),
+                    _format_limit(params.concurrent_limit),
+                ],
+            )
+            counts.append((int(historical), int(concurrent)))
+            if rejected:
+                if i > 0:
+                    _exit_rate_limits(buckets[:i], members[:i])
+                return i, counts
+        return None, counts
+
+    for member, params in zip(members, rate_limit_params):
+        args.extend(
+            [
+                member,
+                _format_limit(params.per_second_limit),
+                _format_limit(params.concurrent_limit),
+            ]
+        )
+
+    rejected, *values = rate_limit_enter_script(keys=buckets, args=args)
+    counts = [
+        (int(historical), int(concurrent))
+        for historical, concurrent in zip(values[::2], values[1::2])
+    ]
+    return (rejected - 1 if rejected else None), counts
+
+
+def _exit_rate_limits(buckets: Sequence[str], members: Sequence[str]) -> None:
+    decrement = -float(state.max_query_duration_s)
+    if settings.USE_REDIS_CLUSTER:
+        for bucket, member in zip(buckets, members):
+            rate_limit_exit_script(keys=[bucket], args=[decrement, member])
+    else:
+        rate_limit_exit_script(keys=buckets, args=[decrement, *members])
+
+
 @contextmanager
-def rate_limit(
-    rate_limit_params: RateLimitParameters,
-) -> Iterator[Optional[RateLimitStats]]:
+def rate_limits(
+    rate_limit_params: Sequence[RateLimitParameters],
+    config: Optional[state.ConfigSnapshot] = None,
+) -> Iterator[Optional[Sequence[RateLimitStats]]]:
     """
     A context manager for rate limiting that allows for limiting based on
     on a rolling-window per-second rate as well as the number of requests
@@ -108,72 +295,70 @@ def rate_limit(
     +-----------------------------+--------------------------------+
                                   ^
                                  now
+
+    All of the rate limits are evaluated (in order) by a single script, and
+    the query is released from all of them by another one when it finishes.
+    Yields the stats for each rate limit, or ``None`` if rate limiting was
+    bypassed or could not be performed.
     """
 
-    bucket = "{}{}".format(state.ratelimit_prefix, rate_limit_params.bucket)
-    query_id = uuid.uuid4()
+    buckets = [
+        "{}{}".format(state.ratelimit_prefix, params.bucket)
+        for params in rate_limit_params
+    ]
+    # Each bucket is given its own member, so that a query which is subject to
+    # multiple limits on the same bucket is counted once for each of them.
+    members = [uuid.uuid4().hex for _ in rate_limit_params]
+
+    if config is None:
+        config = state.get_config_snapshot()
 
     now = time.time()
-    bypass_rate_limit, rate_history_s = state.get_configs(
+    bypass_rate_limit, rate_history_s = config.get_configs(
         [("bypass_rate_limit", 0), ("rate_history_sec", 3600)]
     )
 
-    if bypass_rate_limit == 1:
+    if bypass_rate_limit == 1 or not rate_limit_params:
         yield None
         return
 
-    pipe = state.rds.pipeline(transaction=False)
-    pipe.zremrangebyscore(
-        bucket, "-inf", "({:f}".format(now - rate_history_s)
-    )  # cleanup
-    pipe.zadd(bucket, now + state.max_query_duration_s, query_id)  # add query
-    if rate_limit_params.per_second_limit is None:
-        pipe.exists("nosuchkey")  # no-op if we don't need per-second
-    else:
-        pipe.zcount(bucket, now - state.rate_lookback_s, now)  # get historical
-    if rate_limit_params.concurrent_limit is None:
-        pipe.exists("nosuchkey")  # no-op if we don't need concurrent
-    else:
-        pipe.zcount(bucket, "({:f}".format(now), "+inf")  # get concurrent
-
     try:
-        _, _, historical, concurrent = pipe.execute()
-        historical = int(historical)
-        concurrent = int(concurrent)
+        rejected, counts = _enter_rate_limits(
+            buckets, members, rate_limit_params, now, rate_history_s
+        )
     except Exception as ex:
         logger.exception(ex)
         yield None  # fail open if redis is having issues
         return
 
-    per_second = historical / float(state.rate_lookback_s)
-
-    stats = RateLimitStats(rate=per_second, concurrent=concurrent)
-
-    rate_limit_name = rate_limit_params.rate_limit_name
-
-    Reason = namedtuple("reason", "scope name val limit")
-    reasons = [
-        Reason(
-            rate_limit_name,
-            "concurrent",
-            concurrent,
-            rate_limit_params.concurrent_limit,
-        ),
-        Reason(
-            rate_limit_name,
-            "per-second",
-            per_second,
-            rate_limit_params.per_second_limit,
-        ),
+    stats = [
+        RateLimitStats(
+            rate=historical / float(state.rate_lookback_s), concurrent=concurrent
+        )
+        for historical, concurrent in counts
     ]
 
-    reason = next((r for r in reasons if r.limit is not None and r.val > r.limit), None)
+    if rejected is not None:
+        params = rate_limit_params[rejected]
+        rate_limit_name = params.rate_limit_name
+
+        Reason = namedtuple("reason", "scope name val limit")
+        reasons = [
+            Reason(
+                rate_limit_name,
+                "concurrent",
+                stats[rejected].concurrent,
+                params.concurrent_limit,
+            ),
+            Reason(
+                rate_limit_name,
+                "per-second",
+                stats[rejected].rate,
+                params.per_second_limit,
+            ),
+        ]
 
-    if reason:
-        try:
-            state.rds.zrem(bucket, query_id)  # not allowed / not counted
-        except Exception as ex:
-            logger.exception(ex)
+        reason = next(r for r in reasons if r.limit is not None and r.val > r.limit)
 
         raise RateLimitExceeded(
             "{r.scope} {r.name} of {r.val:.0f} exceeds limit of {r.limit:.0f}".format(
@@ -186,17 +371,33 @@ def rate_limit(
     finally:
         try:
             # return the query to its start time
-            state.rds.zincrby(bucket, query_id, -float(state.max_query_duration_s))
+            _exit_rate_limits(buckets, members)
         except Exception as ex:
             logger.exception(ex)
 
 
-def get_global_rate_limit_params() -> RateLimitParameters:
+@contextmanager
+def rate_limit(
+    rate_limit_params: RateLimitParameters,
+    config: Optional[state.ConfigSnapshot] = None,
+) -> Iterator[Optional[RateLimitStats]]:
+    """
+    A context manager for a single rate limit. See ``rate_limits``.
+    """
+    with rate_limits([rate_limit_params], config) as stats:
+        yield stats[0] if stats is not None else None
+
+
+def get_global_rate_limit_params(
+    config: Optional[state.ConfigSnapshot] = None,
+) -> RateLimitParameters:
     """
     Returns the configuration object for the global rate limit
     """
+    if config is None:
+        config = state.get_config_snapshot()
 
-    (per_second, concurr) = state.get_configs(
+    (per_second, concurr) = config.get_configs(
         [("global_per_second_limit", None), ("global_concurrent_limit", 1000)]
     )
 
@@ -212,20 +413,36 @@ class RateLimitAggregator(AbstractContextManager):
     """
     Runs the rate limits provided by the `rate_limit_params` configuration object.
 
-    It runs the rate limits in the order described by `rate_limit_params`.
+    It runs the rate limits in the order described by `rate_limit_params`, in a
+    single round trip to Redis when the query starts and another one when it
+    finishes.
     """
 
-    def __init__(self, rate_limit_params: Sequence[RateLimitParameters]) -> None:
+    def __init__(
+        self,
+        rate_limit_params: Sequence[RateLimitParameters],
+        config: Optional[state.ConfigSnapshot] = None,
+    ) -> None:
         self.rate_limit_params = rate_limit_params
+        self.config = config if config is not None else state.get_config_snapshot()
         self.stack = ExitStack()
 
     def __enter__(self) -> RateLimitStatsContainer:
-        stats = RateLimitStatsContainer()
+        # Determines how the stats of rate limits that share a name (such as
+        # the limits for each project in the query) are reported.
+        aggregation = self.config.get_config("rate_limit_stats_aggregation", "max")
+        stats = RateLimitStatsContainer(
+            RATE_LIMIT_STATS_AGGREGATIONS.get(aggregation, max_rate_limit_stats)
+        )
 
-        for rate_limit_param in self.rate_limit_params:
-            child_stats = self.stack.enter_context(rate_limit(rate_limit_param))
-            if child_stats:
-                stats.add_stats(rate_limit_param.rate_limit_name, child_stats)
+        child_stats = self.stack.enter_context(
+            rate_limits(self.rate_limit_params, self.config)
+        )
+        if child_stats is not None:
+            for rate_limit_param, rate_limit_stats in zip(
+                self.rate_limit_params, child_stats
+            ):
+                stats.add_stats(rate_limit_param.rate_limit_name, rate_limit_stats)
 
         return stats
 
@@ -236,3 +453,67 @@ class RateLimitAggregator(AbstractContextManager):
         exc_tb: Optional[TracebackType],
     ) -> None:
         self.stack.pop_all().close()
+
+
+class SharedRateLimits(AbstractContextManager):
+    """
+    Runs the rate limits of a request that is executed as several concurrent
+    queries (such as the windows of a parallel time split) once for all of
+    them, so that the request counts as a single query towards its limits.
+
+    The rate limits are entered by the first query that runs, with the
+    parameters of that query, and are held until this context is exited
+    once the request has finished. Copies of a request share the same
+    instance, since copying returns the instance itself.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__aggregator: Optional[RateLimitAggregator] = None
+        self.__stats: Optional[RateLimitStatsContainer] = None
+        self.__error: Optional[RateLimitExceeded] = None
+
+    def __deepcopy__(self, memo: MutableMapping[int, object]) -> SharedRateLimits:
+        return self
+
+    @contextmanager
+    def run(
+        self,
+        rate_limit_params: Sequence[RateLimitParameters],
+        config: Optional[state.ConfigSnapshot] = None,
+    ) -> Iterator[RateLimitStatsContainer]:
+        """
+        Used by each query in place of ``RateLimitAggregator``, which is
+        only entered the first time (and never exited here.)
+        """
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+
+            if self.__stats is None:
+                aggregator = RateLimitAggregator(rate_limit_params, config)
+                try:
+                    self.__stats = aggregator.__enter__()
+                except RateLimitExceeded as error:
+                    # Every other query of the request would be rejected too.
+                    self.__error = error
+                    raise
+                self.__aggregator = aggregator
+
+            stats = self.__stats
+
+        yield stats
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        with self.__lock:
+            aggregator, self.__aggregator = self.__aggregator, None
+            self.__stats = None
+            self.__error = None
+
+        if aggregator is not None:
+            aggregator.__exit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,190 @@
+import logging
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError
+from threading import Lock
+from typing import Callable, Generic, MutableMapping, Tuple, TypeVar
+
+from redis.client import PubSub
+
+from snuba.redis import RedisClientType
+from snuba.state.cache import Cache
+
+
+logger = logging.getLogger("snuba.state.single_flight")
+
+T = TypeVar("T")
+
+
+UNLOCK_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1]
+    then
+        return redis.call('del', KEYS[1])
+    else
+        return 0
+    end
+"""
+
+# Published once the leader has finished, either successfully (after its
+# result has been stored in the cache) or not.
+DONE_MESSAGE = b"done"
+FAILURE_MESSAGE = b"failed"
+
+
+class SingleFlight(Generic[T]):
+    """
+    Ensures that at most one execution of a function for a given key is in
+    progress at any time, and shares the result of that execution with all
+    of the callers that requested the same key while it was running.
+
+    Callers within the same process wait on a future that is resolved by the
+    leading caller. Callers in different processes (that share the same Redis
+    instance) compete for a lock, and those that do not acquire it subscribe
+    to a channel that the leader notifies once it has finished executing,
+    instead of polling the lock. The function is expected to store its
+    result in the cache under the same key, which is where the callers in
+    other processes read it from, so that only a small notification is
+    published regardless of the size of the result.
+
+    If the leader fails (or does not finish before the timeout expires), or
+    its result cannot be found in the cache, one of the waiting callers
+    takes over by acquiring the lock while the rest keep waiting for it.
+    Callers waiting on a leader in the same process do not take over when
+    it is slow, since it is still executing the function: they raise a
+    ``TimeoutError`` instead.
+    """
+
+    def __init__(
+        self, client: RedisClientType, prefix: str, cache: Cache[T], timeout: int = 60,
+    ) -> None:
+        self.__client = client
+        self.__prefix = prefix
+        self.__cache = cache
+        self.__timeout = timeout
+
+        self.__lock = Lock()
+        self.__futures: MutableMapping[str, Future[T]] = {}
+
+    def execute(self, key: str, function: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Execute the function (or wait for the result of an execution already
+        in progress) for the provided key. Returns the result along with a
+        flag indicating whether the result was obtained from an execution
+        started by another caller.
+        """
+        with self.__lock:
+            future = self.__futures.get(key)
+            is_duplicate = future is not None
+            if future is None:
+                future = self.__futures[key] = Future()
+
+        if is_duplicate:
+            try:
+                return future.result(timeout=self.__timeout), True
+            except TimeoutError:
+                raise
+            except Exception:
+                # Only one of the callers waiting on the failed leader takes
+                # over, the others wait for it through the distributed lock.
+                value, _ = self.__execute_distributed(key, function)
+                return value, True
+
+        try:
+            value, is_duplicate = self.__execute_distributed(key, function)
+        except BaseException as error:
+            self.__remove(key)
+            future.set_exception(error)
+            raise
+
+        self.__remove(key)
+        future.set_result(value)
+        return value, is_duplicate
+
+    def __remove(self, key: str) -> None:
+        with self.__lock:
+            del self.__futures[key]
+
+    def __execute_distributed(
+        self, key: str, function: Callable[[], T]
+    ) -> Tuple[T, bool]:
+        lock = f"{self.__prefix}lock:{key}"
+        channel = f"{self.__prefix}result:{key}"
+        nonce = uuid.uuid4().hex
+
+        if self.__acquire(lock, nonce):
+            return self.__lead(lock, channel, nonce, function), False
+
+        pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(channel)
+
+            while True:
+                # The leader may have finished between the last attempt to
+                # acquire the lock and the subscription becoming active, in
+                # which case no notification will ever be received (but its
+                # result may already be in the cache.)
+                if self.__acquire(lock, nonce):
+                    value = self.__cache.get(key)
+                    if value is not None:
+                        self.__release(lock, nonce)
+                        self.__publish(channel, DONE_MESSAGE)
+                        return value, True
+                    break
+
+                if self.__wait(pubsub):
+                    value = self.__cache.get(key)
+                    if value is not None:
+                        return value, True
+        finally:
+            pubsub.close()
+
+        return self.__lead(lock, channel, nonce, function), False
+
+    def __acquire(self, lock: str, nonce: str) -> bool:
+        return bool(self.__client.set(lock, nonce, nx=True, ex=self.__timeout))
+
+    def __lead(
+        self, lock: str, channel: str, nonce: str, function: Callable[[], T]
+    ) -> T:
+        try:
+            value = function()
+        except BaseException:
+            self.__release(lock, nonce)
+            self.__publish(channel, FAILURE_MESSAGE)
+            raise
+
+        # The lock is released before the notification is published: any
+        # caller that subscribes after this point is guaranteed to be able
+        # to acquire the lock itself rather than waiting for a message that
+        # has already been sent.
+        self.__release(lock, nonce)
+        self.__publish(channel, DONE_MESSAGE)
+        return value
+
+    def __release(self, lock: str, nonce: str) -> None:
+        try:
+            self.__client.eval(UNLOCK_SCRIPT, 1, lock, nonce)
+        except Exception as error:
+            logger.warning("Failed to release lock %r: %r", lock, error)
+
+    def __publish(self, channel: str, message: bytes) -> None:
+        try:
+            self.__client.publish(channel, message)
+        except Exception as error:
+            logger.warning("Failed to publish to %r: %r", channel, error)
+
+    def __wait(self, pubsub: PubSub) -> bool:
+        """
+        Waits for the leader to finish, returning whether it succeeded.
+        """
+        deadline = time.time() + self.__timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            message = pubsub.get_message(timeout=remaining)
+            if message is None or message["type"] != "message":
+                continue
+
+            return bool(message["data"] == DONE_MESSAGE)
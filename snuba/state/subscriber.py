@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+import weakref
+from threading import Lock, Thread
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+from snuba.redis import RedisClientType
+
+
+logger = logging.getLogger("snuba.state.subscriber")
+
+T = TypeVar("T")
+
+
+def _version_number(version: Optional[bytes]) -> int:
+    # The version key does not exist until the value is first changed.
+    return int(version) if version is not None else 0
+
+
+class VersionedValueSubscriber(Generic[T]):
+    """
+    Maintains a local copy of a value stored in Redis, such as the runtime
+    configuration, so that reading it does not require a round trip.
+
+    Writers are expected to increment the version key after changing the
+    value and then call ``notify``, which publishes the new version to a
+    channel. Each process runs a background thread subscribed to that
+    channel that reloads the value when a notification is received. The
+    version is also checked every ``reconciliation_interval`` seconds (which
+    only requires a full load when it has changed) as a fallback in case any
+    notifications are missed, such as while reconnecting to Redis.
+
+    The background thread is started lazily on first access (and restarted
+    after a fork) so that it always belongs to the process reading the value.
+    The lock is never held while accessing Redis, and is replaced in the child
+    after a fork, so a fork can never leave it held by a thread that does not
+    exist in the child.
+    """
+
+    def __init__(
+        self,
+        client: RedisClientType,
+        channel: str,
+        version_key: str,
+        load: Callable[[], T],
+        reconciliation_interval: float = 60.0,
+    ) -> None:
+        self.__client = client
+        self.__channel = channel
+        self.__version_key = version_key
+        self.__load = load
+        self.__reconciliation_interval = reconciliation_interval
+
+        self.__lock = Lock()
+        self.__pid: Optional[int] = None
+        # The version and value are replaced together so that readers never
+        # observe a value with the wrong version.
+        self.__state: Optional[Tuple[Optional[bytes], T]] = None
+
+        reference = weakref.ref(self)
+
+        def reset_after_fork() -> None:
+            subscriber = reference()
+            if subscriber is not None:
+                subscriber.__reset()
+
+        os.register_at_fork(after_in_child=reset_after_fork)
+
+    def __reset(self) -> None:
+        # The copy inherited from the parent process is stale, since the
+        # thread that was keeping it up to date was not forked with it.
+        self.__lock = Lock()
+        self.__pid = None
+        self.__state = None
+
+    def get(self) -> T:
+        """
+        Returns the local copy of the value, loading it (and starting the
+        subscriber thread) if this is the first access in this process.
+        """
+        self.__ensure_running()
+        state = self.__state
+        if state is None:
+            # The value is still being loaded by the subscriber thread.
+            self.reload()
+            state = self.__state
+            assert state is not None
+        return state[1]
+
+    def get_nowait(self) -> Optional[T]:
+        """
+        Returns the local copy of the value like ``get``, except that if
+        this is the first access in this process the value is loaded by the
+        subscriber thread instead, and ``None`` is returned until it is.
+        """
+        self.__ensure_running(blocking=False)
+        state = self.__state
+        return state[1] if state is not None else None
+
+    def notify(self) -> None:
+        """
+        Increment the version and notify all subscribers that the value has
+        changed. The local copy is updated immediately so that a change is
+        visible to the process that made it once this returns.
+        """
+        version = self.__client.incr(self.__version_key)
+        self.__client.publish(self.__channel, version)
+        if self.__pid == os.getpid():
+            self.reload()
+
+    def reload(self) -> bool:
+        """
+        Reload the value if the version stored in Redis differs from the
+        version of the local copy. Returns whether the value was reloaded.
+        """
+        # The version is read before the value, so the value that is loaded
+        # is always at least as recent as the version it is recorded with. If
+        # it is more recent, the next notification will cause a redundant (but
+        # harmless) reload.
+        version = self.__client.get(self.__version_key)
+        state = self.__state
+        if state is not None and state[0] == version:
+            return False
+
+        value = self.__load()
+
+        with self.__lock:
+            # Another thread may have loaded a more recent version while this
+            # one was loading, which must not be replaced by an older one.
+            state = self.__state
+            if state is None or _version_number(state[0]) <= _version_number(version):
+                self.__state = (version, value)
+        return True
+
+    def __ensure_running(self, blocking: bool = True) -> None:
+        pid = os.getpid()
+        if self.__pid == pid:
+            return
+
+        # The subscriber thread loads the value as soon as it subscribes.
+        if blocking:
+            self.reload()
+
+        with self.__lock:
+            if self.__pid != pid:
+                Thread(
+                    target=self.__run, name="versioned-value-subscriber", daemon=True
+                ).start()
+                self.__pid = pid
+
+    def __run(self) -> None:
+        while True:
+            try:
+                self.__subscribe()
+            except Exception as error:
+                logger.warning(
+                    "Error in subscription to %r, retrying: %r", self.__channel, error
+                )
+                time.sleep(1)
+
+    def __subscribe(self) -> None:
+        pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.__channel)
+
+            # Any notifications that were published while there was no active
+            # subscription have been missed, so the value may be out of date.
+            self.reload()
+
+            deadline = time.time() + self.__reconciliation_interval
+            while True:
+                message = pubsub.get_message(timeout=max(deadline - time.time(), 0))
+                if message is not None and message["type"] == "message":
+                    self.reload()
+                elif time.time() >= deadline:
+                    self.reload()
+                    deadline = time.time() + self.__reconciliation_interval
+        finally:
+            pubsub.close()
@@ -10,7 +10,7 @@ from snuba.query.query import Aggregation
 from snuba.query.types import Condition
 from snuba.request import Request
 from snuba.request.request_settings import SubscriptionRequestSettings
-from snuba.request.schema import RequestSchema
+from snuba.request.schema import get_request_schema
 from snuba.request.validation import validate_request_content
 from snuba.utils.metrics.timer import Timer
 
@@ -77,9 +77,7 @@ class SubscriptionData:
         :param timestamp: Date that the query should run up until
         :param offset: Maximum offset we should query for
         """
-        schema = RequestSchema.build_with_extensions(
-            dataset.get_extensions(), SubscriptionRequestSettings,
-        )
+        schema = get_request_schema(dataset, SubscriptionRequestSettings)
         extra_conditions: Sequence[Condition] = []
         if offset is not None:
             extra_conditions = [[["ifnull", ["offset", 0]], "<=", offset]]
@@ -4,7 +4,7 @@ import time
 from concurrent.futures import Future, ThreadPoolExecutor
 
 from snuba.datasets.dataset import Dataset
-from snuba.reader import Result
+from snuba.reader import Result, pivot_result
 from snuba.subscriptions.consumer import Tick
 from snuba.subscriptions.data import Subscription
 from snuba.subscriptions.scheduler import ScheduledTask
@@ -53,7 +53,9 @@ class SubscriptionExecutor:
             # XXX: The ``extra`` is discarded from ``RawQueryResult`` since it
             # is not particularly useful in this context and duplicates data
             # that is already being published to the query log.
-            return parse_and_run_query(self.__dataset, request, timer).result
+            return pivot_result(
+                parse_and_run_query(self.__dataset, request, timer).result
+            )
 
     def execute(self, task: ScheduledTask[Subscription], tick: Tick) -> Future[Result]:
         return self.__executor_pool.submit(self.__execute, task, tick)
@@ -21,6 +21,7 @@ import _strptime  # NOQA fixes _strptime deferred import issue
 
 from snuba import settings
 from snuba.clickhouse.escaping import escape_identifier, escape_string
+from snuba.clickhouse.query import ExternalTable
 from snuba.query.parsing import ParsingContext
 from snuba.query.schema import CONDITION_OPERATORS
 from snuba.utils.metrics.backends.abstract import MetricsBackend
@@ -222,10 +223,15 @@ def tuplify(nested: Any) -> Any:
 
 
 def escape_literal(
-    value: Optional[Union[str, datetime, date, List[Any], Tuple[Any], numbers.Number]]
+    value: Optional[
+        Union[
+            str, datetime, date, List[Any], Tuple[Any], numbers.Number, ExternalTable,
+        ]
+    ]
 ) -> str:
     """
-    Escape a literal value for use in a SQL clause.
+    Escape a literal value for use in a SQL clause. External tables are
+    referenced by name, so that they can be used in ``IN`` conditions.
     """
     if isinstance(value, str):
         return escape_string(value)
@@ -238,6 +244,8 @@ def escape_literal(
         return "({})".format(", ".join(escape_literal(v) for v in value))
     elif isinstance(value, numbers.Number):
         return str(value)
+    elif isinstance(value, ExternalTable):
+        return escape_identifier(value.name) or ""
     elif value is None:
         return ""
     else:
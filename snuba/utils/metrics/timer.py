@@ -1,5 +1,14 @@
+from __future__ import annotations
+
 from itertools import groupby
-from typing import Optional, Mapping, MutableSequence, Tuple, TYPE_CHECKING
+from typing import (
+    Optional,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 from snuba.utils.clock import Clock, SystemClock
 from snuba.utils.metrics.backends.abstract import MetricsBackend
@@ -28,12 +37,32 @@ class Timer:
         self.__marks: MutableSequence[Tuple[str, float]] = [
             (self.__name, self.__clock.time())
         ]
+        # The durations of the marks of other timers merged into this one,
+        # and the time at which the latest of them finished.
+        self.__merged_durations: MutableMapping[str, float] = {}
+        self.__merged_end: Optional[float] = None
         self.__data: Optional[TimerData] = None
 
     def mark(self, name: str) -> None:
         self.__data = None
         self.__marks.append((name, self.__clock.time()))
 
+    def merge(self, other: Timer) -> None:
+        """
+        Adds the time spent in each mark of another timer, such as one that
+        timed work done on another thread on behalf of this one, to the time
+        spent in the same marks of this timer. Work done concurrently is
+        counted once for every timer it was recorded by.
+        """
+        self.__data = None
+        for name, duration in other.get_mark_durations().items():
+            self.__merged_durations[name] = (
+                self.__merged_durations.get(name, 0.0) + duration
+            )
+        other_end = other.__marks[-1][1]
+        if self.__merged_end is None or other_end > self.__merged_end:
+            self.__merged_end = other_end
+
     def __diff_ms(self, start: float, end: float) -> int:
         return int((end - start) * 1000)
 
@@ -41,9 +70,14 @@ class Timer:
         if self.__data is None:
             start = self.__marks[0][1]
             end = self.__clock.time() if len(self.__marks) == 1 else self.__marks[-1][1]
+            if self.__merged_end is not None:
+                end = max(end, self.__merged_end)
             durations = [
                 (name, self.__diff_ms(self.__marks[i][1], ts))
                 for i, (name, ts) in enumerate(self.__marks[1:])
+            ] + [
+                (name, int(duration * 1000))
+                for name, duration in self.__merged_durations.items()
             ]
             self.__data = {
                 "timestamp": int(start),
@@ -55,6 +89,19 @@ class Timer:
             }
         return self.__data
 
+    def get_mark_durations(self) -> Mapping[str, float]:
+        """
+        Returns the total time spent in each mark in seconds. Unlike the
+        durations returned by ``finish``, these are not truncated to whole
+        milliseconds, which is required to measure marks that take less.
+        """
+        durations: MutableMapping[str, float] = {}
+        for (_, start), (name, end) in zip(self.__marks, self.__marks[1:]):
+            durations[name] = durations.get(name, 0.0) + (end - start)
+        for name, duration in self.__merged_durations.items():
+            durations[name] = durations.get(name, 0.0) + duration
+        return durations
+
     def for_json(self) -> TimerData:
         return self.finish()
 
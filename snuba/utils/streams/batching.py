@@ -1,14 +1,23 @@
+from __future__ import annotations
+
 import logging
+import multiprocessing
 import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import (
+    Any,
+    Callable,
+    Deque,
     Generic,
     Mapping,
     MutableMapping,
     MutableSequence,
     Optional,
     Sequence,
+    Tuple,
     Type,
     TypeVar,
 )
@@ -52,6 +61,72 @@ class AbstractBatchWorker(ABC, Generic[TPayload, TResult]):
         """
         pass
 
+    def close(self) -> None:
+        """Called once the consumer has stopped and all of the batches have
+        been written, allowing the worker to release any resources it holds
+        (such as threads.)
+        """
+        pass
+
+
+# The worker used to process messages within a ``ProcessingPool`` subprocess.
+_processing_worker: Optional[AbstractBatchWorker[Any, Any]] = None
+
+
+def _initialize_processing_worker(
+    worker_factory: Callable[[], AbstractBatchWorker[Any, Any]]
+) -> None:
+    global _processing_worker
+    _processing_worker = worker_factory()
+
+
+def _process_messages(
+    messages: Sequence[Message[TPayload]],
+) -> Sequence[Optional[Any]]:
+    assert _processing_worker is not None
+    return [_processing_worker.process_message(message) for message in messages]
+
+
+class ProcessingPool(Generic[TPayload, TResult]):
+    """Processes messages with the `process_message` method of a worker in a
+    pool of subprocesses, so that processing is not limited to a single core.
+
+    Each subprocess builds its own worker by calling `worker_factory`, which
+    must be picklable (such as a module level function, or a partial of one),
+    as must the messages and the results of processing them. The worker built
+    by the factory is only used to process messages and is never flushed.
+
+    Messages are processed in chunks of `chunk_size` messages to amortize the
+    cost of transferring them to and from the subprocesses.
+
+    The subprocesses are spawned rather than forked, so they do not inherit
+    the state of the consumer process (such as its Kafka client and the
+    threads running within it.)"""
+
+    def __init__(
+        self,
+        worker_factory: Callable[[], AbstractBatchWorker[TPayload, TResult]],
+        processes: int,
+        chunk_size: int,
+    ) -> None:
+        self.chunk_size = chunk_size
+        self.__executor = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_processing_worker,
+            initargs=(worker_factory,),
+        )
+
+    def submit(
+        self, messages: Sequence[Message[TPayload]]
+    ) -> Future[Sequence[Optional[TResult]]]:
+        """Processes the messages, returning a future containing the results
+        in the same order as the messages."""
+        return self.__executor.submit(_process_messages, messages)
+
+    def close(self) -> None:
+        self.__executor.shutdown()
+
 
 @dataclass
 class Offsets:
@@ -82,6 +157,19 @@ class BatchingConsumer(Generic[TPayload]):
     crashes between writing to its backend and commiting offsets. This should eliminate
     the possibility of *losing* data though. An "exactly once" consumer would need to store
     offsets in the external datastore and reconcile them on any partition rebalance.
+
+    If a `processing_pool` is provided, messages are processed in its subprocesses instead
+    of in the main loop. Messages are sent to the pool in chunks as they are received, and
+    the results are collected (in the order the messages were received) before the batch
+    is flushed, so offsets are still only committed once every message in the batch has
+    been processed and flushed.
+
+    If `max_in_flight_batches` is greater than zero, batches are flushed by a background
+    writer thread so that consumption of the next batch can continue while the previous
+    one is being written. Batches are written in order, and the offsets of each batch are
+    committed (by the main loop) once it has been written. If the next batch is ready to
+    be flushed while `max_in_flight_batches` batches are still being written, consumption
+    is paused until one of them has finished.
     """
 
     def __init__(
@@ -93,6 +181,8 @@ class BatchingConsumer(Generic[TPayload]):
         max_batch_time: int,
         metrics: MetricsBackend,
         recoverable_errors: Optional[Sequence[Type[ConsumerError]]] = None,
+        processing_pool: Optional[ProcessingPool[TPayload, TResult]] = None,
+        max_in_flight_batches: int = 0,
     ) -> None:
         self.consumer = consumer
 
@@ -102,10 +192,18 @@ class BatchingConsumer(Generic[TPayload]):
         self.max_batch_size = max_batch_size
         self.max_batch_time = max_batch_time  # in milliseconds
         self.__metrics = metrics
+        self.__processing_pool = processing_pool
 
         self.shutdown = False
 
         self.__batch_results: MutableSequence[TResult] = []
+        # Messages that have not been sent to the processing pool yet, and the
+        # results of those that have (in the order they were received.)
+        self.__batch_pending_messages: MutableSequence[Message[TPayload]] = []
+        self.__batch_pending_results: MutableSequence[
+            Future[Sequence[Optional[TResult]]]
+        ] = []
+        self.__batch_pending_count: int = 0
         self.__batch_offsets: MutableMapping[Partition, Offsets] = {}
         self.__batch_deadline: Optional[float] = None
         self.__batch_messages_processed_count: int = 0
@@ -114,6 +212,20 @@ class BatchingConsumer(Generic[TPayload]):
         # new messages)
         self.__batch_processing_time_ms: float = 0.0
 
+        # Batches that are being written by the writer thread (in the order
+        # they were flushed), along with the offsets to commit once they have
+        # been written.
+        self.__writer: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-writer")
+            if max_in_flight_batches > 0
+            else None
+        )
+        self.__max_in_flight_batches = max_in_flight_batches
+        self.__in_flight_batches: Deque[
+            Tuple[Future[None], Mapping[Partition, int]]
+        ] = deque()
+        self.__paused = False
+
         # The types passed to the `except` clause must be a tuple, not a Sequence.
         self.__recoverable_errors = tuple(recoverable_errors or [])
 
@@ -174,11 +286,21 @@ class BatchingConsumer(Generic[TPayload]):
         if not self.__batch_deadline:
             self.__batch_deadline = self.max_batch_time / 1000.0 + start
 
-        result = self.worker.process_message(msg)
-        if result is not None:
-            self.__batch_results.append(result)
+        if self.__processing_pool is not None:
+            self.__batch_pending_messages.append(msg)
+            self.__batch_pending_count += 1
+            if len(self.__batch_pending_messages) >= self.__processing_pool.chunk_size:
+                self.__submit_pending_messages()
+        else:
+            result = self.worker.process_message(msg)
+            if result is not None:
+                self.__batch_results.append(result)
 
-        self.consumer.stage_offsets({msg.partition: msg.get_next_offset()})
+        # Offsets of batches that are written in the background are staged
+        # when the write has completed, so that they are not committed along
+        # with the offsets of an earlier batch.
+        if self.__writer is None:
+            self.consumer.stage_offsets({msg.partition: msg.get_next_offset()})
 
         duration = (time.time() - start) * 1000
         self.__batch_messages_processed_count += 1
@@ -190,20 +312,111 @@ class BatchingConsumer(Generic[TPayload]):
         else:
             self.__batch_offsets[msg.partition] = Offsets(msg.offset, msg.offset)
 
+    def __submit_pending_messages(self) -> None:
+        assert self.__processing_pool is not None
+        if self.__batch_pending_messages:
+            self.__batch_pending_results.append(
+                self.__processing_pool.submit(self.__batch_pending_messages)
+            )
+            self.__batch_pending_messages = []
+
+    def __collect_pending_results(self) -> None:
+        """Waits for all of the messages sent to the processing pool to be
+        processed, adding their results to the batch."""
+        if self.__processing_pool is None:
+            return
+
+        self.__submit_pending_messages()
+
+        start = time.time()
+        for future in self.__batch_pending_results:
+            self.__batch_results.extend(
+                result for result in future.result() if result is not None
+            )
+        self.__batch_pending_results = []
+        self.__batch_pending_count = 0
+        self.__metrics.timing("process_message.wait", (time.time() - start) * 1000)
+
+    def __flush_batch(self, batch: Sequence[TResult]) -> None:
+        if not batch:
+            return
+
+        logger.debug("Flushing batch via worker")
+        flush_start = time.time()
+        self.worker.flush_batch(batch)
+        flush_duration = (time.time() - flush_start) * 1000
+        logger.info("Worker flush took %dms", flush_duration)
+        self.__metrics.timing("batch.flush", flush_duration)
+        self.__metrics.timing("batch.flush.normalized", flush_duration / len(batch))
+
+    def __complete_in_flight_batches(self, block: bool) -> None:
+        """Commits the offsets of the batches that have been written by the
+        writer thread, in the order they were flushed. If `block` is set, this
+        waits for all of the batches that are being written to be completed.
+        Errors raised while writing a batch are raised here."""
+        while self.__in_flight_batches:
+            future, offsets = self.__in_flight_batches[0]
+            if not (block or future.done()):
+                break
+
+            future.result()
+            self.__in_flight_batches.popleft()
+
+            self.consumer.stage_offsets(offsets)
+            self._commit()
+
+        if self.__paused and (
+            len(self.__in_flight_batches) < self.__max_in_flight_batches
+        ):
+            logger.debug("Resuming consumption")
+            self.consumer.resume([*self.consumer.paused()])
+            self.__paused = False
+
+    def __pause(self) -> None:
+        if not self.__paused:
+            logger.debug("Pausing consumption until a batch has been written")
+            self.consumer.pause([*self.consumer.tell().keys()])
+            self.__paused = True
+
     def _shutdown(self) -> None:
         logger.debug("Stopping")
 
-        # drop in-memory events, letting the next consumer take over where we left off
-        self._reset_batch()
-
-        # close the consumer
-        logger.debug("Stopping consumer")
-        self.consumer.close()
-        logger.debug("Stopped")
+        # Everything is torn down even if the last write fails, so that the
+        # consumer leaves its group rather than waiting for the session to
+        # time out.
+        try:
+            if self.__writer is not None:
+                try:
+                    # batches that are already being written are allowed to complete
+                    logger.debug("Waiting for in-flight batches to be written")
+                    self.__complete_in_flight_batches(block=True)
+                finally:
+                    self.__writer.shutdown()
+        finally:
+            try:
+                # drop in-memory events, letting the next consumer take over where we left off
+                self._reset_batch()
+
+                logger.debug("Stopping worker")
+                self.worker.close()
+
+                if self.__processing_pool is not None:
+                    logger.debug("Stopping processing pool")
+                    self.__processing_pool.close()
+            finally:
+                # close the consumer
+                logger.debug("Stopping consumer")
+                self.consumer.close()
+                logger.debug("Stopped")
 
     def _reset_batch(self) -> None:
         logger.debug("Resetting in-memory batch")
         self.__batch_results = []
+        for future in self.__batch_pending_results:
+            future.cancel()
+        self.__batch_pending_messages = []
+        self.__batch_pending_results = []
+        self.__batch_pending_count = 0
         self.__batch_offsets = {}
         self.__batch_deadline = None
         self.__batch_messages_processed_count = 0
@@ -213,14 +426,34 @@ class BatchingConsumer(Generic[TPayload]):
         """Decides whether the batching consumer should flush because of either
         batch size or time. If so, delegate to the worker, clear the current batch,
         and commit offsets."""
+        if self.__writer is not None:
+            self.__complete_in_flight_batches(block=force)
+
         if not self.__batch_messages_processed_count > 0:
             return  # No messages were processed, so there's nothing to do.
 
-        batch_by_size = len(self.__batch_results) >= self.max_batch_size
+        # Messages that are still being processed count towards the batch size,
+        # even though some of them may not produce a result.
+        batch_by_size = (
+            len(self.__batch_results) + self.__batch_pending_count
+            >= self.max_batch_size
+        )
         batch_by_time = self.__batch_deadline and time.time() > self.__batch_deadline
         if not (force or batch_by_size or batch_by_time):
             return
 
+        if (
+            self.__writer is not None
+            and not force
+            and len(self.__in_flight_batches) >= self.__max_in_flight_batches
+        ):
+            # The writer has fallen behind, so this batch has to wait (and
+            # stop growing) until a batch that is being written completes.
+            self.__pause()
+            return
+
+        self.__collect_pending_results()
+
         logger.info(
             "Flushing %s items (from %r): forced:%s size:%s time:%s",
             len(self.__batch_results),
@@ -235,17 +468,23 @@ class BatchingConsumer(Generic[TPayload]):
             self.__batch_processing_time_ms / self.__batch_messages_processed_count,
         )
 
-        batch_results_length = len(self.__batch_results)
-        if batch_results_length > 0:
-            logger.debug("Flushing batch via worker")
-            flush_start = time.time()
-            self.worker.flush_batch(self.__batch_results)
-            flush_duration = (time.time() - flush_start) * 1000
-            logger.info("Worker flush took %dms", flush_duration)
-            self.__metrics.timing("batch.flush", flush_duration)
-            self.__metrics.timing(
-                "batch.flush.normalized", flush_duration / batch_results_length
+        if self.__writer is not None:
+            self.__in_flight_batches.append(
+                (
+                    self.__writer.submit(self.__flush_batch, self.__batch_results),
+                    {
+                        partition: offsets.hi + 1
+                        for partition, offsets in self.__batch_offsets.items()
+                    },
+                )
             )
+            self._reset_batch()
+
+            if force:
+                self.__complete_in_flight_batches(block=True)
+            return
+
+        self.__flush_batch(self.__batch_results)
 
         logger.debug("Committing offsets")
         commit_start = time.time()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Generic, TypeVar
+from typing import Generic, Tuple, Type, TypeVar
 
 
 @dataclass(frozen=True, order=True)
@@ -14,6 +14,11 @@ class Topic:
     def __contains__(self, partition: Partition) -> bool:
         return partition.topic == self
 
+    def __reduce__(self) -> Tuple[Type[Topic], Tuple[str]]:
+        # Frozen dataclasses with slots can't be unpickled by assigning their
+        # attributes, so they are reconstructed by calling the constructor.
+        return (type(self), (self.name,))
+
 
 @dataclass(frozen=True, order=True)
 class Partition:
@@ -22,6 +27,9 @@ class Partition:
     topic: Topic
     index: int
 
+    def __reduce__(self) -> Tuple[Type[Partition], Tuple[Topic, int]]:
+        return (type(self), (self.topic, self.index))
+
 
 TPayload = TypeVar("TPayload")
 
@@ -44,5 +52,10 @@ class Message(Generic[TPayload]):
             f"{type(self).__name__}(partition={self.partition}, offset={self.offset})"
         )
 
+    def __reduce__(
+        self,
+    ) -> Tuple[Type[Message[TPayload]], Tuple[Partition, int, TPayload, datetime]]:
+        return (type(self), (self.partition, self.offset, self.payload, self.timestamp))
+
     def get_next_offset(self) -> int:
         return self.offset + 1
@@ -0,0 +1,213 @@
+"""
+Offline benchmarks of the query pipeline.
+
+Recorded queries (from the ``snuba-queries`` Redis list, or from a file of
+querylog records) are validated, parsed, processed and formatted exactly as
+they are by the API, except that the formatted queries are executed by a
+``StubReader`` that returns an empty result rather than by ClickHouse. The
+CPU time spent in each stage of the pipeline is reported from the marks of
+the query ``Timer``, so that changes to the query layer can be measured
+independently of the database.
+"""
+
+import copy
+import logging
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Iterable,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+)
+
+from snuba.clickhouse.query import ClickhouseQuery
+from snuba.datasets.factory import get_dataset
+from snuba.reader import Reader, Result
+from snuba.request.request_settings import HTTPRequestSettings
+from snuba.request.schema import get_request_schema
+from snuba.request.validation import validate_request_content
+from snuba.util import settings_override
+from snuba.utils.clock import Clock
+from snuba.utils.metrics.timer import Timer
+from snuba.web.query import _run_query_pipeline
+from snuba.web.query_metadata import SnubaQueryMetadata
+
+logger = logging.getLogger("snuba.query_benchmark")
+
+
+class StubReader(Reader[ClickhouseQuery]):
+    """
+    A reader that returns an empty result for every query without executing
+    it, recording the SQL of every query it was asked to execute.
+    """
+
+    def __init__(self) -> None:
+        self.queries: MutableSequence[str] = []
+
+    def execute(
+        self,
+        query: ClickhouseQuery,
+        settings: Optional[Mapping[str, str]] = None,
+        query_id: Optional[str] = None,
+        with_totals: bool = False,
+        columnar: bool = False,
+    ) -> Result:
+        self.queries.append(query.format_sql())
+        result: Result = {"meta": [], "data": []}
+        if with_totals:
+            result["totals"] = {}
+        return result
+
+
+class ProcessTimeClock(Clock):
+    """
+    A clock that measures the CPU time of the process, so that the time spent
+    waiting on Redis does not count towards the stages of the pipeline.
+    """
+
+    def time(self) -> float:
+        return time.process_time()
+
+    def sleep(self, duration: float) -> None:
+        time.sleep(duration)
+
+
+@dataclass(frozen=True)
+class RecordedQuery:
+    dataset: str
+    body: Mapping[str, Any]
+    referrer: str
+
+    @classmethod
+    def from_querylog(cls, record: Mapping[str, Any]) -> "RecordedQuery":
+        """
+        Builds a query from a record of the ``snuba-queries`` list or the
+        querylog topic (see ``SnubaQueryMetadata.to_dict``.)
+        """
+        request = record["request"]
+        return cls(
+            record["dataset"], request["body"], request.get("referrer") or "benchmark"
+        )
+
+
+@dataclass(frozen=True)
+class QueryBenchmarkResult:
+    dataset: str
+    referrer: str
+    # The best CPU time of each stage of the pipeline, and of all of them,
+    # of all of the repetitions.
+    stages_ms: Mapping[str, float]
+    cpu_time_ms: float
+    # The peak memory allocated while running the query, if allocations were
+    # traced.
+    peak_memory_bytes: Optional[int]
+    # The SQL of the last query that was executed, or the error raised while
+    # running the pipeline, if any.
+    sql: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {
+            "dataset": self.dataset,
+            "referrer": self.referrer,
+            "stages_ms": self.stages_ms,
+            "cpu_time_ms": self.cpu_time_ms,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "sql": self.sql,
+            "error": self.error,
+        }
+
+
+def run_query(query: RecordedQuery, reader: Reader[ClickhouseQuery]) -> Timer:
+    """
+    Runs a recorded query through the pipeline of the API, returning the
+    timer with the marks of every stage.
+    """
+    dataset = get_dataset(query.dataset)
+    # The body is modified while the query is processed, so every run must
+    # start from a copy of it.
+    body = copy.deepcopy(query.body)
+
+    timer = Timer("query_benchmark", clock=ProcessTimeClock())
+    request = validate_request_content(
+        body,
+        get_request_schema(dataset, HTTPRequestSettings),
+        timer,
+        dataset,
+        query.referrer,
+    )
+    _run_query_pipeline(
+        dataset=dataset,
+        request=request,
+        timer=timer,
+        query_metadata=SnubaQueryMetadata(
+            request=request, dataset=query.dataset, timer=timer, query_list=[]
+        ),
+        reader=reader,
+    )
+    return timer
+
+
+def run_query_benchmark(
+    queries: Iterable[RecordedQuery], repeat: int = 3, trace_allocations: bool = True,
+) -> Sequence[QueryBenchmarkResult]:
+    """
+    Measures running each of the queries through the pipeline, reporting the
+    best time of each stage of all of the repetitions.
+    """
+    assert repeat > 0
+
+    results: MutableSequence[QueryBenchmarkResult] = []
+
+    # The result cache would skip executing (and with it formatting) every
+    # query after the first repetition.
+    with settings_override({"USE_RESULT_CACHE": False}):
+        for query in queries:
+            reader = StubReader()
+            stages: MutableMapping[str, float] = {}
+            best = float("inf")
+            try:
+                for _ in range(repeat):
+                    durations = run_query(query, reader).get_mark_durations()
+                    for stage, duration in durations.items():
+                        stages[stage] = min(stages.get(stage, duration), duration)
+                    best = min(best, sum(durations.values()))
+
+                peak_memory = None
+                if trace_allocations:
+                    tracemalloc.start()
+                    try:
+                        run_query(query, reader)
+                        peak_memory = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+            except Exception as error:
+                results.append(
+                    QueryBenchmarkResult(
+                        query.dataset,
+                        query.referrer,
+                        {},
+                        0.0,
+                        None,
+                        error=f"{type(error).__name__}: {str(error).splitlines()[0]}",
+                    )
+                )
+                continue
+
+            results.append(
+                QueryBenchmarkResult(
+                    query.dataset,
+                    query.referrer,
+                    {stage: duration * 1000 for stage, duration in stages.items()},
+                    best * 1000,
+                    peak_memory,
+                    sql=reader.queries[-1] if reader.queries else None,
+                )
+            )
+
+    return results
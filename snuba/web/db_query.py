@@ -9,25 +9,55 @@ from typing import (
     Optional,
 )
 
-from snuba import settings, state
+from snuba import environment, settings, state
 from snuba.clickhouse.errors import ClickhouseError
 from snuba.clickhouse.query import ClickhouseQuery
-from snuba.environment import reader
 from snuba.redis import redis_client
+from snuba.reader import Reader, Result, get_row_count, is_columnar
 from snuba.request import Request
-from snuba.state.cache import Cache, RedisCache
+from snuba.state.cache import Cache, MemoryCache, RedisCache, TieredCache
 from snuba.state.rate_limit import (
     PROJECT_RATE_LIMIT_NAME,
     RateLimitAggregator,
     RateLimitExceeded,
 )
+from snuba.state.single_flight import SingleFlight
 from snuba.util import force_bytes
 from snuba.utils.codecs import JSONCodec
+from snuba.utils.metrics.backends.wrapper import MetricsWrapper
 from snuba.utils.metrics.timer import Timer
 from snuba.web import RawQueryException, RawQueryResult
 from snuba.web.query_metadata import ClickhouseQueryMetadata, SnubaQueryMetadata
 
-cache: Cache[Any] = RedisCache(redis_client, "snuba-query-cache:", JSONCodec())
+codec = JSONCodec()
+
+
+def estimate_result_size(result: Result) -> int:
+    """
+    Returns the number of values in the result (rows times columns), which
+    approximates the amount of memory required to hold it well enough for
+    budgeting without the cost of encoding it to measure it.
+    """
+    return max(get_row_count(result), 1) * max(len(result["meta"]), 1)
+
+
+cache: Cache[Any] = RedisCache(redis_client, "snuba-query-cache:", codec)
+if settings.RESULT_CACHE_LOCAL_MAX_SIZE > 0:
+    cache = TieredCache(
+        MemoryCache(
+            settings.RESULT_CACHE_LOCAL_MAX_SIZE,
+            estimate_result_size,
+            MetricsWrapper(environment.metrics, "api.result_cache.local"),
+        ),
+        cache,
+    )
+
+single_flight: SingleFlight[Any] = SingleFlight(
+    redis_client,
+    "snuba-query-single-flight:",
+    cache,
+    timeout=state.max_query_duration_s,
+)
 
 logger = logging.getLogger("snuba.query")
 
@@ -59,6 +89,7 @@ def update_query_metadata_and_stats(
 def raw_query(
     request: Request,
     query: ClickhouseQuery,
+    reader: Reader[ClickhouseQuery],
     timer: Timer,
     query_metadata: SnubaQueryMetadata,
     stats: MutableMapping[str, Any],
@@ -74,16 +105,25 @@ def raw_query(
     TODO: As soon as we have a StorageQuery abstraction remove all the references
     to the original query from the request.
     """
+    config = request.settings.get_config()
 
-    use_cache, use_deduper, uc_max = state.get_configs(
+    (
+        use_cache,
+        use_deduper,
+        use_single_flight,
+        use_columnar,
+        uc_max,
+    ) = config.get_configs(
         [
             ("use_cache", settings.USE_RESULT_CACHE),
             ("use_deduper", 1),
+            ("use_single_flight", 0),
+            ("use_columnar_results", 0),
             ("uncompressed_cache_max_cols", 5),
         ]
     )
 
-    all_confs = state.get_all_configs()
+    all_confs = config.get_all_configs()
     query_settings: MutableMapping[str, Any] = {
         k.split("/", 1)[1]: v
         for k, v in all_confs.items()
@@ -99,113 +139,141 @@ def raw_query(
     timer.mark("get_configs")
 
     sql = query.format_sql()
-    query_id = md5(force_bytes(sql)).hexdigest()
-    with state.deduper(query_id if use_deduper else None) as is_dupe:
-        timer.mark("dedupe_wait")
+    query_hash = md5(force_bytes(sql))
+    # The SQL of queries that reference external tables does not include
+    # their content, which determines the result as well.
+    for table in query.get_external_tables():
+        query_hash.update(force_bytes(repr(table)))
+    query_id = query_hash.hexdigest()
 
-        result = cache.get(query_id) if use_cache else None
-        timer.mark("cache_get")
+    stats.update(
+        {
+            "query_id": query_id,
+            "use_cache": bool(use_cache),
+            "is_duplicate": False,
+            "cache_hit": False,
+        }
+    )
 
-        stats.update(
-            {
-                "is_duplicate": is_dupe,
-                "query_id": query_id,
-                "use_cache": bool(use_cache),
-                "cache_hit": bool(result),
-            }
-        ),
+    update_with_status = partial(
+        update_query_metadata_and_stats,
+        request,
+        sql,
+        timer,
+        stats,
+        query_metadata,
+        query_settings,
+        trace_id,
+    )
 
-        update_with_status = partial(
-            update_query_metadata_and_stats,
-            request,
-            sql,
-            timer,
-            stats,
-            query_metadata,
-            query_settings,
-            trace_id,
-        )
-
-        if not result:
-            try:
-                with RateLimitAggregator(
-                    request.settings.get_rate_limit_params()
-                ) as rate_limit_stats_container:
-                    stats.update(rate_limit_stats_container.to_dict())
-                    timer.mark("rate_limit")
-
-                    project_rate_limit_stats = rate_limit_stats_container.get_stats(
-                        PROJECT_RATE_LIMIT_NAME
-                    )
+    def execute_query() -> Result:
+        try:
+            rate_limit_params = request.settings.get_rate_limit_params()
+            shared_rate_limits = request.settings.get_shared_rate_limits()
+            with (
+                shared_rate_limits.run(rate_limit_params, config)
+                if shared_rate_limits is not None
+                else RateLimitAggregator(rate_limit_params, config)
+            ) as rate_limit_stats_container:
+                stats.update(rate_limit_stats_container.to_dict())
+                timer.mark("rate_limit")
 
-                    if (
-                        "max_threads" in query_settings
-                        and project_rate_limit_stats is not None
-                        and project_rate_limit_stats.concurrent > 1
-                    ):
-                        maxt = query_settings["max_threads"]
-                        query_settings["max_threads"] = max(
-                            1, maxt - project_rate_limit_stats.concurrent + 1
-                        )
-
-                    # Force query to use the first shard replica, which
-                    # should have synchronously received any cluster writes
-                    # before this query is run.
-                    consistent = request.settings.get_consistent()
-                    stats["consistent"] = consistent
-                    if consistent:
-                        query_settings["load_balancing"] = "in_order"
-                        query_settings["max_threads"] = 1
-
-                    try:
-                        result = reader.execute(
-                            query,
-                            query_settings,
-                            # All queries should already be deduplicated at this point
-                            # But the query_id will let us know if they aren't
-                            query_id=query_id if use_deduper else None,
-                            with_totals=request.query.has_totals(),
-                        )
-
-                        timer.mark("execute")
-                        stats.update(
-                            {
-                                "result_rows": len(result["data"]),
-                                "result_cols": len(result["meta"]),
-                            }
-                        )
-
-                        if use_cache:
-                            cache.set(query_id, result)
-                            timer.mark("cache_set")
-
-                    except BaseException as ex:
-                        error = str(ex)
-                        logger.exception("Error running query: %s\n%s", sql, error)
-                        stats = update_with_status("error")
-                        meta = {}
-                        if isinstance(ex, ClickhouseError):
-                            err_type = "clickhouse"
-                            meta["code"] = ex.code
-                        else:
-                            err_type = "unknown"
-                        raise RawQueryException(
-                            err_type=err_type,
-                            message=error,
-                            stats=stats,
-                            sql=sql,
-                            **meta,
-                        )
-            except RateLimitExceeded as ex:
-                stats = update_with_status("rate-limited")
-                raise RawQueryException(
-                    err_type="rate-limited",
-                    message="rate limit exceeded",
-                    stats=stats,
-                    sql=sql,
-                    detail=str(ex),
+                project_rate_limit_stats = rate_limit_stats_container.get_stats(
+                    PROJECT_RATE_LIMIT_NAME
                 )
 
+                if (
+                    "max_threads" in query_settings
+                    and project_rate_limit_stats is not None
+                    and project_rate_limit_stats.concurrent > 1
+                ):
+                    maxt = query_settings["max_threads"]
+                    query_settings["max_threads"] = max(
+                        1, maxt - project_rate_limit_stats.concurrent + 1
+                    )
+
+                # Force query to use the first shard replica, which
+                # should have synchronously received any cluster writes
+                # before this query is run.
+                consistent = request.settings.get_consistent()
+                stats["consistent"] = consistent
+                if consistent:
+                    query_settings["load_balancing"] = "in_order"
+                    query_settings["max_threads"] = 1
+
+                try:
+                    result = reader.execute(
+                        query,
+                        query_settings,
+                        # All queries should already be deduplicated at this point
+                        # But the query_id will let us know if they aren't
+                        query_id=query_id if use_deduper else None,
+                        with_totals=request.query.has_totals(),
+                        columnar=bool(use_columnar),
+                    )
+
+                    timer.mark("execute")
+                    stats.update(
+                        {
+                            "result_rows": get_row_count(result),
+                            "result_cols": len(result["meta"]),
+                        }
+                    )
+
+                    if use_cache:
+                        cache.set(query_id, result)
+                        timer.mark("cache_set")
+
+                    return result
+                except BaseException as ex:
+                    error = str(ex)
+                    logger.exception("Error running query: %s\n%s", sql, error)
+                    update_with_status("error")
+                    meta = {}
+                    if isinstance(ex, ClickhouseError):
+                        err_type = "clickhouse"
+                        meta["code"] = ex.code
+                    else:
+                        err_type = "unknown"
+                    raise RawQueryException(
+                        err_type=err_type, message=error, stats=stats, sql=sql, **meta,
+                    )
+        except RateLimitExceeded as ex:
+            update_with_status("rate-limited")
+            raise RawQueryException(
+                err_type="rate-limited",
+                message="rate limit exceeded",
+                stats=stats,
+                sql=sql,
+                detail=str(ex),
+            )
+
+    def get_cached_or_execute_query() -> Result:
+        result = cache.get(query_id) if use_cache else None
+        timer.mark("cache_get")
+        stats["cache_hit"] = bool(result)
+        return result if result else execute_query()
+
+    if use_deduper and use_single_flight and use_cache:
+        # Duplicate queries wait for the first one to complete and then read
+        # its result from the cache, rather than polling the deduplication
+        # lock.
+        result, is_dupe = single_flight.execute(query_id, get_cached_or_execute_query)
+        timer.mark("dedupe_wait")
+        stats["is_duplicate"] = is_dupe
+    else:
+        with state.deduper(query_id if use_deduper else None) as is_dupe:
+            timer.mark("dedupe_wait")
+            stats["is_duplicate"] = is_dupe
+            result = get_cached_or_execute_query()
+
     stats = update_with_status("success")
 
+    if (use_cache or is_dupe) and not is_columnar(result):
+        # Cached and deduplicated results may be shared with other requests
+        # in this process, and the split strategies modify the result data in
+        # place, so the top level of the result is copied before it is handed
+        # back. (Columnar results are never modified in place.)
+        result = {**result, "data": [*result["data"]]}
+
     return RawQueryResult(result, {"stats": stats, "sql": sql})
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import math
+import re
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Mapping, Sequence
+
+import rapidjson
+import simplejson as json
+
+from snuba.reader import is_columnar, unwrap_nullable_type
+
+if TYPE_CHECKING:
+    from snuba.reader import Column
+
+
+Encoder = Callable[[Any], str]
+
+INTEGER_TYPE_RE = re.compile(r"^U?Int(8|16|32|64)$")
+FLOAT_TYPE_RE = re.compile(r"^Float(32|64)$")
+
+
+def encode_value(value: Any) -> str:
+    return rapidjson.dumps(value, number_mode=rapidjson.NM_NAN)
+
+
+def encode_integer(value: int) -> str:
+    return str(value)
+
+
+def encode_float(value: float) -> str:
+    # Non-finite values are encoded the same way as ``simplejson`` encodes
+    # them, for consistency with the non-streaming response encoding.
+    if math.isnan(value):
+        return "NaN"
+    elif math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    else:
+        return repr(float(value))
+
+
+def encode_nullable(encoder: Encoder) -> Encoder:
+    def encode(value: Any) -> str:
+        return "null" if value is None else encoder(value)
+
+    return encode
+
+
+def build_column_encoder(column: Column) -> Encoder:
+    """
+    Returns a function that can be used to encode the values of a column,
+    specialized for the column type where a faster encoding is possible.
+    """
+    is_nullable, type = unwrap_nullable_type(column["type"])
+
+    encoder: Encoder
+    if INTEGER_TYPE_RE.match(type):
+        encoder = encode_integer
+    elif FLOAT_TYPE_RE.match(type):
+        encoder = encode_float
+    else:
+        return encode_value
+
+    return encode_nullable(encoder) if is_nullable else encoder
+
+
+def encode_rows(
+    meta: Sequence[Column], rows: Iterator[Sequence[Any]], chunk_size: int
+) -> Iterator[str]:
+    """
+    Encodes rows (represented as sequences of values in the same order as
+    the columns in ``meta``) as JSON objects, yielding comma separated
+    chunks of up to ``chunk_size`` rows.
+    """
+    prefixes = [f"{encode_value(column['name'])}:" for column in meta]
+    encoders = [build_column_encoder(column) for column in meta]
+    columns = list(zip(prefixes, encoders))
+
+    def encode_row(values: Sequence[Any]) -> str:
+        return "{%s}" % ",".join(
+            [
+                prefix + encoder(value)
+                for (prefix, encoder), value in zip(columns, values)
+            ]
+        )
+
+    chunk = []
+    for values in rows:
+        chunk.append(encode_row(values))
+        if len(chunk) >= chunk_size:
+            yield ",".join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ",".join(chunk)
+
+
+def stream_result(payload: Mapping[str, Any], chunk_size: int) -> Iterator[str]:
+    """
+    Encodes a query result payload as a JSON object incrementally, so that
+    the entire response does not have to be held in memory at once. The
+    ``meta`` is written first, then the rows (in chunks), followed by all of
+    the remaining keys (totals, timing, stats, etc.)
+
+    Payloads that do not contain result data (such as errors) are encoded in
+    a single chunk.
+    """
+    columnar = is_columnar(payload)
+    if "meta" not in payload or not (columnar or "data" in payload):
+        yield json.dumps(payload)
+        return
+
+    meta = payload["meta"]
+
+    rows: Iterator[Sequence[Any]]
+    if columnar:
+        rows = zip(*payload["columns"])
+    else:
+        names = [column["name"] for column in meta]
+        rows = ([row[name] for name in names] for row in payload["data"])
+
+    yield '{"meta":%s,"data":[' % json.dumps(meta)
+
+    for i, chunk in enumerate(encode_rows(meta, rows, chunk_size)):
+        yield chunk if i == 0 else "," + chunk
+
+    yield "]"
+
+    for key, value in payload.items():
+        if key not in ("meta", "data", "columns"):
+            yield ",%s:%s" % (json.dumps(key), json.dumps(value))
+
+    yield "}"
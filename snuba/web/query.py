@@ -10,9 +10,11 @@ from functools import partial
 from snuba import environment, settings, state
 from snuba.clickhouse.astquery import AstClickhouseQuery
 from snuba.clickhouse.dictquery import DictClickhouseQuery
+from snuba.clickhouse.query import ClickhouseQuery
 from snuba.datasets.dataset import Dataset
 from snuba.datasets.factory import get_dataset_name
 from snuba.query.timeseries import TimeSeriesExtensionProcessor
+from snuba.reader import Reader
 from snuba.request import Request
 from snuba.utils.metrics.backends.wrapper import MetricsWrapper
 from snuba.utils.metrics.timer import Timer
@@ -47,7 +49,11 @@ def parse_and_run_query(
 
     try:
         result = _run_query_pipeline(
-            dataset=dataset, request=request, timer=timer, query_metadata=query_metadata
+            dataset=dataset,
+            request=request,
+            timer=timer,
+            query_metadata=query_metadata,
+            reader=environment.reader,
         )
         record_query(request_copy, timer, query_metadata)
     except RawQueryException as error:
@@ -63,6 +69,7 @@ def _run_query_pipeline(
     request: Request,
     timer: Timer,
     query_metadata: SnubaQueryMetadata,
+    reader: Reader[ClickhouseQuery],
 ) -> RawQueryResult:
     """
     Runs the query processing and execution pipeline for a Snuba Query. This means it takes a Dataset
@@ -76,12 +83,12 @@ def _run_query_pipeline(
       From this point on none should depend on the dataset.
     - Executing the storage specific query processors.
     - Providing the newly built Query and a QueryRunner to the QueryExecutionStrategy to actually
-      run the DB Query.
+      run the DB Query through the provided Reader.
     """
 
     # TODO: this will work perfectly with datasets that are not time series. Remove it.
     from_date, to_date = TimeSeriesExtensionProcessor.get_time_limit(
-        request.extensions["timeseries"]
+        request.extensions["timeseries"], request.settings
     )
 
     if (
@@ -112,9 +119,12 @@ def _run_query_pipeline(
     for processor in storage_query_plan.query_processors:
         processor.process_query(request.query, request.settings)
 
+    timer.mark("process_query")
+
     query_runner = partial(
         _format_storage_query_and_run,
         dataset,
+        reader,
         timer,
         query_metadata,
         from_date,
@@ -128,6 +138,7 @@ def _format_storage_query_and_run(
     # TODO: remove dependency on Dataset. This is only for formatting the legacy ClickhouseQuery
     # with the AST this won't be needed.
     dataset: Dataset,
+    reader: Reader[ClickhouseQuery],
     timer: Timer,
     query_metadata: SnubaQueryMetadata,
     from_date: datetime,
@@ -164,8 +175,11 @@ def _format_storage_query_and_run(
             )
         except Exception:
             logger.warning("Failed to format ast query", exc_info=True)
+        timer.mark("format_query")
 
-        return raw_query(request, query, timer, query_metadata, stats, span.trace_id)
+        return raw_query(
+            request, query, reader, timer, query_metadata, stats, span.trace_id
+        )
 
 
 def record_query(
@@ -1,10 +1,25 @@
 import copy
-from datetime import timedelta
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
 import math
+from typing import Callable, MutableSequence, Optional, Tuple
 
-from snuba import state, util
+from sentry_sdk import Hub
+
+from snuba import environment, settings, util
 from snuba.datasets.dataset import ColumnSplitSpec
+from snuba.datasets.factory import get_dataset_name
+from snuba.query.timeseries import TimeSeriesExtensionProcessor
+from snuba.reader import is_columnar, pivot_result
+from snuba.redis import redis_client
 from snuba.request import Request
+from snuba.state.density import DensityEstimator
+from snuba.state.rate_limit import SharedRateLimits
+from snuba.utils.metrics.backends.wrapper import MetricsWrapper
+from snuba.utils.metrics.timer import Timer
+from snuba.web import RawQueryResult
+
+metrics = MetricsWrapper(environment.metrics, "api.split")
 
 # Every time we find zero results for a given step, expand the search window by
 # this factor. Based on the assumption that the initial window is 2 hours, the
@@ -12,10 +27,39 @@ from snuba.request import Request
 # queries before hitting the 90d limit (2+20+200+2000 hours == 92 days).
 STEP_GROWTH = 10
 
+# Shared by all requests in the process, which bounds the number of
+# concurrent queries issued by parallel time splitting.
+executor = ThreadPoolExecutor(
+    max_workers=settings.SPLIT_MAX_WORKERS, thread_name_prefix="time-split"
+)
+
+# Estimates of how many rows per second each set of projects has, learned from
+# the results of previous time split queries.
+density = DensityEstimator(redis_client, "snuba-split-density:")
+
+
+def _get_density_key(dataset, request: Request) -> Optional[str]:
+    project_ids = request.extensions.get("project", {}).get("project")
+    if project_ids is None:
+        return None
+
+    return "{}:{}".format(
+        get_dataset_name(dataset),
+        ",".join(str(project_id) for project_id in sorted(util.to_list(project_ids))),
+    )
+
+
+def _pivot(result: RawQueryResult) -> RawQueryResult:
+    # The split strategies operate on rows, so any columnar results need to
+    # be converted before they can be merged or inspected.
+    if is_columnar(result.result):
+        return RawQueryResult(pivot_result(result.result), result.extra)
+    return result
+
 
 def split_query(query_func):
-    def wrapper(dataset, request: Request, *args, **kwargs):
-        (use_split,) = state.get_configs([("use_split", 0)])
+    def wrapper(dataset, request: Request, timer: Timer, *args, **kwargs):
+        (use_split,) = request.settings.get_config().get_configs([("use_split", 0)])
         query_limit = request.query.get_limit()
         limit = query_limit if query_limit is not None else 0
         remaining_offset = request.query.get_offset()
@@ -39,13 +83,15 @@ def split_query(query_func):
                 and not request.query.get_aggregations()
                 and total_col_count > min_col_count
             ):
-                return col_split(dataset, request, column_split_spec, *args, **kwargs)
+                return col_split(
+                    dataset, request, column_split_spec, timer, *args, **kwargs
+                )
             elif orderby[:1] == ["-timestamp"] and remaining_offset < 1000:
-                return time_split(dataset, request, *args, **kwargs)
+                return time_split(dataset, request, timer, *args, **kwargs)
 
-        return query_func(dataset, request, *args, **kwargs)
+        return query_func(dataset, request, timer, *args, **kwargs)
 
-    def time_split(dataset, request: Request, *args, **kwargs):
+    def time_split(dataset, request: Request, timer: Timer, *args, **kwargs):
         """
         If a query is:
             - ORDER BY timestamp DESC
@@ -57,25 +103,90 @@ def split_query(query_func):
         into smaller increments, and start with the last one, so that we can potentially
         avoid querying the entire range.
         """
-        date_align, split_step = state.get_configs(
-            [("date_align_seconds", 1), ("split_step", 3600)]  # default 1 hour
+        (
+            split_step,
+            split_parallelism,
+            use_split_density,
+            split_density_margin,
+            split_min_step,
+        ) = request.settings.get_config().get_configs(
+            [
+                ("split_step", 3600),  # default 1 hour
+                ("split_parallelism", 1),
+                ("use_split_density", 0),
+                ("split_density_margin", 1.5),
+                ("split_min_step", 60),
+            ]
         )
 
         query_limit = request.query.get_limit()
         limit = query_limit if query_limit is not None else 0
         remaining_offset = request.query.get_offset()
 
-        to_date = util.parse_datetime(
-            request.extensions["timeseries"]["to_date"], date_align
-        )
-        from_date = util.parse_datetime(
-            request.extensions["timeseries"]["from_date"], date_align
+        from_date, to_date = TimeSeriesExtensionProcessor.get_time_limit(
+            request.extensions["timeseries"], request.settings
         )
 
+        # If we have seen queries for the same projects before, size the
+        # first window so that it is expected to contain all of the rows we
+        # need (with some margin), rather than starting from a fixed step.
+        density_key = _get_density_key(dataset, request)
+        adaptive = False
+        if use_split_density and density_key is not None:
+            rate = density.get(density_key)
+            if rate:
+                adaptive = True
+                # The estimate of sparse projects can be small enough for the
+                # step to reach past the earliest representable date, while
+                # there is no point in it exceeding the time range anyway.
+                split_step = min(
+                    max(
+                        split_min_step,
+                        int(
+                            math.ceil(
+                                (limit + remaining_offset) * split_density_margin / rate
+                            )
+                        ),
+                    ),
+                    int((to_date - from_date).total_seconds()),
+                )
+
+        def observe(split_start: datetime, split_end: datetime, rows: int) -> None:
+            if density_key is not None:
+                density.observe(
+                    density_key, rows, (split_end - split_start).total_seconds()
+                )
+
+        def record_windows(windows: int) -> None:
+            metrics.timing(
+                "windows",
+                windows,
+                tags={
+                    "adaptive": str(adaptive),
+                    "parallel": str(split_parallelism > 1),
+                },
+            )
+
+        if split_parallelism > 1:
+            return parallel_time_split(
+                dataset,
+                request,
+                timer,
+                from_date,
+                to_date,
+                split_step,
+                split_parallelism,
+                observe,
+                record_windows,
+                *args,
+                **kwargs,
+            )
+
         overall_result = None
         split_end = to_date
         split_start = max(split_end - timedelta(seconds=split_step), from_date)
         total_results = 0
+        windows = 0
         while split_start < split_end and total_results < limit:
             request.extensions["timeseries"]["from_date"] = split_start.isoformat()
             request.extensions["timeseries"]["to_date"] = split_end.isoformat()
@@ -90,7 +201,11 @@ def split_query(query_func):
             # iteration, if needed.
             # XXX: The extra data is carried across from the initial response
             # and never updated.
-            result = query_func(dataset, copy.deepcopy(request), *args, **kwargs)
+            result = _pivot(
+                query_func(dataset, copy.deepcopy(request), timer, *args, **kwargs)
+            )
+            windows += 1
+            observe(split_start, split_end, len(result.result["data"]))
 
             if overall_result is None:
                 overall_result = result
@@ -126,10 +241,145 @@ def split_query(query_func):
                 except OverflowError:
                     split_start = from_date
 
+        record_windows(windows)
         return overall_result
 
+    def parallel_time_split(
+        dataset,
+        request: Request,
+        timer: Timer,
+        from_date: datetime,
+        to_date: datetime,
+        split_step: int,
+        fan_out: int,
+        observe: Callable[[datetime, datetime, int], None],
+        record_windows: Callable[[int], None],
+        *args,
+        **kwargs,
+    ):
+        """
+        A variant of ``time_split`` that speculatively queries up to
+        ``fan_out`` consecutive windows concurrently, rather than waiting for
+        the results of each window before querying the next one. All of the
+        windows queried at once have the same size, which only changes for
+        the next set of windows once they have all returned, the same way the
+        sequential strategy sizes its next window: it grows by
+        ``STEP_GROWTH`` if they didn't return any rows, otherwise it is
+        scaled to the number of rows that are still missing.
+
+        The results are merged in window order (which is also timestamp
+        order), and once enough rows have been collected to satisfy the limit
+        and offset, any windows that have not started yet are cancelled and
+        the results of any later windows are discarded (after waiting for
+        them to finish, so that they count towards the rate limits for as
+        long as they run.)
+
+        Every window is timed separately (since they run concurrently) and
+        the timers of the windows whose results are used are merged into the
+        timer of the request. The windows count towards the rate limits of
+        the request as a single query, rather than one query each.
+        """
+        query_limit = request.query.get_limit()
+        limit = query_limit if query_limit is not None else 0
+        offset = request.query.get_offset()
+        required = limit + offset
+
+        shared_rate_limits = SharedRateLimits()
+        request = copy.deepcopy(request)
+        request.settings.set_shared_rate_limits(shared_rate_limits)
+
+        def run_window(hub: Hub, split_start: datetime, split_end: datetime):
+            # Each window is evaluated independently (and concurrently), so
+            # every one of them needs its own copy of the request.
+            window_request = copy.deepcopy(request)
+            window_request.extensions["timeseries"][
+                "from_date"
+            ] = split_start.isoformat()
+            window_request.extensions["timeseries"]["to_date"] = split_end.isoformat()
+            # Since we don't know how many rows the preceding windows will
+            # return, every window has to ask for (limit+offset) results.
+            window_request.query.set_offset(0)
+            window_request.query.set_limit(required)
+            window_timer = Timer("split_window")
+            with hub:
+                result = _pivot(
+                    query_func(dataset, window_request, window_timer, *args, **kwargs)
+                )
+            return result, window_timer
+
+        overall_result = None
+        data: MutableSequence = []
+        windows = 0
+        split_end = to_date
+        with shared_rate_limits:
+            while split_end > from_date and len(data) < required:
+                futures: MutableSequence[Tuple[datetime, datetime, Future]] = []
+                while len(futures) < fan_out and split_end > from_date:
+                    try:
+                        split_start = max(
+                            split_end - timedelta(seconds=split_step), from_date
+                        )
+                    except OverflowError:
+                        split_start = from_date
+
+                    futures.append(
+                        (
+                            split_start,
+                            split_end,
+                            # The window runs with a copy of the hub of this
+                            # thread, so that its spans and errors are still
+                            # associated with this request.
+                            executor.submit(
+                                run_window, Hub(Hub.current), split_start, split_end
+                            ),
+                        )
+                    )
+                    split_end = split_start
+
+                windows += len(futures)
+
+                rows = 0
+                try:
+                    for window_start, window_end, future in futures:
+                        result, window_timer = future.result()
+                        if timer is not None:
+                            timer.merge(window_timer)
+                        observe(window_start, window_end, len(result.result["data"]))
+                        if overall_result is None:
+                            overall_result = result
+
+                        rows += len(result.result["data"])
+                        data.extend(result.result["data"])
+                        if len(data) >= required:
+                            break
+                finally:
+                    for _, _, future in futures:
+                        future.cancel()
+                    wait([future for _, _, future in futures])
+
+                if rows == 0:
+                    split_step = split_step * STEP_GROWTH
+                else:
+                    split_step = split_step * math.ceil(
+                        (required - len(data)) / float(rows)
+                    )
+
+        record_windows(windows)
+
+        if overall_result is None:
+            return None
+
+        result = copy.copy(overall_result.result)
+        result["data"] = data[offset:required]
+        return RawQueryResult(result, overall_result.extra)
+
     def col_split(
-        dataset, request: Request, column_split_spec: ColumnSplitSpec, *args, **kwargs
+        dataset,
+        request: Request,
+        column_split_spec: ColumnSplitSpec,
+        timer: Timer,
+        *args,
+        **kwargs,
     ):
         """
         Split query in 2 steps if a large number of columns is being selected.
@@ -142,7 +392,7 @@ def split_query(query_func):
         # not been modified by the time we're ready to run the full query.
         minimal_request = copy.deepcopy(request)
         minimal_request.query.set_selected_columns(column_split_spec.get_min_columns())
-        result = query_func(dataset, minimal_request, *args, **kwargs)
+        result = _pivot(query_func(dataset, minimal_request, timer, *args, **kwargs))
         del minimal_request
 
         if result.result["data"]:
@@ -183,6 +433,6 @@ def split_query(query_func):
                 util.parse_datetime(max(timestamps)) + timedelta(seconds=1)
             ).isoformat()
 
-        return query_func(dataset, request, *args, **kwargs)
+        return query_func(dataset, request, timer, *args, **kwargs)
 
     return wrapper
@@ -2,7 +2,7 @@ import logging
 import os
 import time
 from datetime import datetime
-from typing import Any, Mapping, MutableMapping, NamedTuple
+from typing import Any, Mapping, MutableMapping, NamedTuple, cast
 from uuid import UUID
 
 import jsonschema
@@ -25,10 +25,11 @@ from snuba.datasets.factory import (
 )
 from snuba.datasets.schemas.tables import TableSchema
 from snuba.environment import clickhouse_ro, clickhouse_rw
+from snuba.reader import Result, pivot_result
 from snuba.redis import redis_client
 from snuba.request import Request
-from snuba.request.request_settings import HTTPRequestSettings
-from snuba.request.schema import RequestSchema
+from snuba.request.request_settings import HTTPRequestSettings, RequestSettings
+from snuba.request.schema import get_request_schema
 from snuba.request.validation import validate_request_content
 from snuba.subscriptions.codecs import SubscriptionDataCodec
 from snuba.subscriptions.data import InvalidSubscriptionError, PartitionId
@@ -39,6 +40,7 @@ from snuba.utils.metrics.timer import Timer
 from snuba.utils.streams.kafka import KafkaPayload
 from snuba.utils.streams.types import Message, Partition, Topic
 from snuba.web.converters import DatasetConverter
+from snuba.web.encoder import stream_result
 from snuba.web import RawQueryException
 from snuba.web.query import parse_and_run_query
 
@@ -251,9 +253,7 @@ def unqualified_query_view(*, timer: Timer):
 @util.time_request("query")
 def dataset_query_view(*, dataset: Dataset, timer: Timer):
     if http_request.method == "GET":
-        schema = RequestSchema.build_with_extensions(
-            dataset.get_extensions(), HTTPRequestSettings
-        )
+        schema = get_request_schema(dataset, HTTPRequestSettings)
         return render_template(
             "query.html",
             query_template=json.dumps(schema.generate_template(), indent=4,),
@@ -269,21 +269,14 @@ def dataset_query(dataset: Dataset, body, timer: Timer) -> Response:
     assert http_request.method == "POST"
     ensure_not_internal(dataset)
     ensure_table_exists(dataset)
-    return format_result(
-        run_query(
-            dataset,
-            validate_request_content(
-                body,
-                RequestSchema.build_with_extensions(
-                    dataset.get_extensions(), HTTPRequestSettings
-                ),
-                timer,
-                dataset,
-                http_request.referrer,
-            ),
-            timer,
-        )
+    request = validate_request_content(
+        body,
+        get_request_schema(dataset, HTTPRequestSettings),
+        timer,
+        dataset,
+        http_request.referrer,
     )
+    return format_result(run_query(dataset, request, timer), request.settings)
 
 
 def run_query(dataset: Dataset, request: Request, timer: Timer) -> WebQueryResult:
@@ -305,9 +298,27 @@ def run_query(dataset: Dataset, request: Request, timer: Timer) -> WebQueryResul
         )
 
 
-def format_result(result: WebQueryResult) -> Response:
+def format_result(
+    result: WebQueryResult, request_settings: RequestSettings
+) -> Response:
+    use_streaming, chunk_size = request_settings.get_config().get_configs(
+        [("use_streaming_response", 0), ("streaming_response_chunk_size", 1000)]
+    )
+    if use_streaming:
+        # The result is encoded incrementally as the response is sent to
+        # limit the amount of memory required for large results.
+        return Response(
+            stream_result(result.payload, int(chunk_size or 0)),
+            result.status,
+            {"Content-Type": "application/json"},
+        )
+
+    # Columnar results are only converted to rows at this point, once all
+    # other processing of the result has been completed.
     return Response(
-        json.dumps(result.payload), result.status, {"Content-Type": "application/json"},
+        json.dumps(pivot_result(cast(Result, result.payload))),
+        result.status,
+        {"Content-Type": "application/json"},
     )
 
 
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Iterable, List, Mapping
+from typing import Any, Callable, Iterable, List, Mapping
 
 logger = logging.getLogger("snuba.writer")
 
@@ -14,6 +14,25 @@ class BatchWriter(object):
         raise NotImplementedError
 
 
+class NullBatchWriter(BatchWriter):
+    """
+    Encodes rows in the same way as a writer that sends them to ClickHouse
+    would, but discards them, keeping track only of how many rows (and bytes)
+    were written. This allows measuring the cost of producing a batch without
+    a database.
+    """
+
+    def __init__(self, encoder: Callable[[WriterTableRow], bytes]):
+        self.__encoder = encoder
+        self.rows = 0
+        self.bytes = 0
+
+    def write(self, rows: Iterable[WriterTableRow]):
+        for row in rows:
+            self.bytes += len(self.__encoder(row))
+            self.rows += 1
+
+
 class BufferedWriterWrapper:
     """
     This is a wrapper that adds a buffer around a BatchWriter.
@@ -9,6 +9,7 @@ from snuba.query.expressions import (
     Lambda,
     Literal,
     Argument,
+    TableReference,
 )
 from snuba.query.parsing import ParsingContext
 
@@ -21,6 +22,7 @@ test_expressions = [
     (Literal(None, False), "false",),  # False
     (Column(None, "column1", "table1"), "table1.column1"),  # Basic Column no alias
     (Column(None, "column1", None), "column1"),  # Basic Column with no table
+    (TableReference(None, "table1"), "table1"),  # Table referenced by name
     (
         Column("alias", "column1", "table1"),
         "(table1.column1 AS alias)",
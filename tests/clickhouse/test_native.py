@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
+from typing import Any, MutableSequence, Sequence
+
 from dateutil.tz import tz
-from snuba.clickhouse.native import transform_datetime
+from snuba.clickhouse.native import NativeDriverReader, transform_datetime
+from snuba.clickhouse.query import ClickhouseQuery, ExternalTable
 
 
 def test_transform_datetime() -> None:
@@ -14,3 +17,38 @@ def test_transform_datetime() -> None:
         transform_datetime(now.replace(tzinfo=tz.tzoffset("PST", offset)) + offset)
         == fmt
     )
+
+
+class FakeClickhousePool:
+    def __init__(self) -> None:
+        self.calls: MutableSequence[Any] = []
+
+    def execute(self, sql: str, **kwargs: Any) -> Any:
+        self.calls.append((sql, kwargs))
+        return [(1,)], [("count", "UInt64")]
+
+
+class ExternalTableQuery(ClickhouseQuery):
+    def __init__(self, external_tables: Sequence[ExternalTable]) -> None:
+        self.__external_tables = external_tables
+
+    def _format_query_impl(self) -> str:
+        return "SELECT count() FROM events WHERE group_id NOT IN groups"
+
+    def get_external_tables(self) -> Sequence[ExternalTable]:
+        return self.__external_tables
+
+
+def test_external_tables() -> None:
+    client = FakeClickhousePool()
+    reader = NativeDriverReader(client)
+
+    table = ExternalTable("groups", [("group_id", "UInt64")], [(1,), (2,)])
+    assert reader.execute(ExternalTableQuery([table]))["data"] == [{"count": 1}]
+    reader.execute(ExternalTableQuery([]))
+
+    [(_, kwargs), (_, kwargs_without_tables)] = client.calls
+    assert kwargs["external_tables"] == [
+        {"name": "groups", "structure": [("group_id", "UInt64")], "data": [(1,), (2,)]}
+    ]
+    assert "external_tables" not in kwargs_without_tables
@@ -0,0 +1,131 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+
+from snuba.clickhouse.columns import (
+    UUID,
+    AggregateFunction,
+    Array,
+    ColumnSet,
+    Date,
+    DateTime,
+    Enum,
+    FixedString,
+    IPv4,
+    IPv6,
+    LowCardinality,
+    Materialized,
+    Nested,
+    Nullable,
+    String,
+    UInt,
+    WithDefault,
+)
+from snuba.clickhouse.rowbinary import (
+    RowBinaryEncoder,
+    UnsupportedColumnType,
+    build_encoder,
+    encode_varint,
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (0, b"\x00"),
+        (1, b"\x01"),
+        (127, b"\x7f"),
+        (128, b"\x80\x01"),
+        (300, b"\xac\x02"),
+    ],
+)
+def test_encode_varint(value: int, expected: bytes) -> None:
+    assert encode_varint(value) == expected
+
+
+test_data = [
+    (UInt(8), 1, b"\x01"),
+    (UInt(32), 1, b"\x01\x00\x00\x00"),
+    (UInt(64), 2 ** 64 - 1, b"\xff" * 8),
+    (String(), "abc", b"\x03abc"),
+    (String(), "é", b"\x02\xc3\xa9"),
+    (LowCardinality(String()), "abc", b"\x03abc"),
+    (FixedString(4), "ab", b"ab\x00\x00"),
+    (Nullable(String()), None, b"\x01"),
+    (Nullable(String()), "a", b"\x00\x01a"),
+    (Array(String()), ["a", "bc"], b"\x02\x01a\x02bc"),
+    (Array(UInt(8)), [1, 2], b"\x02\x01\x02"),
+    (Array(Nullable(UInt(8))), [None, 1], b"\x02\x01\x00\x01"),
+    (DateTime(), datetime(1970, 1, 1, 0, 0, 1), b"\x01\x00\x00\x00"),
+    (DateTime(), "1970-01-01 00:00:02", b"\x02\x00\x00\x00"),
+    (Date(), date(1970, 1, 2), b"\x01\x00"),
+    (
+        UUID(),
+        "00000000-0000-0001-0000-000000000002",
+        b"\x01\x00\x00\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x00\x00",
+    ),
+    (IPv4(), "1.2.3.4", b"\x04\x03\x02\x01"),
+    (IPv6(), "::1", b"\x00" * 15 + b"\x01"),
+    (Enum([("success", 0), ("error", 1)]), "error", b"\x01"),
+]
+
+
+@pytest.mark.parametrize("type, value, expected", test_data)
+def test_encode(type, value, expected) -> None:
+    assert build_encoder(type)(value) == expected
+
+
+def test_row_encoder() -> None:
+    encoder = RowBinaryEncoder(
+        ColumnSet(
+            [
+                ("id", UUID()),
+                ("count", UInt(8)),
+                ("name", WithDefault(String(), "'unknown'")),
+                ("hash", Materialized(UInt(64), "cityHash64(name)")),
+                ("tags", Nested([("key", String()), ("value", String())])),
+                ("parent", Nullable(UInt(8))),
+            ]
+        )
+    )
+
+    assert encoder.get_column_names() == [
+        "id",
+        "count",
+        "name",
+        "tags.key",
+        "tags.value",
+        "parent",
+    ]
+
+    assert encoder(
+        {
+            "id": uuid.UUID(int=1),
+            "count": 2,
+            "name": "a",
+            "tags.key": ["k"],
+            "tags.value": ["v"],
+            "parent": 3,
+        }
+    ) == (
+        b"\x00\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00"
+        b"\x02"
+        b"\x01a"
+        b"\x01\x01k"
+        b"\x01\x01v"
+        b"\x00\x03"
+    )
+
+    # Missing values are filled in with the column defaults.
+    assert encoder({"count": None}) == (
+        b"\x00" * 16 + b"\x00" + b"\x07unknown" + b"\x00" + b"\x00" + b"\x01"
+    )
+
+
+def test_unsupported_column_type() -> None:
+    with pytest.raises(UnsupportedColumnType):
+        RowBinaryEncoder(ColumnSet([("users", AggregateFunction("uniq", UUID()))]))
+
+    with pytest.raises(UnsupportedColumnType):
+        RowBinaryEncoder(ColumnSet([("day", WithDefault(Date(), "today()"))]))
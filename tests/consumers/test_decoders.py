@@ -0,0 +1,23 @@
+import pytest
+
+from snuba.consumers.decoders import PAYLOAD_DECODERS, get_payload_decoder
+
+
+@pytest.mark.parametrize("name", sorted(PAYLOAD_DECODERS))
+def test_payload_decoder(name: str) -> None:
+    try:
+        decode = get_payload_decoder(name)
+    except ImportError:
+        pytest.skip(f"{name} is not installed")
+
+    payload = '[2, "insert", {"message": "café", "tags": [["a", 1.5]]}]'
+    assert decode(payload.encode("utf-8")) == [
+        2,
+        "insert",
+        {"message": "café", "tags": [["a", 1.5]]},
+    ]
+
+
+def test_unknown_payload_decoder() -> None:
+    with pytest.raises(ValueError):
+        get_payload_decoder("pickle")
@@ -1,17 +1,28 @@
 import pytz
+import random
 import re
+import time
 from datetime import datetime
+import threading
 from functools import partial
+from typing import Any, MutableSequence, Sequence
+from unittest.mock import patch
+
+import pytest
 import simplejson as json
 
-from snuba import replacer
+from snuba import replacer, state
 from snuba.clickhouse import DATETIME_FORMAT
 from snuba.datasets.errors_replacer import FLATTENED_COLUMN_TEMPLATE
 from snuba.datasets import errors_replacer
-from snuba.settings import PAYLOAD_DATETIME_FORMAT
+from snuba.datasets.storages.factory import get_storage
+from snuba.redis import redis_client
+from snuba.settings import PAYLOAD_DATETIME_FORMAT, REPLACER_KEY_TTL
+from snuba.util import settings_override
 from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
 from snuba.utils.streams.kafka import KafkaPayload
 from snuba.utils.streams.types import Message, Partition, Topic
+from tests.backends.metrics import Increment, TestingMetricsBackend
 from tests.base import BaseEventsTest
 
 
@@ -346,3 +357,264 @@ class TestReplacer(BaseEventsTest):
         self.replacer.flush_batch([processed])
 
         assert self._issue_count(self.project_id) == [{"count": 1, "group_id": 2}]
+
+
+class FakeClickhousePool:
+    def __init__(self) -> None:
+        self.queries: MutableSequence[str] = []
+
+    def execute_robust(self, query: str) -> Sequence[Sequence[Any]]:
+        self.queries.append(query)
+        return [[1]]
+
+
+def build_message(type: str, timestamp: datetime, **data: Any) -> Message[KafkaPayload]:
+    return Message(
+        Partition(Topic("replacements"), 0),
+        0,
+        KafkaPayload(
+            None,
+            json.dumps(
+                (
+                    2,
+                    type,
+                    {"datetime": timestamp.strftime(PAYLOAD_DATETIME_FORMAT), **data},
+                )
+            ).encode("utf-8"),
+        ),
+        datetime.now(),
+    )
+
+
+def test_coalesce_replacements() -> None:
+    clickhouse = FakeClickhousePool()
+    metrics = TestingMetricsBackend()
+    worker = replacer.ReplacerWorker(clickhouse, get_storage("errors"), metrics)
+
+    first = datetime(2020, 1, 1, 0, 0, 0)
+    second = datetime(2020, 1, 1, 0, 0, 1)
+    third = datetime(2020, 1, 1, 0, 0, 2)
+    batch = [
+        worker.process_message(message)
+        for message in [
+            build_message("end_delete_groups", first, project_id=1, group_ids=[1, 2]),
+            build_message("end_delete_groups", first, project_id=2, group_ids=[3]),
+            build_message("end_delete_groups", second, project_id=1, group_ids=[2, 3]),
+            build_message(
+                "end_merge",
+                second,
+                project_id=1,
+                previous_group_ids=[4],
+                new_group_id=5,
+            ),
+            # A merge of the group that was just merged into.
+            build_message(
+                "end_merge", third, project_id=1, previous_group_ids=[5], new_group_id=6
+            ),
+            # A merge into the same group.
+            build_message(
+                "end_merge", third, project_id=1, previous_group_ids=[7], new_group_id=6
+            ),
+            # A merge into a group that was merged before cannot be coalesced.
+            build_message(
+                "end_merge", third, project_id=1, previous_group_ids=[8], new_group_id=4
+            ),
+            build_message("end_delete_groups", third, project_id=1, group_ids=[9]),
+        ]
+    ]
+
+    replacements = worker._ReplacerWorker__replacer_processor.coalesce_replacements(
+        batch
+    )
+    assert [replacement.query_time_flags for replacement in replacements] == [
+        (errors_replacer.EXCLUDE_GROUPS, 1, [1, 2, 3]),
+        (errors_replacer.EXCLUDE_GROUPS, 2, [3]),
+        (errors_replacer.EXCLUDE_GROUPS, 1, [4, 5, 7]),
+        (errors_replacer.EXCLUDE_GROUPS, 1, [8]),
+        (errors_replacer.EXCLUDE_GROUPS, 1, [9]),
+    ]
+
+    delete = replacements[0]
+    assert delete.query_args["group_ids"] == "1, 2, 3"
+    assert delete.query_args["received_conditions"] == (
+        "group_id IN (1, 2) AND received <= CAST('2020-01-01 00:00:00' AS DateTime)"
+        " OR group_id IN (2, 3) AND received <= CAST('2020-01-01 00:00:01' AS DateTime)"
+    )
+
+    merge = replacements[2]
+    assert merge.new_group_id == 6
+    assert merge.query_args["columns"] == batch[3].query_args["all_columns"]
+    assert merge.query_args["select_columns"] == batch[5].query_args["select_columns"]
+
+    assert (
+        re.sub("[\n ]+", " ", delete.insert_query_template).strip()
+        == "INSERT INTO %(dist_write_table_name)s (%(columns)s) SELECT %(select_columns)s FROM %(dist_read_table_name)s FINAL PREWHERE group_id IN (%(group_ids)s) WHERE project_id = %(project_id)s AND (%(received_conditions)s) AND NOT deleted"
+    )
+
+    worker.flush_batch(batch)
+    assert len(clickhouse.queries) == len(replacements) * 2
+    assert delete.query_args["received_conditions"] in clickhouse.queries[1]
+    assert Increment("replacements.coalesced", 3, None) in metrics.calls
+
+
+def test_concurrent_replacements() -> None:
+    started = threading.Event()
+
+    class BlockingClickhousePool(FakeClickhousePool):
+        def execute_robust(self, query: str) -> Sequence[Sequence[Any]]:
+            # The replacements of the first project can only complete once
+            # the ones of the second project have started.
+            if "project_id = 2" in query:
+                started.set()
+            elif "project_id = 1" in query:
+                assert started.wait(timeout=10)
+            if "project_id = 3" in query:
+                raise ValueError("failed")
+            return super().execute_robust(query)
+
+    clickhouse = BlockingClickhousePool()
+    worker = replacer.ReplacerWorker(
+        clickhouse, get_storage("errors"), TestingMetricsBackend()
+    )
+
+    timestamp = datetime(2020, 1, 1)
+    batch = [
+        worker.process_message(message)
+        for message in [
+            build_message("end_delete_groups", timestamp, project_id=1, group_ids=[1]),
+            build_message("end_delete_groups", timestamp, project_id=2, group_ids=[2]),
+            build_message("end_delete_groups", timestamp, project_id=3, group_ids=[3]),
+            build_message(
+                "end_unmerge",
+                timestamp,
+                project_id=1,
+                previous_group_id=1,
+                new_group_id=4,
+                hashes=["a" * 32],
+            ),
+        ]
+    ]
+
+    state.set_config("replacer_concurrency", 2)
+    try:
+        with pytest.raises(ValueError):
+            worker.flush_batch(batch)
+    finally:
+        state.delete_config("replacer_concurrency")
+
+    # Every project that did not fail was replaced, and the replacements of
+    # each project were run in order.
+    queries = [re.sub("[\n ]+", " ", query) for query in clickhouse.queries]
+    project_1 = [query for query in queries if "project_id = 1" in query]
+    assert len(project_1) == 4
+    assert "group_id IN (1)" in project_1[1]
+    assert "primary_hash IN" in project_1[3]
+    assert len([query for query in queries if "project_id = 2" in query]) == 2
+
+
+def test_skip_count_query() -> None:
+    clickhouse = FakeClickhousePool()
+    metrics = TestingMetricsBackend()
+    worker = replacer.ReplacerWorker(clickhouse, get_storage("errors"), metrics)
+
+    project_id = 7
+    replacement = worker.process_message(
+        build_message(
+            "end_delete_groups", datetime.now(), project_id=project_id, group_ids=[1]
+        )
+    )
+
+    state.set_config("replacer_skip_count_query", 1)
+    try:
+        worker.flush_batch([replacement])
+    finally:
+        state.delete_config("replacer_skip_count_query")
+
+    # Only the insert was run, and the groups were excluded before it was.
+    [query] = clickhouse.queries
+    assert query.strip().startswith("INSERT INTO")
+    assert errors_replacer.get_projects_query_flags(
+        [project_id], errors_replacer.ReplacerState.ERRORS, state.get_config_snapshot()
+    ) == (False, [1])
+    assert not [
+        timing for timing in metrics.calls if timing.name == "replacements.count"
+    ]
+
+
+def skip_without_redis_streams() -> None:
+    version = tuple(
+        int(part) for part in redis_client.info()["redis_version"].split(".")[:2]
+    )
+    if version < (5, 0):
+        pytest.skip("streams require Redis 5.0")
+
+
+def test_local_project_flags() -> None:
+    skip_without_redis_streams()
+    worker = replacer.ReplacerWorker(
+        FakeClickhousePool(), get_storage("errors"), TestingMetricsBackend()
+    )
+    project_id = random.randint(1, 2 ** 31)
+    state_name = errors_replacer.ReplacerState.ERRORS
+
+    with settings_override({"REPLACER_FLAGS_STREAM_ENABLED": True}):
+        state.set_config("use_local_replacement_flags", 1)
+        try:
+            config = state.get_config_snapshot()
+            assert errors_replacer.get_projects_query_flags(
+                [project_id], state_name, config
+            ) == (False, [])
+
+            # The local copy is loaded in the background, the flags are read
+            # from Redis until it is ready.
+            subscriber = errors_replacer.project_flags_subscribers[state_name]
+            deadline = time.time() + 5
+            while subscriber.get_nowait() is None:
+                assert time.time() < deadline
+                time.sleep(0.01)
+
+            worker.flush_batch(
+                [
+                    worker.process_message(
+                        build_message(
+                            "end_delete_groups",
+                            datetime.now(),
+                            project_id=project_id,
+                            group_ids=[2, 1],
+                        )
+                    )
+                ]
+            )
+            errors_replacer.publish_project_flags(project_id + 1, None, state_name)
+
+            # The flags are read from the local copy, which is updated as soon
+            # as the flags are published by the same process.
+            with patch.object(errors_replacer.redis_client, "pipeline") as pipeline:
+                assert errors_replacer.get_projects_query_flags(
+                    [project_id], state_name, config
+                ) == (False, [1, 2])
+                assert errors_replacer.get_projects_query_flags(
+                    [project_id, project_id + 1], state_name, config
+                ) == (True, [1, 2])
+                assert not pipeline.called
+        finally:
+            state.delete_config("use_local_replacement_flags")
+
+    # The local copy matches the flags stored in Redis.
+    assert errors_replacer.get_projects_query_flags(
+        [project_id, project_id + 1], state_name, state.get_config_snapshot()
+    ) == (False, [1, 2])
+
+
+def test_project_flags_cache_expiry() -> None:
+    skip_without_redis_streams()
+    project_id = random.randint(1, 2 ** 31)
+    state_name = errors_replacer.ReplacerState.ERRORS
+    errors_replacer.publish_project_flags(project_id, None, state_name)
+    errors_replacer.publish_project_flags(project_id, [1], state_name)
+
+    cache = errors_replacer.ProjectFlagsCache(redis_client, state_name)
+    assert cache.update().get_projects_query_flags([project_id]) == (True, [1])
+
+    with patch("time.time", return_value=time.time() + REPLACER_KEY_TTL + 1):
+        assert cache.get_projects_query_flags([project_id]) == (False, [])
@@ -174,3 +174,30 @@ def test_tags_processor(query_body, expected_query) -> None:
         DictClickhouseQuery(dataset, query, request_settings).format_sql()
         == expected_query
     )
+
+
+def test_tags_processor_uses_request_config() -> None:
+    # tags_key in both select and condition, which is only optimized while
+    # the processor is enabled.
+    query_body, expected_query = next(
+        (query_body, expected_query)
+        for query_body, expected_query in test_data
+        if query_body["selected_columns"] == ["tags_key"] and "conditions" in query_body
+    )
+    state.set_config("ast_tag_processor_enabled", 1)
+    dataset = get_dataset("transactions")
+    query = parse_query(query_body, dataset)
+    request_settings = HTTPRequestSettings()
+    request = Request("a", query, request_settings, {}, "r")
+    _ = dataset.get_query_plan_builder().build_plan(request)
+
+    # Changes made to the runtime config after the request was received do
+    # not affect how its query is formatted.
+    state.set_config("ast_tag_processor_enabled", 0)
+    try:
+        assert (
+            DictClickhouseQuery(dataset, query, request_settings).format_sql()
+            == expected_query
+        )
+    finally:
+        state.delete_config("ast_tag_processor_enabled")
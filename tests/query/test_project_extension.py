@@ -4,6 +4,7 @@ from typing import Sequence
 from tests.base import BaseTest
 from snuba import state
 from snuba.clickhouse.columns import ColumnSet
+from snuba.clickhouse.query import ExternalTable
 from snuba.datasets.errors_replacer import (
     set_project_exclude_groups,
     set_project_needs_final,
@@ -11,8 +12,9 @@ from snuba.datasets.errors_replacer import (
 )
 from snuba.datasets.schemas.tables import TableSource
 from snuba.query.conditions import FunctionCall, BooleanFunctions
-from snuba.query.expressions import Column, Expression, Literal
+from snuba.query.expressions import Column, Expression, Literal, TableReference
 from snuba.query.project_extension import (
+    EXCLUDE_GROUPS_TABLE_NAME,
     ProjectExtension,
     ProjectExtensionProcessor,
     ProjectWithGroupsProcessor,
@@ -79,13 +81,13 @@ def test_project_extension_query_adds_rate_limits():
     extension.get_processor().process_query(query, valid_data, request_settings)
 
     rate_limits = request_settings.get_rate_limit_params()
-    # make sure a rate limit was added by the processing
-    assert len(rate_limits) == num_rate_limits_before_processing + 1
+    # make sure a rate limit was added for each project by the processing
+    assert len(rate_limits) == num_rate_limits_before_processing + 2
 
-    most_recent_rate_limit = rate_limits[-1]
-    assert most_recent_rate_limit.bucket == "2"
-    assert most_recent_rate_limit.per_second_limit == 1000
-    assert most_recent_rate_limit.concurrent_limit == 1000
+    assert [rate_limit.bucket for rate_limit in rate_limits[-2:]] == ["2", "3"]
+    for rate_limit in rate_limits[-2:]:
+        assert rate_limit.per_second_limit == 1000
+        assert rate_limit.concurrent_limit == 1000
 
 
 def test_project_extension_project_rate_limits_are_overridden():
@@ -95,18 +97,22 @@ def test_project_extension_project_rate_limits_are_overridden():
     raw_data = {"project": [2, 3]}
     valid_data = validate_jsonschema(raw_data, extension.get_schema())
     query = Query({"conditions": []}, TableSource("my_table", ColumnSet([])),)
-    request_settings = HTTPRequestSettings()
     state.set_config("project_per_second_limit_2", 5)
     state.set_config("project_concurrent_limit_2", 10)
+    request_settings = HTTPRequestSettings()
 
     extension.get_processor().process_query(query, valid_data, request_settings)
 
     rate_limits = request_settings.get_rate_limit_params()
-    most_recent_rate_limit = rate_limits[-1]
+    overridden_rate_limit, default_rate_limit = rate_limits[-2:]
+
+    assert overridden_rate_limit.bucket == "2"
+    assert overridden_rate_limit.per_second_limit == 5
+    assert overridden_rate_limit.concurrent_limit == 10
 
-    assert most_recent_rate_limit.bucket == "2"
-    assert most_recent_rate_limit.per_second_limit == 5
-    assert most_recent_rate_limit.concurrent_limit == 10
+    assert default_rate_limit.bucket == "3"
+    assert default_rate_limit.per_second_limit == 1000
+    assert default_rate_limit.concurrent_limit == 1000
 
 
 class TestProjectExtensionWithGroups(BaseTest):
@@ -156,8 +162,8 @@ class TestProjectExtensionWithGroups(BaseTest):
         assert not self.query.get_final()
 
     def test_when_there_are_not_many_groups_to_exclude(self):
-        request_settings = HTTPRequestSettings()
         state.set_config("max_group_ids_exclude", 5)
+        request_settings = HTTPRequestSettings()
         set_project_exclude_groups(2, [100, 101, 102], ReplacerState.EVENTS)
 
         self.extension.get_processor().process_query(
@@ -197,8 +203,8 @@ class TestProjectExtensionWithGroups(BaseTest):
         assert not self.query.get_final()
 
     def test_when_there_are_too_many_groups_to_exclude(self):
-        request_settings = HTTPRequestSettings()
         state.set_config("max_group_ids_exclude", 2)
+        request_settings = HTTPRequestSettings()
         set_project_exclude_groups(2, [100, 101, 102], ReplacerState.EVENTS)
 
         self.extension.get_processor().process_query(
@@ -208,3 +214,42 @@ class TestProjectExtensionWithGroups(BaseTest):
         assert self.query.get_conditions() == [("project_id", "IN", [2])]
         assert self.query.get_condition_from_ast() == build_in("project_id", [2])
         assert self.query.get_final()
+
+    def test_when_groups_to_exclude_are_sent_as_external_table(self):
+        state.set_config("max_group_ids_exclude", 2)
+        state.set_config("max_group_ids_exclude_external", 5)
+        request_settings = HTTPRequestSettings()
+        set_project_exclude_groups(2, [100, 101, 102], ReplacerState.EVENTS)
+
+        self.extension.get_processor().process_query(
+            self.query, self.valid_data, request_settings
+        )
+
+        table = ExternalTable(
+            EXCLUDE_GROUPS_TABLE_NAME,
+            [("group_id", "UInt64")],
+            [(100,), (101,), (102,)],
+        )
+        assert self.query.get_external_tables() == [table]
+        assert self.query.get_conditions() == [
+            ("project_id", "IN", [2]),
+            (["assumeNotNull", ["group_id"]], "NOT IN", table),
+        ]
+        assert self.query.get_condition_from_ast() == FunctionCall(
+            None,
+            BooleanFunctions.AND,
+            (
+                FunctionCall(
+                    None,
+                    "notIn",
+                    (
+                        FunctionCall(
+                            None, "assumeNotNull", (Column(None, "group_id", None),)
+                        ),
+                        TableReference(None, EXCLUDE_GROUPS_TABLE_NAME),
+                    ),
+                ),
+                build_in("project_id", [2]),
+            ),
+        )
+        assert not self.query.get_final()
@@ -1,6 +1,10 @@
+import copy
+
 from snuba.clickhouse.columns import ColumnSet
 from snuba.datasets.factory import get_dataset
 from snuba.datasets.schemas.tables import TableSource
+from snuba.query.conditions import ConditionFunctions, binary_condition
+from snuba.query.expressions import Column, Literal
 from snuba.query.query import Query
 
 
@@ -110,6 +114,30 @@ def test_edit_query():
     assert query.get_prewhere() == [["pc6", "=", "10"]]
 
 
+def test_copy_query():
+    condition = binary_condition(
+        None, ConditionFunctions.EQ, Column(None, "c1", None), Literal(None, "a")
+    )
+    query = Query(
+        {"selected_columns": ["c1"], "conditions": [["c1", "=", "a"]]},
+        TableSource("my_table", ColumnSet([])),
+        selected_columns=[Column(None, "c1", None)],
+        condition=condition,
+    )
+
+    copied = copy.deepcopy(query)
+    copied.add_conditions([["c2", "=", "b"]])
+    copied.set_selected_columns(["c2"])
+    assert query.get_conditions() == [["c1", "=", "a"]]
+    assert query.get_selected_columns() == ["c1"]
+
+    # The expressions are immutable, so they are shared between the copies.
+    assert copied.get_condition_from_ast() is condition
+    assert copied.get_selected_columns_from_ast()[0] is (
+        query.get_selected_columns_from_ast()[0]
+    )
+
+
 def test_referenced_columns():
     # a = 1 AND b = 1
     dataset = get_dataset("events")
@@ -9,6 +9,7 @@ from snuba.query.expressions import (
     Lambda,
     Literal,
     Argument,
+    TableReference,
 )
 
 
@@ -55,6 +56,10 @@ class DummyVisitor(ExpressionVisitor[List[Expression]]):
         ret.extend(exp.transform.accept(self))
         return ret
 
+    def visitTableReference(self, exp: TableReference) -> List[Expression]:
+        self.__visited_nodes.append(exp)
+        return [exp]
+
 
 def test_visit_expression():
     col1 = Column("al", "c1", "t1")
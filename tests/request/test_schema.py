@@ -0,0 +1,58 @@
+import jsonschema
+import pytest
+
+from snuba.datasets.factory import get_dataset
+from snuba.request.request_settings import (
+    HTTPRequestSettings,
+    SubscriptionRequestSettings,
+)
+from snuba.request.schema import get_request_schema
+from snuba.schemas import build_validator
+
+
+def test_build_validator() -> None:
+    validate = build_validator(
+        {
+            "type": "object",
+            "properties": {
+                "columns": {"type": "array", "default": []},
+                "limit": {"type": "integer", "default": 100},
+            },
+            "additionalProperties": False,
+        }
+    )
+
+    value = {"limit": 10}
+    assert validate(value) == {"columns": [], "limit": 10}
+    # The value provided is not modified by setting the defaults.
+    assert value == {"limit": 10}
+
+    # Tuples are accepted as arrays, and the validator can be reused.
+    assert validate({"columns": ("a", "b")}) == {"columns": ("a", "b"), "limit": 100}
+
+    with pytest.raises(jsonschema.ValidationError):
+        validate({"limit": "10"})
+
+
+def test_get_request_schema() -> None:
+    events = get_dataset("events")
+    schema = get_request_schema(events, HTTPRequestSettings)
+
+    assert get_request_schema(events, HTTPRequestSettings) is schema
+    assert get_request_schema(events, SubscriptionRequestSettings) is not schema
+    assert (
+        get_request_schema(get_dataset("transactions"), HTTPRequestSettings)
+        is not schema
+    )
+
+    request = schema.validate({"project": [1]}, events, "test")
+    assert request.extensions["project"] == {"project": [1]}
+    assert request.query.get_limit() == 1000
+
+    # Defaults that are computed are evaluated for every request.
+    other = schema.validate({"project": 2}, events, "test")
+    assert other.extensions["project"] == {"project": 2}
+    assert (
+        other.extensions["timeseries"]["to_date"]
+        >= request.extensions["timeseries"]["to_date"]
+    )
@@ -0,0 +1,65 @@
+from snuba.state.cache import Cache, MemoryCache, TieredCache
+from snuba.utils.clock import TestingClock
+from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
+from typing import MutableMapping, Optional
+from tests.backends.metrics import Increment, TestingMetricsBackend
+
+
+class DictCache(Cache[str]):
+    def __init__(self) -> None:
+        self.values: MutableMapping[str, str] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        return self.values.get(key)
+
+    def set(self, key: str, value: str) -> None:
+        self.values[key] = value
+
+
+def test_memory_cache_eviction() -> None:
+    metrics = TestingMetricsBackend()
+    cache: MemoryCache[str] = MemoryCache(10, len, metrics)
+
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+
+    # "b" is the least recently used entry, so it is evicted first.
+    cache.set("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+
+    # Values that exceed the entire budget are not stored.
+    cache.set("d", "d" * 11)
+    assert cache.get("d") is None
+    assert cache.get("a") == "aaaa"
+
+    assert Increment("evict", 1, None) in metrics.calls
+    assert Increment("oversize", 1, None) in metrics.calls
+
+
+def test_memory_cache_expiry() -> None:
+    clock = TestingClock()
+    cache: MemoryCache[str] = MemoryCache(10, len, DummyMetricsBackend(), clock)
+
+    cache.set("a", "aaaa")
+    assert cache.get("a") == "aaaa"
+
+    clock.sleep(1.0)
+    assert cache.get("a") is None
+
+
+def test_tiered_cache() -> None:
+    local: MemoryCache[str] = MemoryCache(10, len, DummyMetricsBackend())
+    remote = DictCache()
+    cache = TieredCache(local, remote)
+
+    cache.set("a", "aaaa")
+    assert remote.get("a") == "aaaa"
+    assert local.get("a") == "aaaa"
+
+    remote.set("b", "bbbb")
+    assert local.get("b") is None
+    assert cache.get("b") == "bbbb"
+    assert local.get("b") == "bbbb"
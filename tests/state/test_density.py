@@ -0,0 +1,50 @@
+import uuid
+from unittest.mock import patch
+
+from snuba.redis import redis_client
+from snuba.state.density import DensityEstimator
+from snuba.utils.clock import TestingClock
+
+
+def test_density_estimator() -> None:
+    clock = TestingClock()
+    prefix = f"test-density:{uuid.uuid4().hex}:"
+    estimator = DensityEstimator(redis_client, prefix, clock=clock)
+
+    assert estimator.get("1") is None
+
+    estimator.observe("1", 100, 10.0)
+    assert estimator.get("1") == 10.0
+
+    # Observations are combined with the previous estimate.
+    estimator.observe("1", 0, 10.0)
+    assert estimator.get("1") == 5.0
+
+    # Other processes start from the last estimate that was written.
+    other = DensityEstimator(redis_client, prefix, clock=clock)
+    assert other.get("1") == 10.0
+
+    clock.sleep(60)
+    estimator.observe("1", 0, 10.0)
+    assert estimator.get("1") == 2.5
+    other = DensityEstimator(redis_client, prefix, clock=clock)
+    assert other.get("1") == 2.5
+
+
+def test_density_estimator_misses() -> None:
+    clock = TestingClock()
+    prefix = f"test-density:{uuid.uuid4().hex}:"
+    estimator = DensityEstimator(redis_client, prefix, clock=clock)
+    other = DensityEstimator(redis_client, prefix, clock=clock)
+
+    assert estimator.get("1") is None
+    other.observe("1", 100, 10.0)
+
+    # Misses are remembered until another process may have written an
+    # estimate.
+    with patch.object(redis_client, "get") as get:
+        assert estimator.get("1") is None
+        assert not get.called
+
+    clock.sleep(60)
+    assert estimator.get("1") == 10.0
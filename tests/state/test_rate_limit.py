@@ -1,3 +1,4 @@
+import copy
 import pytest
 from unittest.mock import patch
 import uuid
@@ -11,6 +12,9 @@ from snuba.state.rate_limit import (
     RateLimitParameters,
     RateLimitStats,
     RateLimitStatsContainer,
+    SharedRateLimits,
+    max_rate_limit_stats,
+    sum_rate_limit_stats,
 )
 
 
@@ -113,6 +117,47 @@ class TestRateLimit(BaseTest):
             ):
                 pass
 
+    def test_aggregator_stats(self):
+        outer = RateLimitParameters("outer", uuid.uuid4().hex, 10, 10)
+        inner = RateLimitParameters("inner", uuid.uuid4().hex, None, 1)
+
+        with RateLimitAggregator([outer]):
+            with RateLimitAggregator([outer, inner]) as stats:
+                assert stats.get_stats("outer") == RateLimitStats(rate=0, concurrent=2)
+                assert stats.get_stats("inner") == RateLimitStats(rate=0, concurrent=1)
+
+                # The rejected query is removed from the inner bucket, and
+                # is no longer concurrent in the outer bucket.
+                with pytest.raises(RateLimitExceeded):
+                    with RateLimitAggregator([outer, inner]):
+                        pass
+
+                with RateLimitAggregator([outer]) as stats:
+                    assert stats.get_stats("outer").concurrent == 3
+
+        with RateLimitAggregator([outer, inner]) as stats:
+            assert stats.get_stats("outer").concurrent == 1
+            assert stats.get_stats("inner").concurrent == 1
+
+    def test_shared_rate_limits(self):
+        params = RateLimitParameters("foo", uuid.uuid4().hex, None, 1)
+        shared = SharedRateLimits()
+
+        with shared:
+            # Copies share the rate limits, which are only entered once.
+            with shared.run([params]) as stats:
+                with copy.deepcopy(shared).run([params]) as copied_stats:
+                    assert copied_stats is stats
+                    assert stats.get_stats("foo").concurrent == 1
+
+            # The query is still running until the shared limits are exited.
+            with pytest.raises(RateLimitExceeded):
+                with RateLimitAggregator([params]):
+                    pass
+
+        with RateLimitAggregator([params]) as stats:
+            assert stats.get_stats("foo").concurrent == 1
+
     def test_rate_limit_container(self):
         rate_limit_container = RateLimitStatsContainer()
         rate_limit_stats = RateLimitStats(rate=0.5, concurrent=2)
@@ -124,6 +169,32 @@ class TestRateLimit(BaseTest):
 
         assert rate_limit_container.to_dict() == {"foo_rate": 0.5, "foo_concurrent": 2}
 
+    def test_rate_limit_container_aggregation(self):
+        for aggregation, expected in [
+            (max_rate_limit_stats, RateLimitStats(rate=1.5, concurrent=3)),
+            (sum_rate_limit_stats, RateLimitStats(rate=2.0, concurrent=4)),
+        ]:
+            rate_limit_container = RateLimitStatsContainer(aggregation)
+            rate_limit_container.add_stats(
+                "foo", RateLimitStats(rate=0.5, concurrent=3)
+            )
+            rate_limit_container.add_stats(
+                "foo", RateLimitStats(rate=1.5, concurrent=1)
+            )
+            assert rate_limit_container.get_stats("foo") == expected
+
+    def test_aggregator_stats_aggregation(self):
+        buckets = [uuid.uuid4().hex, uuid.uuid4().hex]
+        params = [RateLimitParameters("project", bucket, None, 5) for bucket in buckets]
+
+        with RateLimitAggregator(params[:1]):
+            with RateLimitAggregator(params) as stats:
+                assert stats.get_stats("project").concurrent == 2
+
+            state.set_config("rate_limit_stats_aggregation", "sum")
+            with RateLimitAggregator(params) as stats:
+                assert stats.get_stats("project").concurrent == 3
+
     def test_bypass_rate_limit(self):
         rate_limit_params = RateLimitParameters("foo", "bar", None, None)
         state.set_config("bypass_rate_limit", 1)
@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Event
+import time
+import uuid
+
+import pytest
+
+from snuba.redis import redis_client
+from snuba.state.cache import RedisCache
+from snuba.state.single_flight import SingleFlight
+from snuba.utils.codecs import JSONCodec
+
+
+cache: RedisCache[int] = RedisCache(
+    redis_client, "test-single-flight:cache:", JSONCodec()
+)
+
+
+def build_single_flight() -> SingleFlight[int]:
+    return SingleFlight(redis_client, "test-single-flight:", cache, timeout=5)
+
+
+def wait_for_subscribers(key: str, count: int) -> None:
+    channel = f"test-single-flight:result:{key}"
+    deadline = time.time() + 5
+    while redis_client.execute_command("PUBSUB", "NUMSUB", channel)[1] < count:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_single_flight_shares_result() -> None:
+    single_flight = build_single_flight()
+    key = uuid.uuid4().hex
+    started = Event()
+    proceed = Event()
+    calls = []
+
+    def function() -> int:
+        calls.append(None)
+        started.set()
+        proceed.wait(5)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(single_flight.execute, key, function)
+        assert started.wait(5)
+        followers = [
+            executor.submit(single_flight.execute, key, function) for _ in range(2)
+        ]
+        proceed.set()
+
+        assert leader.result() == (1, False)
+        assert [f.result() for f in followers] == [(1, True), (1, True)]
+
+    assert len(calls) == 1
+
+
+def test_single_flight_across_instances() -> None:
+    key = uuid.uuid4().hex
+    leader_flight = build_single_flight()
+    follower_flight = build_single_flight()
+    started = Event()
+    proceed = Event()
+
+    def lead() -> int:
+        started.set()
+        proceed.wait(5)
+        cache.set(key, 1)
+        return 1
+
+    def follow() -> int:
+        raise AssertionError("should not be executed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(leader_flight.execute, key, lead)
+        assert started.wait(5)
+        follower = executor.submit(follower_flight.execute, key, follow)
+
+        # Wait for the follower to subscribe before allowing the leader to
+        # finish, otherwise the follower would become a leader itself.
+        wait_for_subscribers(key, 1)
+        proceed.set()
+
+        assert leader.result() == (1, False)
+        assert follower.result() == (1, True)
+
+
+def test_single_flight_leader_failure() -> None:
+    single_flight = build_single_flight()
+    key = uuid.uuid4().hex
+
+    def fail() -> int:
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        single_flight.execute(key, fail)
+
+    # The lock is released after a failure.
+    assert single_flight.execute(key, lambda: 2) == (2, False)
+
+
+def test_single_flight_takeover() -> None:
+    key = uuid.uuid4().hex
+    started = Event()
+    proceed = Event()
+    calls = []
+
+    def fail() -> int:
+        started.set()
+        proceed.wait(5)
+        raise ValueError("failed")
+
+    def function() -> int:
+        value = cache.get(key)
+        if value is None:
+            calls.append(None)
+            value = 2
+            cache.set(key, value)
+        return value
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(build_single_flight().execute, key, fail)
+        assert started.wait(5)
+        followers = [
+            executor.submit(build_single_flight().execute, key, function)
+            for _ in range(2)
+        ]
+        wait_for_subscribers(key, 2)
+        proceed.set()
+
+        with pytest.raises(ValueError):
+            leader.result()
+
+        assert [f.result()[0] for f in followers] == [2, 2]
+
+    # Only one of the followers executed the function after the leader failed.
+    assert len(calls) == 1
+
+
+def test_single_flight_slow_leader() -> None:
+    single_flight = SingleFlight(redis_client, "test-single-flight:", cache, timeout=1)
+    key = uuid.uuid4().hex
+    started = Event()
+    proceed = Event()
+    calls = []
+
+    def function() -> int:
+        calls.append(None)
+        started.set()
+        proceed.wait(5)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.execute, key, function)
+        assert started.wait(5)
+
+        # The follower gives up waiting rather than executing the function
+        # while the leader is still running it.
+        with pytest.raises(TimeoutError):
+            single_flight.execute(key, function)
+
+        proceed.set()
+        assert leader.result() == (1, False)
+
+    assert len(calls) == 1
@@ -1,4 +1,5 @@
 from collections import ChainMap
+import copy
 from tests.base import BaseEventsTest
 from functools import partial
 import random
@@ -123,3 +124,30 @@ def test_safe_dumps():
     assert safe_dumps(ChainMap({"a": 1}, {"b": 2}), sort_keys=True,) == safe_dumps(
         {"a": 1, "b": 2}, sort_keys=True,
     )
+
+
+def test_config_snapshot():
+    state.set_configs({"snapshot_value": 1, "snapshot_abtest": "1:1/2:1"})
+    try:
+        snapshot = state.get_config_snapshot()
+        state.set_config("snapshot_value", 2)
+
+        # The snapshot is not affected by changes made after it was taken,
+        # and A/B test values are only drawn once per snapshot.
+        assert snapshot.get_config("snapshot_value") == 1
+        assert snapshot.get_config("noexist", 3) == 3
+        draw = snapshot.get_config("snapshot_abtest")
+        assert draw in (1, 2)
+        assert all(snapshot.get_config("snapshot_abtest") == draw for _ in range(20))
+        assert snapshot.get_configs(
+            [("snapshot_value", None), ("snapshot_abtest", None)]
+        ) == [1, draw]
+        assert snapshot.get_all_configs()["snapshot_abtest"] == draw
+
+        # Copies of a snapshot (such as the copies made of requests) are the
+        # same snapshot, so they see the same draws.
+        assert copy.copy(snapshot) is snapshot
+        assert copy.deepcopy({"snapshot": snapshot})["snapshot"] is snapshot
+    finally:
+        state.delete_config("snapshot_value")
+        state.delete_config("snapshot_abtest")
@@ -0,0 +1,139 @@
+import os
+import signal
+import time
+import uuid
+from threading import Event, Thread
+from typing import Callable, Optional
+
+from snuba.redis import redis_client
+from snuba.state.subscriber import VersionedValueSubscriber
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def build_subscriber(
+    prefix: str, reconciliation_interval: float = 60.0
+) -> VersionedValueSubscriber[Optional[bytes]]:
+    return VersionedValueSubscriber(
+        redis_client,
+        f"{prefix}channel",
+        f"{prefix}version",
+        lambda: redis_client.get(f"{prefix}value"),
+        reconciliation_interval,
+    )
+
+
+def test_subscriber_notification() -> None:
+    prefix = f"test-subscriber:{uuid.uuid4().hex}:"
+    redis_client.set(f"{prefix}value", b"1")
+
+    reader = build_subscriber(prefix)
+    writer = build_subscriber(prefix)
+
+    assert reader.get() == b"1"
+
+    # Changes are not visible until the writer notifies the subscribers.
+    redis_client.set(f"{prefix}value", b"2")
+    assert reader.get() == b"1"
+
+    writer.notify()
+    assert wait_for(lambda: reader.get() == b"2")
+
+
+def test_subscriber_notifier_sees_own_change() -> None:
+    prefix = f"test-subscriber:{uuid.uuid4().hex}:"
+    subscriber = build_subscriber(prefix)
+
+    assert subscriber.get() is None
+
+    redis_client.set(f"{prefix}value", b"1")
+    subscriber.notify()
+    assert subscriber.get() == b"1"
+
+
+def test_subscriber_reconciliation() -> None:
+    prefix = f"test-subscriber:{uuid.uuid4().hex}:"
+    redis_client.set(f"{prefix}value", b"1")
+
+    subscriber = build_subscriber(prefix, reconciliation_interval=0.1)
+    assert subscriber.get() == b"1"
+
+    # A change to the value without a change to the version is not noticed.
+    redis_client.set(f"{prefix}value", b"2")
+    time.sleep(0.3)
+    assert subscriber.get() == b"1"
+
+    # A change to the version without a notification is noticed once the
+    # reconciliation interval has passed.
+    redis_client.incr(f"{prefix}version")
+    assert wait_for(lambda: subscriber.get() == b"2")
+
+
+def test_subscriber_get_nowait() -> None:
+    prefix = f"test-subscriber:{uuid.uuid4().hex}:"
+    loading = Event()
+
+    def load() -> bytes:
+        loading.wait()
+        return b"1"
+
+    subscriber = VersionedValueSubscriber(
+        redis_client, f"{prefix}channel", f"{prefix}version", load
+    )
+
+    # The value is loaded by the subscriber thread rather than the caller.
+    assert subscriber.get_nowait() is None
+    loading.set()
+    assert wait_for(lambda: subscriber.get_nowait() == b"1")
+
+
+def test_subscriber_fork_while_loading() -> None:
+    prefix = f"test-subscriber:{uuid.uuid4().hex}:"
+    parent_pid = os.getpid()
+    loading = Event()
+    release = Event()
+
+    def load() -> bytes:
+        if os.getpid() == parent_pid:
+            loading.set()
+            release.wait()
+        return b"1"
+
+    subscriber = VersionedValueSubscriber(
+        redis_client, f"{prefix}channel", f"{prefix}version", load
+    )
+
+    thread = Thread(target=subscriber.get)
+    thread.start()
+    try:
+        assert loading.wait(5)
+
+        # The child is forked while the value is being loaded by another
+        # thread in the parent, and must still be able to load it.
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if subscriber.get() == b"1" else 1)
+
+        deadline = time.time() + 5
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if time.time() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                raise AssertionError("child process did not finish")
+            time.sleep(0.01)
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    finally:
+        release.set()
+        thread.join()
+
+    assert subscriber.get() == b"1"
@@ -0,0 +1,33 @@
+import pytest
+
+from snuba.benchmark import PAYLOAD_GENERATORS, run_storage_benchmark
+
+
+@pytest.mark.parametrize("storage_name", sorted(PAYLOAD_GENERATORS))
+def test_run_storage_benchmark(storage_name: str) -> None:
+    results = run_storage_benchmark(storage_name, messages=10, repeat=1)
+
+    phases = {(result.phase, result.variant): result for result in results}
+    [decode] = [result for result in results if result.phase == "decode"]
+    [process] = [result for result in results if result.phase == "process"]
+    assert decode.messages == process.messages == 10
+
+    # Every generated message is valid, and results in at least one row.
+    assert process.rows >= 10
+
+    write = phases[("write", "JSONEachRow")]
+    assert write.rows == process.rows
+    assert write.bytes > 0
+    assert all(result.peak_memory_bytes for result in results)
+
+
+def test_run_storage_benchmark_is_reproducible() -> None:
+    def get_sizes():
+        return [
+            (result.phase, result.variant, result.rows, result.bytes)
+            for result in run_storage_benchmark(
+                "events", messages=5, repeat=1, trace_allocations=False
+            )
+        ]
+
+    assert get_sizes() == get_sizes()
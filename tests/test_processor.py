@@ -4,3 +4,11 @@ from snuba.processor import _unicodify
 def test_unicodify():
     # invalid utf-8 surrogate should be replaced with escape sequence
     assert _unicodify("\ud83c").encode("utf8") == b"\\ud83c"
+
+
+def test_unicodify_values():
+    assert _unicodify(None) is None
+    assert _unicodify("ascii") == "ascii"
+    assert _unicodify("café") == "café"
+    assert _unicodify(1) == "1"
+    assert _unicodify({"a": 1}) == '{"a": 1}'
@@ -0,0 +1,45 @@
+import re
+
+from snuba.reader import build_result_transformer, get_row_count, pivot_result
+
+
+transform = build_result_transformer([(re.compile(r"^UInt8$"), lambda v: v * 2)])
+
+
+def test_transform_row_result() -> None:
+    result = {
+        "meta": [{"name": "a", "type": "UInt8"}, {"name": "b", "type": "String"}],
+        "data": [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}],
+        "totals": {"a": 3, "b": ""},
+    }
+    transform(result)
+    assert result["data"] == [{"a": 2, "b": "x"}, {"a": 4, "b": "y"}]
+    assert result["totals"] == {"a": 6, "b": ""}
+    assert get_row_count(result) == 2
+    assert pivot_result(result) is result
+
+
+def test_transform_columnar_result() -> None:
+    result = {
+        "meta": [
+            {"name": "a", "type": "Nullable(UInt8)"},
+            {"name": "b", "type": "String"},
+        ],
+        "columns": [(1, None), ("x", "y")],
+        "totals": {"a": 3, "b": ""},
+    }
+    transform(result)
+    assert result["columns"] == [[2, None], ("x", "y")]
+    assert result["totals"] == {"a": 6, "b": ""}
+    assert get_row_count(result) == 2
+    assert pivot_result(result) == {
+        "meta": result["meta"],
+        "data": [{"a": 2, "b": "x"}, {"a": None, "b": "y"}],
+        "totals": {"a": 6, "b": ""},
+    }
+
+
+def test_empty_columnar_result() -> None:
+    result = {"meta": [], "columns": []}
+    assert get_row_count(result) == 0
+    assert pivot_result(result) == {"meta": [], "data": []}
@@ -4,7 +4,7 @@ from datetime import datetime
 from functools import partial
 import simplejson as json
 
-from snuba import replacer
+from snuba import replacer, state
 from snuba.clickhouse import DATETIME_FORMAT
 from snuba.datasets.errors_replacer import FLATTENED_COLUMN_TEMPLATE, ReplacerState
 from snuba.datasets import errors_replacer
@@ -485,32 +485,32 @@ class TestReplacer(BaseEventsTest):
         project_ids = [1, 2]
 
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.ERRORS
+            project_ids, ReplacerState.ERRORS, state.get_config_snapshot()
         ) == (False, [],)
 
         errors_replacer.set_project_needs_final(100, ReplacerState.ERRORS)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.ERRORS
+            project_ids, ReplacerState.ERRORS, state.get_config_snapshot()
         ) == (False, [],)
 
         errors_replacer.set_project_needs_final(1, ReplacerState.ERRORS)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.ERRORS
+            project_ids, ReplacerState.ERRORS, state.get_config_snapshot()
         ) == (True, [],)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.EVENTS
+            project_ids, ReplacerState.EVENTS, state.get_config_snapshot()
         ) == (False, [],)
 
         errors_replacer.set_project_needs_final(2, ReplacerState.ERRORS)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.ERRORS
+            project_ids, ReplacerState.ERRORS, state.get_config_snapshot()
         ) == (True, [],)
 
         errors_replacer.set_project_exclude_groups(1, [1, 2], ReplacerState.ERRORS)
         errors_replacer.set_project_exclude_groups(2, [3, 4], ReplacerState.ERRORS)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.ERRORS
+            project_ids, ReplacerState.ERRORS, state.get_config_snapshot()
         ) == (True, [1, 2, 3, 4],)
         assert errors_replacer.get_projects_query_flags(
-            project_ids, ReplacerState.EVENTS
+            project_ids, ReplacerState.EVENTS, state.get_config_snapshot()
         ) == (False, [],)
@@ -1,4 +1,7 @@
 import pytest
+from datetime import datetime
+from threading import Barrier
+import time
 import uuid
 
 from typing import Any, Mapping
@@ -11,6 +14,7 @@ from snuba.request import Request
 from snuba.request.request_settings import HTTPRequestSettings
 from snuba.utils.metrics.timer import Timer
 from snuba.web import RawQueryResult
+from snuba.web import split
 from snuba.web.split import split_query
 
 
@@ -136,3 +140,324 @@ def test_col_split(
     )
 
     do_query(events, request, None)
+
+
+@pytest.mark.parametrize("split_parallelism", [1, 3])
+def test_time_split(split_parallelism: int) -> None:
+    state.set_config("split_step", 3600)
+    state.set_config("split_parallelism", split_parallelism)
+
+    # One row per hour between 06:00 and 10:00, returned newest first.
+    rows = [
+        {"event_id": str(hour), "project_id": 1, "timestamp": f"{hour:02}:00"}
+        for hour in range(9, 5, -1)
+    ]
+
+    windows = []
+
+    @split_query
+    def do_query(dataset: Dataset, request: Request, timer: Timer):
+        from_date = datetime.fromisoformat(
+            request.extensions["timeseries"]["from_date"]
+        )
+        to_date = datetime.fromisoformat(request.extensions["timeseries"]["to_date"])
+        windows.append((from_date, to_date))
+        assert request.query.get_offset() == 0
+        return RawQueryResult(
+            {
+                "data": [
+                    row
+                    for row in rows
+                    if from_date.hour <= int(row["event_id"]) < to_date.hour
+                ][: request.query.get_limit()]
+            },
+            {},
+        )
+
+    events = get_dataset("events")
+    query = Query(
+        {
+            "selected_columns": ["event_id", "project_id", "timestamp"],
+            "conditions": [],
+            "orderby": "-timestamp",
+            "limit": 2,
+            "offset": 1,
+        },
+        events.get_all_storages()[0]
+        .get_schemas()
+        .get_read_schema()
+        .get_data_source(),
+    )
+
+    request = Request(
+        uuid.uuid4().hex,
+        query,
+        HTTPRequestSettings(),
+        {
+            "project": {"project": 1},
+            "timeseries": {
+                "from_date": "2019-09-19T00:00:00",
+                "to_date": "2019-09-19T10:00:00",
+                "granularity": 3600,
+            },
+        },
+        "tests",
+    )
+
+    try:
+        result = do_query(events, request, None)
+    finally:
+        state.delete_config("split_step")
+        state.delete_config("split_parallelism")
+
+    assert [row["event_id"] for row in result.result["data"]] == ["8", "7"]
+    assert windows[0] == (datetime(2019, 9, 19, 9), datetime(2019, 9, 19, 10))
+
+
+def test_time_split_density() -> None:
+    state.set_config("use_split_density", 1)
+
+    windows = []
+
+    @split_query
+    def do_query(dataset: Dataset, request: Request, timer: Timer):
+        windows.append(
+            (
+                request.extensions["timeseries"]["from_date"],
+                request.extensions["timeseries"]["to_date"],
+            )
+        )
+        return RawQueryResult({"data": [{"event_id": "a"}] * 3}, {})
+
+    events = get_dataset("events")
+    query = Query(
+        {
+            "selected_columns": ["event_id", "project_id", "timestamp"],
+            "conditions": [],
+            "orderby": "-timestamp",
+            "limit": 2,
+            "offset": 1,
+        },
+        events.get_all_storages()[0]
+        .get_schemas()
+        .get_read_schema()
+        .get_data_source(),
+    )
+
+    project_id = uuid.uuid4().int % 1000000
+    request = Request(
+        uuid.uuid4().hex,
+        query,
+        HTTPRequestSettings(),
+        {
+            "project": {"project": project_id},
+            "timeseries": {
+                "from_date": "2019-09-19T00:00:00",
+                "to_date": "2019-09-19T10:00:00",
+                "granularity": 3600,
+            },
+        },
+        "tests",
+    )
+
+    # One row every hour means the 3 rows required (with 50% margin) should
+    # be found within the last 4.5 hours.
+    split.density.observe(f"events:{project_id}", 2, 7200)
+
+    try:
+        do_query(events, request, None)
+    finally:
+        state.delete_config("use_split_density")
+
+    assert windows == [("2019-09-19T05:30:00", "2019-09-19T10:00:00")]
+
+
+def test_time_split_sparse_density() -> None:
+    state.set_config("use_split_density", 1)
+
+    windows = []
+
+    @split_query
+    def do_query(dataset: Dataset, request: Request, timer: Timer):
+        windows.append(
+            (
+                request.extensions["timeseries"]["from_date"],
+                request.extensions["timeseries"]["to_date"],
+            )
+        )
+        return RawQueryResult({"data": []}, {})
+
+    events = get_dataset("events")
+    query = Query(
+        {
+            "selected_columns": ["event_id", "project_id", "timestamp"],
+            "conditions": [],
+            "orderby": "-timestamp",
+            "limit": 2,
+            "offset": 1,
+        },
+        events.get_all_storages()[0]
+        .get_schemas()
+        .get_read_schema()
+        .get_data_source(),
+    )
+
+    project_id = uuid.uuid4().int % 1000000
+    request = Request(
+        uuid.uuid4().hex,
+        query,
+        HTTPRequestSettings(),
+        {
+            "project": {"project": project_id},
+            "timeseries": {
+                "from_date": "2019-09-19T00:00:00",
+                "to_date": "2019-09-19T10:00:00",
+                "granularity": 3600,
+            },
+        },
+        "tests",
+    )
+
+    # The step required by such a low rate would reach past year 1.
+    split.density.observe(f"events:{project_id}", 1, 10 ** 12)
+
+    try:
+        do_query(events, request, None)
+    finally:
+        state.delete_config("use_split_density")
+
+    assert windows == [("2019-09-19T00:00:00", "2019-09-19T10:00:00")]
+
+
+def test_parallel_time_split_timers_and_rate_limits() -> None:
+    state.set_config("split_step", 3600)
+    state.set_config("split_parallelism", 3)
+
+    timers = []
+    shared_rate_limits = []
+
+    @split_query
+    def do_query(dataset: Dataset, request: Request, timer: Timer):
+        timer.mark("execute")
+        timers.append(timer)
+        shared_rate_limits.append(request.settings.get_shared_rate_limits())
+        return RawQueryResult({"data": []}, {})
+
+    events = get_dataset("events")
+    query = Query(
+        {
+            "selected_columns": ["event_id", "project_id", "timestamp"],
+            "conditions": [],
+            "orderby": "-timestamp",
+            "limit": 2,
+            "offset": 0,
+        },
+        events.get_all_storages()[0]
+        .get_schemas()
+        .get_read_schema()
+        .get_data_source(),
+    )
+
+    request = Request(
+        uuid.uuid4().hex,
+        query,
+        HTTPRequestSettings(),
+        {
+            "project": {"project": 1},
+            "timeseries": {
+                "from_date": "2019-09-19T00:00:00",
+                "to_date": "2019-09-19T10:00:00",
+                "granularity": 3600,
+            },
+        },
+        "tests",
+    )
+
+    timer = Timer("test")
+    try:
+        do_query(events, request, timer)
+    finally:
+        state.delete_config("split_step")
+        state.delete_config("split_parallelism")
+
+    # Every window is timed separately and then merged into the request timer.
+    assert len(timers) == 4
+    assert timer not in timers
+    assert timer.get_mark_durations().keys() == {"execute"}
+
+    # All of the windows share the rate limits of the request.
+    assert shared_rate_limits[0] is not None
+    assert all(shared is shared_rate_limits[0] for shared in shared_rate_limits)
+    assert request.settings.get_shared_rate_limits() is None
+
+
+def test_parallel_time_split_waits_for_windows() -> None:
+    state.set_config("split_step", 3600)
+    state.set_config("split_parallelism", 3)
+
+    windows = []
+    finished = []
+    started = Barrier(3, timeout=5)
+
+    @split_query
+    def do_query(dataset: Dataset, request: Request, timer: Timer):
+        window = (
+            request.extensions["timeseries"]["from_date"],
+            request.extensions["timeseries"]["to_date"],
+        )
+        windows.append(window)
+        started.wait()
+        if window[1] == "2019-09-19T10:00:00":
+            raise ValueError("first window failed")
+        time.sleep(0.1)
+        finished.append(window)
+        return RawQueryResult({"data": []}, {})
+
+    events = get_dataset("events")
+    query = Query(
+        {
+            "selected_columns": ["event_id", "project_id", "timestamp"],
+            "conditions": [],
+            "orderby": "-timestamp",
+            "limit": 2,
+            "offset": 0,
+        },
+        events.get_all_storages()[0]
+        .get_schemas()
+        .get_read_schema()
+        .get_data_source(),
+    )
+
+    request = Request(
+        uuid.uuid4().hex,
+        query,
+        HTTPRequestSettings(),
+        {
+            "project": {"project": 1},
+            "timeseries": {
+                "from_date": "2019-09-19T00:00:00",
+                "to_date": "2019-09-19T10:00:00",
+                "granularity": 3600,
+            },
+        },
+        "tests",
+    )
+
+    try:
+        with pytest.raises(ValueError):
+            do_query(events, request, None)
+    finally:
+        state.delete_config("split_step")
+        state.delete_config("split_parallelism")
+
+    # The windows queried at once all have the same size, and the windows
+    # that were already running when the first one failed have finished.
+    assert sorted(windows, reverse=True) == [
+        ("2019-09-19T09:00:00", "2019-09-19T10:00:00"),
+        ("2019-09-19T08:00:00", "2019-09-19T09:00:00"),
+        ("2019-09-19T07:00:00", "2019-09-19T08:00:00"),
+    ]
+    assert sorted(finished, reverse=True) == [
+        ("2019-09-19T08:00:00", "2019-09-19T09:00:00"),
+        ("2019-09-19T07:00:00", "2019-09-19T08:00:00"),
+    ]
@@ -5,6 +5,7 @@ import pytest
 from tests.base import BaseTest
 
 from snuba.clickhouse.escaping import escape_identifier, escape_alias
+from snuba.clickhouse.query import ExternalTable
 from snuba.datasets.factory import get_dataset
 from snuba import state
 from snuba.query.columns import (
@@ -37,6 +38,10 @@ class TestUtil(BaseTest):
             escape_literal([1, "a", date(2001, 1, 1)])
             == "(1, 'a', toDate('2001-01-01'))"
         )
+        assert (
+            escape_literal(ExternalTable("groups", [("group_id", "UInt64")], []))
+            == "groups"
+        )
 
     def test_escape_identifier(self):
         assert escape_identifier(None) is None
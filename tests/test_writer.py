@@ -1,3 +1,6 @@
+import gzip
+import zlib
+
 import pytest
 
 from typing import Iterable
@@ -58,3 +61,59 @@ class TestHTTPBatchWriter(BaseEventsTest):
         chunks = writer.chunk(input)
         for chunk, expected in zip(chunks, expected_chunks):
             assert chunk == expected
+
+
+@pytest.mark.parametrize(
+    "chunk_size, chunk_bytes, input, expected_chunks",
+    [
+        (0, 2, [b"a", b"b", b"c"], [b"ab", b"c"]),
+        (0, 2, [b"abc", b"d", b"e"], [b"abc", b"de"]),
+        (2, 10, [b"a", b"b", b"c"], [b"ab", b"c"]),
+        (10, 2, [b"a", b"b", b"c"], [b"ab", b"c"]),
+    ],
+)
+def test_chunk_bytes(chunk_size, chunk_bytes, input, expected_chunks) -> None:
+    writer = FakeHTTPWriter(
+        None,
+        settings.CLICKHOUSE_HOST,
+        settings.CLICKHOUSE_HTTP_PORT,
+        lambda a: a,
+        None,
+        "mysterious_inexistent_table",
+        chunk_size,
+        chunk_bytes=chunk_bytes,
+    )
+    assert list(writer.chunk(input)) == expected_chunks
+
+
+@pytest.mark.parametrize(
+    "compression, decompress",
+    [("gzip", gzip.decompress), ("deflate", zlib.decompress)],
+)
+def test_compression(compression, decompress) -> None:
+    writer = FakeHTTPWriter(
+        None,
+        settings.CLICKHOUSE_HOST,
+        settings.CLICKHOUSE_HTTP_PORT,
+        lambda a: a,
+        None,
+        "mysterious_inexistent_table",
+        1,
+        compression=compression,
+    )
+    input = [b'{"x": %d}\n' % i for i in range(1000)]
+    chunks = list(writer._compress_chunks(writer.chunk(input)))
+    assert all(chunks)
+    assert decompress(b"".join(chunks)) == b"".join(input)
+
+
+def test_unsupported_compression() -> None:
+    with pytest.raises(ValueError):
+        HTTPBatchWriter(
+            None,
+            settings.CLICKHOUSE_HOST,
+            settings.CLICKHOUSE_HTTP_PORT,
+            lambda a: a,
+            table_name="mysterious_inexistent_table",
+            compression="lz4",
+        )
@@ -30,6 +30,46 @@ def test_timer() -> None:
     }
 
 
+def test_timer_mark_durations() -> None:
+    time = TestingClock()
+
+    t = Timer("timer", clock=time)
+    time.sleep(0.0001)
+    t.mark("thing1")
+    time.sleep(0.0002)
+    t.mark("thing2")
+    time.sleep(0.0003)
+    t.mark("thing1")
+
+    # The durations are not truncated to whole milliseconds.
+    assert t.finish()["marks_ms"] == {"thing1": 0, "thing2": 0}
+    durations = t.get_mark_durations()
+    assert durations.keys() == {"thing1", "thing2"}
+    assert abs(durations["thing1"] - 0.0004) < 1e-9
+    assert abs(durations["thing2"] - 0.0002) < 1e-9
+
+
+def test_timer_merge() -> None:
+    time = TestingClock()
+
+    t = Timer("timer", clock=time)
+    other = Timer("other", clock=time)
+    time.sleep(10.0)
+    other.mark("thing1")
+    time.sleep(10.0)
+    t.mark("thing1")
+    time.sleep(10.0)
+    other.mark("thing2")
+
+    t.merge(other)
+    assert t.finish() == {
+        "timestamp": 0.0,
+        "duration_ms": 30.0 * 1000,
+        "marks_ms": {"thing1": (20.0 + 10.0) * 1000, "thing2": 20.0 * 1000},
+    }
+    assert t.get_mark_durations() == {"thing1": 30.0, "thing2": 20.0}
+
+
 def test_timer_send_metrics() -> None:
     backend = TestingMetricsBackend()
 
@@ -1,22 +1,32 @@
 import time
 from datetime import datetime
+from threading import Event
 from typing import (
     Any,
+    Mapping,
     MutableSequence,
+    Optional,
     Sequence,
 )
 from unittest.mock import patch
 
+import pytest
+
 from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
-from snuba.utils.streams.batching import AbstractBatchWorker, BatchingConsumer
+from snuba.utils.streams.batching import (
+    AbstractBatchWorker,
+    BatchingConsumer,
+    ProcessingPool,
+)
 from snuba.utils.streams.dummy import DummyBroker, DummyConsumer, DummyProducer
-from snuba.utils.streams.types import Message, Topic
+from snuba.utils.streams.types import Message, Partition, Topic
 
 
 class FakeWorker(AbstractBatchWorker[int, int]):
     def __init__(self) -> None:
         self.processed: MutableSequence[int] = []
         self.flushed: MutableSequence[Sequence[int]] = []
+        self.closed = False
 
     def process_message(self, message: Message[int]) -> int:
         self.processed.append(message.payload)
@@ -25,6 +35,28 @@ class FakeWorker(AbstractBatchWorker[int, int]):
     def flush_batch(self, batch: Sequence[int]) -> None:
         self.flushed.append(batch)
 
+    def close(self) -> None:
+        self.closed = True
+
+
+class SquaringWorker(FakeWorker):
+    def process_message(self, message: Message[int]) -> Optional[int]:
+        # Odd messages are dropped, to ensure that they are not included in
+        # the batch when they are processed in a subprocess.
+        if message.payload % 2:
+            return None
+        return message.payload ** 2
+
+
+class BlockingWorker(FakeWorker):
+    def __init__(self) -> None:
+        super().__init__()
+        self.proceed = Event()
+
+    def flush_batch(self, batch: Sequence[int]) -> None:
+        assert self.proceed.wait(5)
+        super().flush_batch(batch)
+
 
 class TestConsumer(object):
     def test_batch_size(self) -> None:
@@ -54,6 +86,7 @@ class TestConsumer(object):
 
         assert worker.processed == [1, 2, 3]
         assert worker.flushed == [[1, 2]]
+        assert worker.closed
         assert consumer.commit_offsets_calls == 1
         assert consumer.close_calls == 1
 
@@ -106,3 +139,125 @@ class TestConsumer(object):
         assert worker.flushed == [[1, 2, 3, 4, 5, 6]]
         assert consumer.commit_offsets_calls == 1
         assert consumer.close_calls == 1
+
+    def test_processing_pool(self) -> None:
+        topic = Topic("topic")
+        broker: DummyBroker[int] = DummyBroker()
+        broker.create_topic(topic, partitions=1)
+        producer: DummyProducer[int] = DummyProducer(broker)
+        for i in range(10):
+            producer.produce(topic, i).result()
+
+        consumer: DummyConsumer[int] = DummyConsumer(broker, "group")
+
+        worker = SquaringWorker()
+        batching_consumer = BatchingConsumer(
+            consumer,
+            topic,
+            worker=worker,
+            max_batch_size=8,
+            max_batch_time=100,
+            metrics=DummyMetricsBackend(strict=True),
+            processing_pool=ProcessingPool(SquaringWorker, processes=2, chunk_size=3),
+        )
+
+        for _ in range(10):
+            batching_consumer._run_once()
+
+        batching_consumer._shutdown()
+
+        # Messages are processed in the pool (not by the worker in this
+        # process), and their results are flushed in order.
+        assert worker.processed == []
+        assert worker.flushed == [[0, 4, 16, 36]]
+        assert consumer.commit_offsets_calls == 1
+        assert consumer.close_calls == 1
+
+    def test_in_flight_batches(self) -> None:
+        topic = Topic("topic")
+        partition = Partition(topic, 0)
+        broker: DummyBroker[int] = DummyBroker()
+        broker.create_topic(topic, partitions=1)
+        producer: DummyProducer[int] = DummyProducer(broker)
+        for i in range(6):
+            producer.produce(topic, i).result()
+
+        consumer: DummyConsumer[int] = DummyConsumer(broker, "group")
+
+        commits: MutableSequence[Mapping[Partition, int]] = []
+        commit_offsets = consumer.commit_offsets
+
+        def record_commit_offsets() -> Mapping[Partition, int]:
+            offsets = commit_offsets()
+            commits.append(offsets)
+            return offsets
+
+        consumer.commit_offsets = record_commit_offsets  # type: ignore
+
+        worker = BlockingWorker()
+        batching_consumer = BatchingConsumer(
+            consumer,
+            topic,
+            worker=worker,
+            max_batch_size=2,
+            max_batch_time=100,
+            metrics=DummyMetricsBackend(strict=True),
+            max_in_flight_batches=1,
+        )
+
+        # The first batch is flushed in the background while the next batch
+        # is consumed. Once that batch is full, consumption is paused since
+        # the first batch has not been written yet.
+        for _ in range(5):
+            batching_consumer._run_once()
+
+        assert worker.processed == [0, 1, 2, 3]
+        assert consumer.paused() == [partition]
+        assert commits == []
+
+        # Once the first batch has been written its offsets are committed
+        # and consumption is resumed. Each batch only commits its own offsets.
+        worker.proceed.set()
+        batching_consumer._flush(force=True)
+
+        assert worker.flushed == [[0, 1], [2, 3]]
+        assert commits == [{partition: 2}, {partition: 4}]
+        assert consumer.paused() == []
+
+        batching_consumer._shutdown()
+        assert consumer.close_calls == 1
+
+    def test_shutdown_after_failed_write(self) -> None:
+        topic = Topic("topic")
+        broker: DummyBroker[int] = DummyBroker()
+        broker.create_topic(topic, partitions=1)
+        producer: DummyProducer[int] = DummyProducer(broker)
+        for i in range(2):
+            producer.produce(topic, i).result()
+
+        consumer: DummyConsumer[int] = DummyConsumer(broker, "group")
+
+        class FailingWorker(FakeWorker):
+            def flush_batch(self, batch: Sequence[int]) -> None:
+                raise ValueError("write failed")
+
+        worker = FailingWorker()
+        batching_consumer = BatchingConsumer(
+            consumer,
+            topic,
+            worker=worker,
+            max_batch_size=2,
+            max_batch_time=100,
+            metrics=DummyMetricsBackend(strict=True),
+            max_in_flight_batches=1,
+        )
+
+        # The batch is full after two messages, and is flushed on the next run.
+        for _ in range(3):
+            batching_consumer._run_once()
+
+        # The consumer is still closed when the in-flight write fails.
+        with pytest.raises(ValueError):
+            batching_consumer._shutdown()
+        assert worker.closed
+        assert consumer.close_calls == 1
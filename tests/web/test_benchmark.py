@@ -0,0 +1,82 @@
+from snuba.web.benchmark import (
+    RecordedQuery,
+    StubReader,
+    run_query,
+    run_query_benchmark,
+)
+
+QUERIES = [
+    RecordedQuery(
+        "events",
+        {
+            "selected_columns": ["event_id", "title"],
+            "conditions": [["type", "=", "error"]],
+            "project": [1],
+            "limit": 100,
+        },
+        "search",
+    ),
+    RecordedQuery(
+        "events",
+        {
+            "aggregations": [["count()", "", "count"]],
+            "groupby": ["project_id"],
+            "project": [1],
+        },
+        "tagstore",
+    ),
+    RecordedQuery(
+        "transactions",
+        {"selected_columns": ["transaction_name"], "project": [1]},
+        "api.discover",
+    ),
+]
+
+
+def test_from_querylog() -> None:
+    assert RecordedQuery.from_querylog(
+        {
+            "request": {"id": "a" * 32, "body": {"project": [1]}, "referrer": None},
+            "dataset": "events",
+            "status": "success",
+        }
+    ) == RecordedQuery("events", {"project": [1]}, "benchmark")
+
+
+def test_run_query() -> None:
+    reader = StubReader()
+    timer = run_query(QUERIES[0], reader)
+
+    [sql] = reader.queries
+    assert sql.startswith("SELECT event_id, title FROM")
+    assert {
+        "validate_schema",
+        "process_query",
+        "prepare_query",
+        "format_query",
+        "execute",
+    } <= timer.get_mark_durations().keys()
+
+    # The recorded body is not modified by running it.
+    assert "from_date" not in QUERIES[0].body
+
+
+def test_run_query_benchmark() -> None:
+    invalid = RecordedQuery("events", {"selected_columns": ["event_id"]}, "search")
+    results = run_query_benchmark([*QUERIES, invalid], repeat=2)
+
+    assert [result.dataset for result in results] == [
+        "events",
+        "events",
+        "transactions",
+        "events",
+    ]
+    for result in results[:-1]:
+        assert result.error is None
+        assert result.sql is not None
+        assert result.peak_memory_bytes
+        assert result.cpu_time_ms >= sum(result.stages_ms.values()) * 0.99
+
+    [failure] = results[-1:]
+    assert failure.error is not None and failure.error.startswith("BadRequest")
+    assert failure.sql is None
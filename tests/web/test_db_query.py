@@ -0,0 +1,11 @@
+from snuba.web.db_query import estimate_result_size
+
+
+def test_estimate_result_size() -> None:
+    meta = [{"name": "a", "type": "UInt8"}, {"name": "b", "type": "String"}]
+    assert estimate_result_size({"meta": meta, "data": [{}, {}, {}]}) == 6
+    assert estimate_result_size({"meta": meta, "columns": [[1, 2], [3, 4]]}) == 4
+
+    # Empty results still take up space in the cache.
+    assert estimate_result_size({"meta": meta, "data": []}) == 2
+    assert estimate_result_size({"meta": [], "data": []}) == 1
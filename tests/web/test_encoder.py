@@ -0,0 +1,45 @@
+import simplejson as json
+
+from snuba.web.encoder import stream_result
+
+
+META = [
+    {"name": "count", "type": "UInt64"},
+    {"name": "avg", "type": "Nullable(Float64)"},
+    {"name": "tags", "type": "Array(String)"},
+]
+
+
+def test_stream_row_result() -> None:
+    payload = {
+        "meta": META,
+        "data": [
+            {"count": 1, "avg": 1.5, "tags": ["a"]},
+            {"count": 2, "avg": None, "tags": []},
+            {"count": 3, "avg": float("nan"), "tags": [" "]},
+        ],
+        "totals": {"count": 6, "avg": 0.5, "tags": []},
+        "timing": {"duration_ms": 1},
+    }
+    chunks = list(stream_result(payload, 2))
+    assert len(chunks) == 7
+    assert json.loads("".join(chunks)) == json.loads(json.dumps(payload))
+
+
+def test_stream_columnar_result() -> None:
+    payload = {
+        "meta": META,
+        "columns": [(1, 2), (1.5, None), (["a"], [])],
+    }
+    assert json.loads("".join(stream_result(payload, 1000))) == {
+        "meta": META,
+        "data": [
+            {"count": 1, "avg": 1.5, "tags": ["a"]},
+            {"count": 2, "avg": None, "tags": []},
+        ],
+    }
+
+
+def test_stream_error() -> None:
+    payload = {"error": {"type": "clickhouse", "message": "failed"}}
+    assert list(stream_result(payload, 1000)) == [json.dumps(payload)]